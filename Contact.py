@@ -1,15 +1,35 @@
-from difflib import SequenceMatcher
+import codecs
+import mmap
+import re
+from binascii import a2b_qp
+from hashlib import blake2b
+from collections import deque
+from contextlib import nullcontext
+from io import BytesIO
+from itertools import repeat
 from pathlib import Path
-from quopri import encodestring
-from unidecode import unidecode
 
-try:
-    import vobject
-except ImportError:
-    raise Exception('... cannot work with vcf_location contacts, please install vobject')
+from contact_store import ContactStore
+from phones import DEFAULT_COUNTRY, PhoneIndex
 
+# vobject, unidecode, concurrent.futures, dedupe, search_index and vcf_writer are imported by the features
+# needing them, so that the command line and scripts spawned per file start fast (tests/test_startup.py)
 
-def parse_vcard(vcard: vobject) -> dict:
+NO_PHASE = nullcontext()  # ContactList.phase() without a profiler, entering it costs next to nothing
+CARET_ESCAPE = re.compile(r"\^([n^'])")  # RFC 6868 escapes in parameter values
+CARET_ESCAPED = {'n': '\n', '^': '^', "'": '"'}
+
+
+def load_vobject():
+    """The vobject module, imported on first use."""
+    try:
+        import vobject
+    except ImportError:
+        raise Exception('... cannot work with vcf_location contacts, please install vobject') from None
+    return vobject
+
+
+def parse_vcard(vcard: 'vobject.base.Component') -> dict:
     """Extract detailed contact attributes from a VCard object into a dictionary."""
     contact = {
         'full_name': None,
@@ -46,6 +66,8 @@ def parse_vcard(vcard: vobject) -> dict:
         country = ''.join(adr.value.country)
         # Join all components into a single address string
         address = ', '.join(filter(None, [street, city, region, code, country]))
+        if not address and adr.params.get('LABEL'):  # the formatted address alone (serializers.VCard40)
+            address = unescape_parameter(adr.params['LABEL'][0])
         contact['addresses'].append(address)
     # Extract organization
     if hasattr(vcard, 'org'):
@@ -63,8 +85,14 @@ def parse_vcard(vcard: vobject) -> dict:
     return contact
 
 
-def create_vcard(contact: dict) -> vobject:
+def unescape_parameter(value: str) -> str:
+    """Resolve the RFC 6868 ^n, ^' and ^^ escapes of a parameter value, vobject leaves them in."""
+    return CARET_ESCAPE.sub(lambda match: CARET_ESCAPED[match.group(1)], value) if '^' in value else value
+
+
+def create_vcard(contact: dict) -> 'vobject.base.Component':
     """Convert a contact dictionary to a vCard object."""
+    vobject = load_vobject()
     vcard = vobject.vCard()
 
     # Add full name
@@ -116,93 +144,994 @@ def create_vcard(contact: dict) -> vobject:
     return vcard
 
 
+def parse_block(block: str, fast: bool = False) -> dict:
+    """Parse a single raw vCard block into the parse_vcard dictionary."""
+    if fast:
+        try:
+            return fast_parse_vcard(block)
+        except (ValueError, LookupError):
+            pass  # not covered by the fast path, vobject decides
+    return parse_vcard(load_vobject().readOne(block, allowQP=True))
+
+
+def file_state(location: str, data: bytes = None) -> dict:
+    """Manifest entry of a file: modification time, size and content hash (when data is given)."""
+    stat = Path(location).stat()
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+            'hash': None if data is None else blake2b(data, digest_size=16).hexdigest(), 'ids': []}
+
+
+CHUNK_BYTES = 4 * 1024 * 1024  # uploads are parsed in pieces of whole cards of about this size
+CARD_BOUNDARY = re.compile(rb'END:VCARD[ \t]*\r?\n(?=(?:[ \t]*\r?\n)*[ \t]*BEGIN:VCARD)', re.IGNORECASE)
+BOUNDARY_TAIL = 256  # bytes of the previous read searched again, a boundary can span two reads
+CARD_START = re.compile(rb'^[ \t]*BEGIN:VCARD', re.IGNORECASE | re.MULTILINE)
+CHARSET_PARAM = re.compile(rb'CHARSET=([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+def iter_card_chunks(upload, chunk_size: int = CHUNK_BYTES):
+    """Yield pieces of VCF data (bytes or a binary file object) of about chunk_size bytes, cut only between cards.
+    UTF-16 data is not cut, its card boundaries are not ASCII.
+    """
+    stream = BytesIO(upload) if isinstance(upload, (bytes, bytearray)) else upload
+    data = stream.read(max(chunk_size, 2))
+    if data.startswith(UTF16_BOMS):
+        yield data + stream.read()
+        return
+    pending, size, tail = [], 0, b''  # data after the last cut, joined only when cut again
+    while data:
+        cut = None
+        for cut in CARD_BOUNDARY.finditer(tail + data):
+            pass
+        pending.append(data)
+        size += len(data)
+        if cut is None:  # one card bigger than a chunk, keep reading
+            tail = (tail + data)[-BOUNDARY_TAIL:]
+        else:
+            buffer = b''.join(pending)
+            end = size - len(data) - len(tail) + cut.end()
+            yield buffer[:end]
+            rest = buffer[end:]
+            pending, size, tail = [rest], len(rest), rest[-BOUNDARY_TAIL:]
+        data = stream.read(chunk_size)
+    if size:
+        yield b''.join(pending)
+
+
+def upload_size(upload):
+    """Size of an upload in bytes, None when the file object can not tell."""
+    if isinstance(upload, (bytes, bytearray)):
+        return len(upload)
+    size = getattr(upload, 'size', None)
+    if size is None and upload.seekable():
+        position = upload.tell()
+        size = upload.seek(0, 2) - position
+        upload.seek(position)
+    return size
+
+
+RELEASE_BYTES = 4 * 1024 * 1024  # pages of a mapped file already parsed are released this often
+CARD_TAG = re.compile(rb':VCARD[ \t]*(?:\r\n|\r|\n|\Z)', re.IGNORECASE)  # the line start is checked apart, far faster
+TAG_LINE = 64  # bytes looked back from a :VCARD for the start of its BEGIN/END line
+LEGACY_CHARSETS = ('cp1250', 'cp1251', 'latin-1')  # tried on undeclared 8-bit cards, the first wins a tie
+LEGACY_LETTERS = {  # non-ASCII letters expected in names written in each charset
+    'cp1250': set('áäčďéěíĺľňóôöőŕřšťúůüűýžÁÄČĎÉĚÍĹĽŇÓÔÖŐŔŘŠŤÚŮÜŰÝŽąćęłńśźżĄĆĘŁŃŚŹŻß'),
+    'cp1251': set('абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯіїєґўІЇЄҐЎ'),
+    'latin-1': set('àáâãäåæçèéêëìíîïñòóôõöøùúûüýÿßÀÁÂÃÄÅÆÇÈÉÊËÌÍÎÏÑÒÓÔÕÖØÙÚÛÜÝ'),
+}
+MIXED_SCRIPT = re.compile(r'[A-Za-z][а-яёА-ЯЁ]|[а-яёА-ЯЁ][A-Za-z]')  # Latin text misread as Cyrillic
+UTF16_SAMPLE = 1024  # bytes looked at for the zero bytes of UTF-16 without a BOM
+
+
+def utf16_charset(data) -> str:
+    """'utf-16' for data with a UTF-16 BOM, 'utf-16-le'/'utf-16-be' for ASCII-heavy UTF-16 without one, else None."""
+    head = data[:UTF16_SAMPLE]
+    if head.startswith(UTF16_BOMS):
+        return 'utf-16'
+    if len(head) >= 2 and head.count(0) * 3 > len(head):
+        return 'utf-16-le' if head[1::2].count(0) > head[0::2].count(0) else 'utf-16-be'
+    return None
+
+
+def iter_card_spans(data):
+    """Yield (start, end) byte offsets of every card in VCF bytes or an mmap, without decoding anything.
+    Text between cards is skipped, nested cards (vCard 2.1 AGENT) stay inside their parent.
+    """
+    depth, begin = 0, 0
+    for match in CARD_TAG.finditer(data):
+        colon = match.start()
+        window = max(colon - TAG_LINE, 0)
+        line = max(data.rfind(b'\n', window, colon), data.rfind(b'\r', window, colon)) + 1
+        if not line and window:
+            continue  # :VCARD at the end of a long line, not a tag
+        if data[line:line + 3] == codecs.BOM_UTF8:  # mmap has no startswith
+            line += 3
+        tag = data[line:colon].strip(b' \t').upper()
+        if tag == b'BEGIN':
+            if not depth:
+                begin = line
+            depth += 1
+        elif tag == b'END' and depth:
+            depth -= 1
+            if not depth:
+                yield begin, match.end()
+
+
+def legacy_score(text: str, charset: str) -> int:
+    """How plausible text decoded from charset is: expected letters count for it, anything else against."""
+    letters = LEGACY_LETTERS[charset]
+    score = sum(1 if char in letters else -2 for char in text if char >= '\x80')
+    if charset == 'cp1251':
+        score -= 2 * len(MIXED_SCRIPT.findall(text))
+    return score
+
+
+def decode_card(raw: bytes, hint: str = None):
+    """Text of one card and the charset it was decoded with: utf-8 when valid, else the first declared
+    CHARSET= that decodes it, else the legacy charset whose letters fit best (hint, the charset of the
+    previous 8-bit card of the file, wins a tie). Always succeeds, latin-1 decodes anything.
+    """
+    try:
+        return raw.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    for name in CHARSET_PARAM.findall(raw):
+        try:
+            charset = codecs.lookup(name.decode('ascii')).name
+            return raw.decode(charset), charset
+        except (LookupError, UnicodeDecodeError):
+            continue
+    if hint and hint not in LEGACY_LETTERS:  # declared on an earlier card
+        try:
+            return raw.decode(hint), hint
+        except UnicodeDecodeError:
+            pass
+    best = None
+    for charset in sorted(LEGACY_CHARSETS, key=lambda charset: charset != hint):
+        try:
+            text = raw.decode(charset)
+        except UnicodeDecodeError:
+            continue  # bytes cp1250/cp1251 leave undefined
+        score = legacy_score(text, charset)
+        if best is None or score > best[0]:
+            best = (score, text, charset)
+    return best[1], best[2]
+
+
+def parse_vcf_cards(data, location: str, fast: bool = False, encoding: str = None, decode_errors: str = 'strict',
+                    first_card: int = 1, parse=parse_block):
+    """Yield (contact, None) for every card of VCF bytes or an mmap, or (None, message) for a broken card.
+    Cards are cut at byte level and decoded one by one, with encoding when given, else by decode_card,
+    so one card in another charset or with bad bytes is reported alone and the rest of the file still loads.
+    UTF-16 data is converted first, its card boundaries are not ASCII.
+    """
+    wide = utf16_charset(data)
+    if wide:
+        data = bytes(data).decode(wide, 'replace').encode('utf-8')
+        encoding = 'utf-8'
+    hint, released = None, 0
+    for number, (start, end) in enumerate(iter_card_spans(data), start=first_card):
+        if end - released >= RELEASE_BYTES:
+            released = release_pages(data, start)
+        try:
+            raw = data[start:end]
+            if encoding:
+                text = raw.decode(encoding, decode_errors)
+            else:
+                text, charset = decode_card(raw, hint)
+                hint = hint if charset == 'utf-8' else charset
+            if '\r' in text:  # as the universal newlines of a text file
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            yield parse(text, fast), None
+        except Exception as e:
+            yield None, f"Error loading card {number} in {location}: {e}"
+
+
+def map_file(location: str):
+    """Read-only mmap of a file for parse_vcf_cards, b'' for an empty one (which can not be mapped).
+    The pages are read in by the OS as the cards are reached, nothing is copied up front.
+    """
+    with open(location, mode='rb') as vcf_file:
+        if not Path(location).stat().st_size:
+            return b''
+        data = mmap.mmap(vcf_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(data, 'madvise'):  # not on Windows
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    return data
+
+
+def release_pages(data, end: int) -> int:
+    """Let the OS drop the pages of an mmap before offset end from memory, they are read again when touched.
+    Returns end, nothing is done for bytes.
+    """
+    if isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):  # not on Windows
+        data.madvise(mmap.MADV_DONTNEED, 0, end - end % mmap.PAGESIZE)
+    return end
+
+
+def read_vcf_bytes(location: str):
+    """Read a VCF file for parse_vcf_bytes, returns (data, manifest entry), an unreadable file is passed on as its error."""
+    try:
+        state = file_state(location)  # stat before reading, a change in between shows up on the next refresh
+        data = Path(location).read_bytes()
+        state['hash'] = blake2b(data, digest_size=16).hexdigest()
+        return data, state
+    except OSError as e:
+        return e, None
+
+
+def parse_vcf_bytes(location: str, data, fast: bool = False, encoding: str = None,
+                    decode_errors: str = 'strict', first_card: int = 1, parse=parse_block):
+    """Parse a VCF file read into memory, returns (contacts, errors) with the messages the serial loader prints.
+    Module level, so it can run in worker processes.
+    """
+    contacts, errors = [], []
+    try:
+        if isinstance(data, Exception):
+            raise data
+        for contact, error in parse_vcf_cards(data, location, fast, encoding, decode_errors, first_card, parse):
+            if error:
+                errors.append(error)
+            else:
+                contacts.append(contact)
+    except Exception as e:
+        errors.append(f"Error loading file {location}: {e}")
+    return contacts, errors
+
+
+# property line as vobject accepts it: [group.]NAME[;PARAM[=value,...]]*:value (quoted params are left to vobject)
+CONTENT_LINE = re.compile(r'(?:[A-Za-z0-9_-]+\.)?([A-Za-z0-9_-]+)'
+                          r'((?:;[A-Za-z0-9_-]+(?:=(?:"[^"]*"|[^";:]*))?)*):(.*)\Z', re.DOTALL)
+QUOTED_PARAMETER = re.compile(r';([A-Za-z0-9_-]+)="([^"]*)"')
+TEXT_FIELDS = {'FN': 'full_name', 'TITLE': 'job_title', 'BDAY': 'birthday', 'NOTE': 'notes'}
+ESCAPED = {'\\': '\\', ';': ';', ',': ',', 'N': '\n', 'n': '\n', '"': '"'}
+
+
+def logical_lines(block: str):
+    """Unfold a raw vCard block into logical lines the same way vobject does (folding + QP soft breaks)."""
+    logical = ''
+    qp = False
+    for line in block.split('\n'):
+        line = line.rstrip('\r\n')
+        if line.rstrip() == '':
+            if logical:
+                yield logical
+            logical = ''
+            qp = False
+            continue
+        if qp:
+            logical += '\n' + line
+            qp = False
+        elif line[0] in ' \t':
+            logical += line[1:]
+        else:
+            if logical:
+                yield logical
+            logical = line
+        if logical and logical[-1] == '=' and 'quoted-printable' in logical.lower():
+            qp = True
+    if logical:
+        yield logical
+
+
+def text_values(value: str, separator: str = ',', escapable: str = '\\;,Nn"') -> list:
+    """Split a property value on unescaped separators and resolve backslash escapes (vobject semantics)."""
+    if '\\' not in value:
+        values = value.split(separator)
+    else:
+        if value.endswith('\\') and (len(value) - len(value.rstrip('\\'))) % 2:
+            raise ValueError('dangling backslash')
+        values, current, chars = [], [], iter(value)
+        for char in chars:
+            if char == '\\':
+                char = next(chars)
+                if char in escapable:
+                    current.append(ESCAPED[char])
+                else:
+                    current.append('\\' + char)  # left for a later pass
+            elif char == separator:
+                values.append(''.join(current))
+                current = []
+            else:
+                current.append(char)
+        values.append(''.join(current))
+    if len(values) > 1 and values[-1] == '':
+        values.pop()  # vobject drops one trailing empty value
+    return values
+
+
+def structured_values(value: str) -> list:
+    """Split a structured (N, ADR, ORG) value into fields, each a string or a list of strings."""
+    fields = []
+    for field in text_values(value, ';', ';'):
+        items = text_values(field)
+        fields.append(items[0] if len(items) == 1 else items)
+    return fields
+
+
+def fast_parse_vcard(block: str) -> dict:
+    """Parse the common fields of a raw vCard block straight into the parse_vcard dictionary.
+    Raises ValueError for anything vobject would treat differently, parse_block then falls back to vobject.
+    """
+    contact = {
+        'full_name': None,
+        'given_name': None,
+        'family_name': None,
+        'phone_numbers': [],
+        'emails': [],
+        'addresses': [],
+        'organization': None,
+        'job_title': None,
+        'birthday': None,
+        'notes': None,
+    }
+    seen = set()
+    lines = logical_lines(block)
+    if next(lines, '').upper() != 'BEGIN:VCARD':
+        raise ValueError('block does not start with BEGIN:VCARD')
+    for line in lines:
+        match = CONTENT_LINE.match(line)
+        if match is None:
+            raise ValueError(f'unparsable line {line!r}')
+        name, params, value = match.groups()
+        name = name.upper()
+        if name == 'BEGIN':
+            raise ValueError('nested component')
+        if name not in TEXT_FIELDS and name not in ('N', 'TEL', 'EMAIL', 'ADR', 'ORG'):
+            continue
+        label = None
+        if params:
+            if '"' in params:  # a quoted LABEL (serializers.VCard40) is taken here, vobject decides other ones
+                quoted = QUOTED_PARAMETER.findall(params)
+                if [key.upper() for key, _ in quoted] != ['LABEL'] or params.upper().count(';LABEL=') > 1:
+                    raise ValueError('quoted parameter other than a single LABEL')
+                label = quoted[0][1]
+                params = QUOTED_PARAMETER.sub('', params)
+            encoding, charset = None, None
+            for param in params[1:].split(';'):
+                key, _, values = param.partition('=')
+                key = key.upper()
+                if key == 'LABEL':
+                    label = values.split(',')[0]
+                elif key == 'ENCODING':
+                    encoding = values
+                elif key == 'CHARSET':
+                    charset = charset or values.split(',')[0]
+                elif param in ('QUOTED-PRINTABLE', 'BASE64'):
+                    encoding = param
+            if encoding == 'QUOTED-PRINTABLE':
+                value = a2b_qp(value.encode('utf-8')).decode(charset or 'utf-8')
+            elif encoding is not None:
+                raise ValueError(f'unsupported encoding {encoding}')
+        if name == 'TEL':
+            contact['phone_numbers'].append(text_values(value)[0])
+        elif name == 'EMAIL':
+            contact['emails'].append(text_values(value)[0])
+        elif name == 'ADR':
+            fields = structured_values(value)[2:7]
+            address = ', '.join(filter(None, [''.join(field) for field in fields]))
+            if not address and label:
+                address = unescape_parameter(label)
+            contact['addresses'].append(address)
+        elif name in seen:
+            continue  # vobject exposes the first occurrence only
+        elif name == 'N':
+            fields = structured_values(value)
+            contact['family_name'] = str(fields[0]) if fields else ''
+            contact['given_name'] = str(fields[1]) if len(fields) > 1 else ''
+        elif name == 'ORG':
+            fields = structured_values(value)
+            if any(isinstance(field, list) for field in fields):
+                raise ValueError('ORG with comma separated values')
+            contact['organization'] = ' '.join(fields)
+        else:
+            contact[TEXT_FIELDS[name]] = text_values(value)[0]
+        seen.add(name)
+    return contact
+
+
+SORT_FIELDS = ('full_name', 'given_name', 'family_name', 'organization', 'emails', 'phone_numbers')
+MAX_MATCHES = 10000  # search matches a page() view can browse through
+DATABASE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')  # a vcf_location with one is opened as a ContactDatabase
+
+
+def sort_text(value) -> str:
+    """Sort key of a field value: transliterated and case-insensitive, the first item of a list, empty values last."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not value:
+        return '\uffff'
+    value = str(value)
+    if value.isascii():
+        return value.casefold()
+    from unidecode import unidecode
+    return unidecode(value).casefold()
+
+
 class ContactList:
-    """Creates a Contact list object either from a single file or a directory with vcf files"""
+    """Creates a Contact list object either from a single file or a directory with vcf files,
+    or opens a library kept in SQLite (a .sqlite/.db vcf_location or database, see contact_db.py)"""
 
-    def __init__(self, vcf_location: str, is_dir=False) -> None:
+    def __init__(self, vcf_location: str, is_dir=False, fast=False, workers=1, country=None,
+                 cache=None, profile=None, database=None) -> None:
         self.counter = 0  # Start index for contacts
-        self.dic = {}  # Holds all the contact list indexed by counter
+        self.dic = ContactStore()  # Holds all the contact list indexed by counter
+        self.phones = PhoneIndex(country or DEFAULT_COUNTRY)  # Normalized number -> indexes, in step with dic
+        self.search_index = None  # SearchIndex built by the first query(), then kept in step with dic
+        self.version = 0  # bumped by every add/update/remove, a cache key for views of the library
+        self.orders = {}  # field -> (version, keys sorted by it), built by sorted_keys() when asked for
+        self.manifest = {}  # file path -> {'mtime', 'size', 'hash', 'ids'} of every loaded file, for refresh()
+        self.directories = []  # loaded directories, refresh() picks up new files there
+        self.fast = fast  # Parse common fields natively, vobject only for what the fast path can't handle
+        self.workers = workers  # Parser processes for directory loads (1 = serial)
+        self.cache = cache  # Optional ParseCache, files parsed before are not parsed again
+        if profile is True:
+            from profiling import Profiler
+            profile = Profiler()
+        self.profiler = profile or None  # Optional profiling.Profiler timing loads and views, see stats()
         self.ac_key = ''  # For duplicates and searching
         self.ac_val = ''
+        if database is None and not is_dir and str(vcf_location).lower().endswith(DATABASE_SUFFIXES):
+            database, vcf_location = vcf_location, ''
+        self.database = None  # Optional ContactDatabase, dic, phones and manifest are then its tables
+        if database is not None:
+            self._open_database(database, country)
         try:
             if len(vcf_location) > 0:
                 if is_dir:  # this way counting number of files
                     self.load_directory(vcf_location)
                 else:  # this way counting number of records in a file
                     self.open_vcf(vcf_location)
-            else:
+            elif self.database is None:
                 print("please follow with ContactList.open_vcf() or ContactList.load_directory()")
         except Exception as e:
             print('error:', e)
 
+    def _open_database(self, database, country: str = None) -> None:
+        """Keep the library in a ContactDatabase (or the SQLite file of that path), its contacts keep their ids.
+        Without a country the one the database was written for is kept.
+        """
+        from contact_db import ContactDatabase
+
+        if not isinstance(database, ContactDatabase):
+            database = ContactDatabase(database, country)
+        self.database = database
+        self.dic = database.contacts
+        self.phones = database.phones
+        self.manifest = database.files
+        self.directories = database.directories
+        self.counter = database.contacts.top
+
+    def commit(self) -> None:
+        """Write pending changes into the database, nothing to do for a library in memory."""
+        if self.database is not None:
+            self.database.commit()
+
+    def phase(self, name: str):
+        """Context manager timing a phase on the profiler, a shared no-op without one."""
+        return self.profiler.phase(name) if self.profiler else NO_PHASE
+
+    def stats(self) -> dict:
+        """Profiling snapshot (see profiling.Profiler.stats), empty when profiling is off."""
+        return self.profiler.stats() if self.profiler else {}
+
+    def _block_parser(self):
+        return self.profiler.parse_block if self.profiler else parse_block
+
     def _step(self, i: int = 1) -> None:
         """Increment the current index by the specified step value."""
         self.counter += i
 
-    def find_duplicates(self):
-        """Finds duplicates across library."""
-        # TODO: not valid, need to repair
-        for key, value in self.dic.items():
-            self.ac_key = key
-            self.ac_val = value
-            if self.search(value):
-                print(f'... consider as a duplicate {key} ({value})')
-
-    def search(self, s):
-        """Search similar contacts."""
-        # TODO: not valid, need to repair
-        occurs = 0
-        for item_no, details in self.dic.items():
-            if item_no != self.ac_key:
-                name_ratio = SequenceMatcher(None, s['full_name'], details['full_name']).ratio()
-                tel_ratio = SequenceMatcher(None, s['TEL'], details['TEL']).ratio()
-                if name_ratio > 0.9 or tel_ratio > 0.9:
-                    occurs += 1
-                    print(
-                        f'!!! found {details["full_name"]} ({details["TEL"]}) that is suspect to {s["full_name"]} ({s["TEL"]})')
-        return occurs
-
-    def export(self, path):
-        """Exporting contacts (currently multiple files in directory)."""
+    def add(self, contact: dict) -> int:
+        """Store a new contact under the next index and return the index."""
+        self._step(1)  # Incrementing the index contact
+        self.dic[self.counter] = contact
+        self.phones.add(self.counter, contact.get('phone_numbers'))
+        if self.search_index is not None:
+            self.search_index.add(self.counter, contact)
+        self.version += 1
+        return self.counter
+
+    def update(self, key, contact: dict) -> None:
+        """Replace the contact stored under key."""
+        self.phones.remove(key)
+        self.dic[key] = contact
+        self.phones.add(key, contact.get('phone_numbers'))
+        if self.search_index is not None:
+            self.search_index.update(key, contact)
+        self.version += 1
+
+    def remove(self, key) -> None:
+        """Delete the contact stored under key."""
+        del self.dic[key]
+        self.phones.remove(key)
+        if self.search_index is not None:
+            self.search_index.remove(key)
+        self.version += 1
+
+    def owners(self, number: str) -> list:
+        """Indexes of contacts having the phone number, written in any format."""
+        return self.phones.lookup(number)
+
+    def query(self, text: str, limit: int = 20) -> list:
+        """Indexes of contacts matching text (names, organization, emails, phone digits, prefixes too), best first."""
+        if self.database is not None and self.database.fts:
+            with self.phase('query'):
+                return self.database.search(text, limit)
+        if self.search_index is None:
+            self.search_index = self.build_search_index()
+        with self.phase('query'):
+            return self.search_index.query(text, limit)
+
+    def build_search_index(self):
+        """SearchIndex of the contacts in dic, query() builds one on first use and keeps it in step with dic.
+        Another thread may build it ahead while dic does not change and set search_index when done.
+        """
+        from search_index import SearchIndex
+        with self.phase('index'):
+            search_index = SearchIndex(self.phones.country)
+            for key, contact in self.dic.items():
+                search_index.add(key, contact)
+        return search_index
+
+    def sorted_keys(self, field: str) -> list:
+        """Indexes ordered by a field (see sort_text, ties in library order), kept until the library changes."""
+        if field not in SORT_FIELDS:
+            raise ValueError(f"unknown sort field {field!r}, use one of {', '.join(SORT_FIELDS)}")
+        version, keys = self.orders.get(field, (None, None))
+        if version != self.version:
+            with self.phase('sort'):
+                if self.database is not None:  # one query instead of one per contact
+                    keys = [key for _, key in sorted((sort_text(value), key)
+                                                     for key, value in self.dic.field_values(field))]
+                else:
+                    keys = sorted(self.dic, key=lambda key: sort_text(self.dic.field(key, field)))
+            self.orders[field] = (self.version, keys)
+        return keys
+
+    def page(self, text: str = '', sort: str = None, descending: bool = False, start: int = 0, size: int = 50):
+        """One page of a table view: (number of matching contacts, their indexes from start to start + size).
+        Without text the whole library is browsed in library or sort order, with text the best MAX_MATCHES
+        search matches, ranked or sorted.
+        """
+        if text:
+            keys = self.query(text, MAX_MATCHES)
+            if sort:
+                if sort not in SORT_FIELDS:
+                    raise ValueError(f"unknown sort field {sort!r}, use one of {', '.join(SORT_FIELDS)}")
+                keys.sort(key=lambda key: sort_text(self.dic.field(key, sort)), reverse=descending)
+            return len(keys), keys[start:start + size]
+        keys = self.sorted_keys(sort) if sort else self.dic.key_sequence()
+        if descending:  # read from the end instead of reversing the whole order
+            end = max(len(keys) - start, 0)
+            return len(keys), list(keys[max(end - size, 0):end])[::-1]
+        return len(keys), list(keys[start:start + size])
+
+    def find_duplicates(self, threshold: float = 0.9) -> list:
+        """Finds duplicates across library, returns clusters [{'ids': [...], 'score': .., 'reasons': [...]}]."""
+        import dedupe
+        with self.phase('dedupe'):
+            return dedupe.find_duplicates(self.dic, threshold=threshold, phones=self.phones.numbers)
+
+    def search(self, s, threshold: float = 0.9) -> list:
+        """Search contacts similar to contact s (other than the one under ac_key), returns their indexes."""
+        import dedupe
+        return [item_no for item_no, details in self.dic.items()
+                if item_no != self.ac_key and dedupe.is_duplicate(s, details, threshold, self.phones.country)]
+
+    def export(self, path, workers: int = 8, overwrite: bool = False) -> tuple:
+        """Exporting contacts into a directory, one file per contact named by FN, returns (files written, messages).
+        Files already there are kept, or replaced with overwrite, the messages report them for the caller to show.
+        """
+        from vcf_writer import write_vcard_files
+
         print('.' * 3, f'processing {len(self.dic)} files')
-        for record in self.dic.keys():
-            actual = create_vcard(self.dic[record])
-            actual.name = 'VCARD'
-            actual.useBegin = True
-            # actual.prettyPrint()
-            print_path = Path(path) / f"{self.dic[record]['full_name']}.vcf"
-            if Path(print_path).exists():
-                print(f' overwrite {print_path}')
-            with open(print_path, mode='w', encoding='utf-8') as f:
-                f.write(actual.serialize())
+        with self.phase('export'):
+            result = write_vcard_files(self.dic.values(), path, workers, overwrite)
         print('.' * 3, f'done')
+        return result
 
-    def merge(self, path):
-        if Path(path.name).is_dir():
-            with open(path + self.dic[self.ac_key]['FN'], mode='a', encoding='utf-8') as f:
-                f.write(self.dic.serialize())
-        else:
-            with open(path.name, mode='a', encoding='utf-8') as f:
-                f.write(self.dic.serialize())
-            #for record in self.dic.keys():
-            #    f.write(self.dic[record].serialize())
+    def export_stream(self, output, output_format: str = 'vcard3') -> int:
+        """Exporting all contacts into one stream (path or binary file object), returns the card count.
+        output_format is one of serializers.SERIALIZERS: vcard3, vcard4, jcard (JSON lines) or xcard.
+        """
+        with self.phase('export'):
+            if output_format == 'vcard3':
+                from vcf_writer import write_vcards
+                return write_vcards(self.dic.values(), output)
+            from serializers import serializer_for
+            return serializer_for(output_format).write(self.dic.values(), output)
+
+    def export_table(self, path, table_format: str = None, batch_rows: int = None) -> int:
+        """Exporting all contacts with their indexes as 'id' into an Arrow IPC (.arrow/.feather), Parquet or CSV
+        file (or binary stream with table_format named) in record batches, see columnar.py. Returns the row count.
+        """
+        from columnar import BATCH_ROWS, write_table
+
+        with self.phase('export'):
+            return write_table(self.dic.items(), path, table_format, batch_rows or BATCH_ROWS)
+
+    def load_table(self, path, table_format: str = None) -> int:
+        """Adding the contacts of a snapshot written by export_table, far faster than parsing the vCards again.
+        Returns the number of added contacts.
+        """
+        from columnar import read_table
+
+        added = 0
+        with self.phase('load'):
+            try:
+                for contact in read_table(path, table_format):
+                    self.add(contact)
+                    added += 1
+            except Exception as e:
+                print(f"Error loading file {path}: {e}")
+        self.commit()
+        return added
+
+    def merge(self, path, order: str = None, compression: str = None, run_size: int = None) -> int:
+        """Merging all contacts into one .vcf file (gzip/zstd compressed for .gz/.zst or when asked) or binary stream.
+        order: None keeps the library order, 'family_name' sorts by family and given name (external sort,
+        at most run_size cards in memory), 'source' groups contacts by source file. Returns the card count.
+        """
+        from vcf_writer import RUN_SIZE, open_output, write_sorted_vcards, write_vcards
+
+        if order not in (None, 'family_name', 'source'):
+            raise ValueError(f"unknown order {order!r}, use 'family_name' or 'source'")
+        # a binary stream (stdout) is written as it is and left open
+        target = nullcontext(path) if hasattr(path, 'write') else open_output(path, compression)
+        with self.phase('merge'), target as output:
+            if order == 'family_name':
+                return write_sorted_vcards(self._family_keys(), output, run_size or RUN_SIZE)
+            if order == 'source':
+                return write_vcards(self._by_source(), output)
+            return write_vcards(self.dic.values(), output)
+
+    def _family_keys(self):
+        """Yield (sort key, contact) by family name, given name and library order."""
+        from unidecode import unidecode
+
+        for number, contact in enumerate(self.dic.values()):
+            family = unidecode(contact.get('family_name') or contact.get('full_name') or '').casefold()
+            given = unidecode(contact.get('given_name') or '').casefold()
+            yield f'{family}\0{given}\0{number:012d}', contact
+
+    def _by_source(self):
+        """Yield contacts file by file in path order, contacts not loaded from a file come last."""
+        seen = 0
+        for location in sorted(self.manifest):
+            for key in self.manifest[location]['ids']:
+                if key in self.dic:
+                    seen += 1
+                    yield self.dic[key]
+        if seen < len(self.dic):
+            loaded = {key for entry in self.manifest.values() for key in entry['ids']}
+            for key, contact in self.dic.items():
+                if key not in loaded:
+                    yield contact
 
     def open_vcf(self, location: str):
         """Load contacts from a single VCF file."""
+        with self.phase('load'):
+            for _ in self.iter_vcf(location):
+                pass
+
+    def iter_vcf(self, location: str):
+        """Stream contacts from a single VCF file, filling dic card by card.
+        Yields (index, contact) as soon as each card is stored, a broken card is reported and skipped.
+        """
+        yield from self._iter_file(location)
+        if self.cache:
+            self.cache.commit()
+        self.commit()
+
+    def _iter_file(self, location: str):
+        """iter_vcf without committing the parse cache."""
+        lookup, timing = self.phase('cache') if self.cache else None, self.phase('file')
+        cached = None
+        if self.cache:
+            with lookup:
+                cached = self._read_cached(location)
+        if cached:
+            state, contacts, errors = cached
+            for error in errors:
+                print(error)
+            state['ids'] = []
+            for contact in contacts:
+                state['ids'].append(self.add(contact))
+                yield state['ids'][-1], contact
+            self.manifest[location] = state
+            if self.profiler:
+                self.profiler.file(location, lookup.seconds, state['size'], len(contacts), len(errors))
+            return
+        state, ids, failures, data = None, [], 0, None
         try:
-            with open(location, mode='r', encoding='utf-8') as vcf_file:
-                vcard_data = vcf_file.read()
-            for vcard in vobject.readComponents(vcard_data, allowQP=True):
-                contact = parse_vcard(vcard)
-                self._step(1)  # Incrementing the index contact
-                self.dic[self.counter] = contact
+            with timing:  # the time spent by the consumer of iter_vcf between cards is counted as well
+                state = file_state(location)
+                with self.phase('read'):
+                    data = map_file(location)
+                    state['hash'] = blake2b(data, digest_size=16).hexdigest()
+                    release_pages(data, len(data))  # read again card by card
+                for contact, error in parse_vcf_cards(data, location, self.fast, parse=self._block_parser()):
+                    if error:
+                        print(error)
+                        failures += 1
+                        continue
+                    ids.append(self.add(contact))
+                    yield ids[-1], contact
         except Exception as e:
             print(f"Error loading file {location}: {e}")
+            failures += 1
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+            if state:
+                state['ids'] = ids
+                self.manifest[location] = state
+            if self.profiler:
+                self.profiler.file(location, timing.seconds, state and state['size'], len(ids), failures)
+
+    def load_directory(self, directory_path: str, workers: int = None) -> None:
+        """Load all VCF files in a directory (sorted by path, so indexes are the same on every load)."""
+        workers = workers or self.workers
+        if directory_path not in self.directories:
+            self.directories.append(directory_path)
+        with self.phase('load'):
+            files = self.directory_files(directory_path)
+            if workers > 1:
+                for parsed in self._parse_parallel(files, workers):
+                    self.store_file(*parsed)
+            else:
+                for file in files:
+                    for _ in self._iter_file(file):
+                        pass
+                if self.cache:
+                    self.cache.commit()
+        self.commit()
+
+    @staticmethod
+    def directory_files(directory_path: str) -> list:
+        """VCF files in a directory and its subdirectories, sorted by path."""
+        return [str(file) for file in sorted(Path(directory_path).rglob("*.vcf"))]
+
+    def parse_files(self, files: list, workers: int = None, cancel=None):
+        """Yield (location, state, contacts, errors) of files in their order without storing anything,
+        so that another thread can parse while the owner of the list stores the results with store_file().
+        Setting cancel (a threading.Event) stops the parsing before the next file.
+        """
+        workers = workers or self.workers
+        if workers > 1:
+            yield from self._parse_parallel(files, workers, cancel)
+            return
+        for location in files:
+            if cancel is not None and cancel.is_set():
+                break
+            yield (location, *self._read_file(location))
+        if self.cache:
+            self.cache.commit()
+
+    def _read_file(self, location: str):
+        """(state, contacts, errors) of one file read into memory, through the parse cache when there is one."""
+        with self.phase('file') as timing:
+            cached = self._read_cached(location) if self.cache else None
+            if cached:
+                result = cached
+            else:
+                with self.phase('read'):
+                    data, state = read_vcf_bytes(location)
+                if state is None:
+                    result = None, [], [f"Error loading file {location}: {data}"]
+                else:
+                    result = (state, *self._parse(location, data, state))
+        if self.profiler:
+            state, contacts, errors = result
+            self.profiler.file(location, timing.seconds, state and state['size'], len(contacts), len(errors))
+        return result
 
-    def load_directory(self, directory_path: str) -> None:
-        """Load all VCF files in a directory."""
-        for file in Path(directory_path).rglob("*.vcf"):
-            self.open_vcf(str(file))
+    def _parse_parallel(self, files: list, workers: int, cancel=None):
+        """Read files on a thread pool, parse them on a process pool and yield the results in file order."""
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        parse = parse_vcf_bytes
+        if self.profiler:
+            from profiling import profiled_parse_vcf_bytes as parse
+        batch_size = workers * 64  # bounds how many raw files are held in memory at once
+        with ThreadPoolExecutor(workers) as readers, ProcessPoolExecutor(workers) as parsers:
+            for start in range(0, len(files), batch_size):
+                if cancel is not None and cancel.is_set():
+                    break
+                batch = files[start:start + batch_size]
+                done = {}  # location -> (state, contacts, errors)
+                if self.cache:
+                    for location in batch:
+                        cached = self._cache_lookup(location)
+                        if cached:
+                            done[location] = cached
+                misses = [location for location in batch if location not in done]
+                with self.phase('read'):
+                    reads = dict(zip(misses, readers.map(read_vcf_bytes, misses)))
+                if self.cache:
+                    for location, (_, state) in reads.items():
+                        hit = state and self.cache.get(location, state)  # same content under another stat
+                        if hit:
+                            done[location] = (state, hit[0], hit[1])
+                todo = [location for location in misses if location not in done]
+                chunksize = max(1, len(todo) // (workers * 4))
+                results = parsers.map(parse, todo, [reads[location][0] for location in todo],
+                                      repeat(self.fast), chunksize=chunksize)
+                for location, (contacts, errors, *phases) in zip(todo, results):
+                    state = reads[location][1]
+                    if phases:  # parsed by profiled_parse_vcf_bytes
+                        self.profiler.merge(phases[0])
+                        seconds = phases[0]['parse'][1]
+                        self.profiler.file(location, seconds, state and state['size'], len(contacts), len(errors))
+                    if self.cache and state:
+                        self.cache.put(location, state, contacts, errors)
+                    done[location] = (state, contacts, errors)
+                if self.cache:
+                    self.cache.commit()
+                for location in batch:
+                    yield (location, *done[location])
+
+    def store_file(self, location: str, state: dict, contacts: list, errors: list) -> None:
+        """Add the contacts parsed from one file and record the file in the manifest."""
+        for error in errors:
+            print(error)
+        with self.phase('store'):
+            ids = [self.add(contact) for contact in contacts]
+        if state:
+            state['ids'] = ids
+            self.manifest[location] = state
+
+    def load_uploads(self, uploads, workers: int = None, progress=None, chunk_size: int = CHUNK_BYTES) -> int:
+        """Load VCF data that is not in the filesystem: bytes or binary file objects (a .name is used in messages).
+        Every upload is cut into chunks of whole cards (iter_card_chunks), each card decoded by its detected charset
+        and parsed on a process pool when workers > 1, with at most workers * 2 chunks in flight.
+        progress(bytes done, total bytes or None) is called after every chunk. Returns the number of added contacts.
+        """
+        workers = workers or self.workers
+        uploads = list(uploads)
+        sizes = [upload_size(upload) for upload in uploads]
+        total = None if None in sizes else sum(sizes)
+        done, added = 0, 0
+
+        def chunks():
+            for number, upload in enumerate(uploads, start=1):
+                name = getattr(upload, 'name', None) or f'upload {number}'
+                card = 1
+                for chunk in iter_card_chunks(upload, chunk_size):
+                    yield len(chunk), (name, chunk, self.fast, None, 'strict', card)
+                    card += len(CARD_START.findall(chunk))
+
+        def store(size, name, contacts, errors, phases=None):
+            nonlocal done, added
+            for error in errors:
+                print(error)
+            with self.phase('store'):
+                for contact in contacts:
+                    self.add(contact)
+            done += size
+            added += len(contacts)
+            if phases is not None:  # parsed by profiled_parse_vcf_bytes
+                self.profiler.merge(phases)
+                self.profiler.file(name, phases['parse'][1], size, len(contacts), len(errors))
+            if progress:
+                progress(done, total)
+
+        parse = parse_vcf_bytes
+        if self.profiler:
+            from profiling import profiled_parse_vcf_bytes as parse
+        with self.phase('load'):
+            if workers > 1:
+                from concurrent.futures import ProcessPoolExecutor
+
+                pending = deque()
+                with ProcessPoolExecutor(workers) as parsers:
+                    for size, arguments in chunks():
+                        pending.append((size, arguments[0], parsers.submit(parse, *arguments)))
+                        if len(pending) >= workers * 2:
+                            size, name, future = pending.popleft()
+                            store(size, name, *future.result())
+                    while pending:
+                        size, name, future = pending.popleft()
+                        store(size, name, *future.result())
+            else:
+                for size, arguments in chunks():
+                    store(size, arguments[0], *parse(*arguments))
+        self.commit()
+        return added
+
+    def _cache_lookup(self, location: str):
+        """(state, contacts, errors) cached for an unchanged file, found by its stat alone."""
+        try:
+            state = file_state(location)
+        except OSError:
+            return None
+        hit = self.cache.get(location, state)
+        if hit is None:
+            return None
+        contacts, errors, state['hash'] = hit
+        return state, contacts, errors
+
+    def _read_cached(self, location: str):
+        """(state, contacts, errors) of a file through the parse cache, None leaves it to the streaming reader."""
+        cached = self._cache_lookup(location)
+        if cached is None:
+            try:
+                if Path(location).stat().st_size > self.cache.max_entry:
+                    return None  # too big to be cached, streamed instead
+            except OSError:
+                return None
+            data, state = read_vcf_bytes(location)
+            if state is None:
+                return None
+            cached = (state, *self._parse(location, data, state))
+        return cached
+
+    def _parse(self, location: str, data: bytes, state: dict):
+        """Parse a file read by read_vcf_bytes into (contacts, errors), through the parse cache when there is one."""
+        if self.cache:
+            hit = self.cache.get(location, state)
+            if hit:
+                return hit[:2]
+        with self.phase('parse'):
+            contacts, errors = parse_vcf_bytes(location, data, self.fast, parse=self._block_parser())
+        if self.cache:
+            self.cache.put(location, state, contacts, errors)
+        return contacts, errors
+
+    def refresh(self) -> dict:
+        """Re-parse only files added, changed or deleted since they were loaded and patch dic in place.
+        Unchanged mtime and size skip a file, a changed one is re-parsed only when its content hash differs.
+        Contacts of a changed file keep their indexes. Returns the touched paths by kind of change.
+        """
+        with self.phase('refresh'):
+            changes = {'added': [], 'changed': [], 'removed': []}
+            files = dict.fromkeys(self.manifest)
+            for directory in self.directories:
+                files.update(dict.fromkeys(self.directory_files(directory)))
+            for location in files:
+                known = self.manifest.get(location)
+                try:
+                    stat = Path(location).stat()
+                except OSError:  # deleted
+                    stat = None
+                if stat is None:
+                    if known:
+                        for key in self.manifest.pop(location)['ids']:
+                            self.remove(key)
+                        changes['removed'].append(location)
+                    continue
+                if known and (known['mtime'], known['size']) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                with self.phase('read'):
+                    data, state = read_vcf_bytes(location)
+                if state is None:
+                    print(f"Error loading file {location}: {data}")
+                    continue
+                if known and known['hash'] == state['hash']:
+                    known.update(mtime=state['mtime'], size=state['size'])  # touched only
+                    self.manifest[location] = known
+                    continue
+                contacts, errors = self._parse(location, data, state)
+                for error in errors:
+                    print(error)
+                state['ids'] = self._replace(known['ids'] if known else [], contacts)
+                self.manifest[location] = state
+                changes['changed' if known else 'added'].append(location)
+            if self.dic.size > 2 * len(self.dic):
+                self.dic.compact()  # replaced rows are garbage in the store
+            if self.cache:
+                self.cache.commit()
+            self.commit()
+            return changes
+
+    def _replace(self, keys: list, contacts: list) -> list:
+        """Put contacts under the given indexes, dropping or adding what does not fit, returns the indexes used."""
+        for key in keys[len(contacts):]:
+            self.remove(key)
+        for key, contact in zip(keys, contacts):
+            self.update(key, contact)
+        return keys[:len(contacts)] + [self.add(contact) for contact in contacts[len(keys):]]
 
     def __str__(self) -> str:
         """String representation of the contact list."""
@@ -222,18 +1151,18 @@ def smash_it(path: str = ''):
 def name_value(first='', last=''):
     if first and last:
         # return ';'.join((m.family, m.given, m.prefix, m.suffix, m.additional))
-        return vobject.vcard.Name(family=last, given=first)
+        return load_vobject().vcard.Name(family=last, given=first)
 
 
-def quoted_printable(vcf: vobject, serialize: bool = True):
+def quoted_printable(vcf, serialize: bool = True):
+    """vCard 2.1 bytes of a vobject card or parse_vcard dictionary for phones, values that are not printable
+    ASCII quoted-printable encoded property by property (vcf_writer.serialize_qp_vcard).
+    """
     if vcf and serialize:
-        # first = encodestring(first.encode('utf-8'))
-        # last = encodestring(last.encode('utf-8'))
-        a = encodestring(vcf.serialize().encode('utf-8'))
-        a = a.replace(b'\nN:', b'\nN;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:')
-        a = a.replace(b'FN:', b'FN;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:')
-        a = a.replace(b';CHARSET=3DUTF-8:', b';ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:')
-        return a
+        from vcf_writer import serialize_qp_vcard
+
+        contact = vcf if isinstance(vcf, dict) else parse_vcard(vcf)
+        return serialize_qp_vcard(contact).encode('ascii')
 
 
 def export_to_vcf(location, vc):
@@ -259,6 +1188,8 @@ def append_to_vcf(location, vc):
 
 
 if __name__ == '__main__':
+    from unidecode import unidecode
+
     source = Path('sample') / 'export'
     target = Path('sample') / 'processed'
 
@@ -271,4 +1202,5 @@ if __name__ == '__main__':
                 output_file.write(quoted_printable(value))
     else:
         debug_object = ContactList(str(source), is_dir=False)
-        debug_object.find_duplicates()
+        for cluster in debug_object.find_duplicates():
+            print(f'... consider as duplicates {cluster["ids"]} ({", ".join(cluster["reasons"])})')
@@ -0,0 +1 @@
+"""Performance benchmarks, run from the repository root with python -m benchmarks.<name>."""
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Reloading a library from a columnar snapshot against parsing its vCards again.
+
+CSV is always measured, Arrow IPC and Parquet when pyarrow is installed.
+
+Run with:
+    python -m benchmarks.bench_columnar [number of contacts]
+"""
+
+import io
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from benchmarks.bench_store import synthetic_contacts
+from Contact import ContactList
+from vcf_writer import write_vcards
+
+SUFFIXES = {'arrow': '.arrow', 'parquet': '.parquet', 'csv': '.csv'}
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def table_formats() -> list:
+    """Formats that can be written here, pyarrow ones only when it imports."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return ['csv']
+    return list(SUFFIXES)
+
+
+def load_snapshot(path) -> int:
+    with redirect_stdout(io.StringIO()):  # the hint for an empty location
+        contacts_lib = ContactList('', fast=True)
+    return contacts_lib.load_table(path)
+
+
+def measure(count: int) -> dict:
+    """Seconds to load count contacts from one .vcf file (fast parser and vobject) and from each snapshot."""
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / 'all.vcf'
+        write_vcards(synthetic_contacts(count), source)
+        result = {
+            'contacts': count,
+            'vcf_fast_seconds': timed(lambda: ContactList(str(source), fast=True)),
+            'vcf_vobject_seconds': timed(lambda: ContactList(str(source))),
+        }
+        contacts_lib = ContactList(str(source), fast=True)
+        for name in table_formats():
+            path = Path(directory) / f'snapshot{SUFFIXES[name]}'
+            result[f'{name}_export_seconds'] = timed(lambda: contacts_lib.export_table(path))
+            result[f'{name}_bytes'] = path.stat().st_size
+            result[f'{name}_load_seconds'] = timed(lambda: load_snapshot(path))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    result = measure(count)
+    print(f"{result['contacts']} contacts")
+    print(f"parse .vcf: {result['vcf_fast_seconds']:.2f} s fast, {result['vcf_vobject_seconds']:.2f} s vobject")
+    for name in table_formats():
+        load = result[f'{name}_load_seconds']
+        print(f"{name}: export {result[f'{name}_export_seconds']:.2f} s, {result[f'{name}_bytes'] / 2 ** 20:.1f} MB, "
+              f"load {load:.2f} s ({result['vcf_fast_seconds'] / load:.1f}x the fast parser)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""A library kept in SQLite: importing into it, reopening it and browsing it against parsing the vCards.
+
+Run with:
+    python -m benchmarks.bench_database [number of contacts]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_store import synthetic_contacts
+from Contact import ContactList
+from vcf_writer import write_vcards
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def measure(count: int, queries: int = 100) -> dict:
+    """Seconds to parse count contacts into memory and into a database, to reopen it and to use its views."""
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / 'all.vcf'
+        library = Path(directory) / 'library.sqlite'
+        write_vcards(synthetic_contacts(count), source)
+        parse_seconds = timed(lambda: ContactList(str(source), fast=True))
+        contacts_lib = ContactList('', fast=True, database=library)
+        import_seconds = timed(lambda: contacts_lib.open_vcf(str(source)))
+        contacts_lib.database.close()
+        opened = []
+        reopen_seconds = timed(lambda: opened.append(ContactList(str(library))))
+        contacts_lib = opened[0]
+        words = ['ja', 'novak', 'eva', 'pra', '777']
+        query_seconds = timed(lambda: [contacts_lib.query(words[number % len(words)]) for number in range(queries)])
+        page_seconds = timed(lambda: contacts_lib.page(start=count // 2))
+        sort_seconds = timed(lambda: contacts_lib.page(sort='family_name'))
+        result = {
+            'contacts': count,
+            'parse_seconds': parse_seconds,
+            'import_seconds': import_seconds,
+            'reopen_seconds': reopen_seconds,
+            'query_ms': query_seconds / queries * 1000,
+            'page_ms': page_seconds * 1000,
+            'sort_seconds': sort_seconds,
+            'bytes': library.stat().st_size,
+        }
+        contacts_lib.database.close()
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    result = measure(count)
+    print(f"{result['contacts']} contacts, {result['bytes'] / 2 ** 20:.1f} MB database")
+    print(f"parse .vcf into memory: {result['parse_seconds']:.2f} s, into the database: {result['import_seconds']:.2f} s")
+    print(f"reopen the database: {result['reopen_seconds'] * 1000:.1f} ms")
+    print(f"search: {result['query_ms']:.2f} ms, page in the middle: {result['page_ms']:.2f} ms, "
+          f"first sort by family name: {result['sort_seconds']:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
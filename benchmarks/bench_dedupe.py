@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Duplicate detection throughput and recall on a synthetic library with injected duplicates.
+
+Run with:
+    python -m benchmarks.bench_dedupe [number of contacts]
+"""
+
+import random
+import sys
+import time
+
+from dedupe import find_duplicates
+
+SYLLABLES = ['no', 'vak', 'dvo', 'rak', 'sve', 'to', 'pro', 'cha', 'zka', 'kre', 'jci', 'ma', 'rek', 'li',
+             'bor', 'han', 'ze', 'le', 'ny', 'kov', 'ster', 'ber', 'mil', 'ler', 'jan', 'sen', 'wat', 'son']
+GIVEN = ['Jan', 'Petr', 'Pavel', 'Tomáš', 'Jiří', 'Marie', 'Jana', 'Eva', 'Hana', 'Lucie', 'Zdeněk', 'Anna',
+         'John', 'Mary', 'James', 'Linda', 'Olga', 'Ivan', 'Sergey', 'Elena', 'Martin', 'Lenka', 'Karel', 'Věra']
+
+
+def synthetic_library(count: int, duplicate_rate: float = 0.05, seed: int = 0):
+    """Return ({id: contact}, [(original id, duplicate id)]) with variants of some contacts injected."""
+    rnd = random.Random(seed)
+    contacts, pairs = {}, []
+    index = 0
+    while index < count:
+        index += 1
+        family = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))).capitalize()
+        given = rnd.choice(GIVEN)
+        phone = f'7{rnd.randrange(10 ** 8):08d}'
+        contact = {
+            'full_name': f'{given} {family}', 'given_name': given, 'family_name': family,
+            'phone_numbers': [f'+420 {phone[:3]} {phone[3:6]} {phone[6:]}'],
+            'emails': [f'{given}.{family}{index}@example.com'.lower()],
+            'addresses': [], 'organization': None, 'job_title': None, 'birthday': None, 'notes': None,
+        }
+        contacts[index] = contact
+        if rnd.random() < duplicate_rate and index < count:
+            index += 1
+            variant = dict(contact)
+            change = rnd.randrange(3)
+            if change == 0:  # reversed name order, national phone format
+                variant['full_name'] = f'{family} {given}'
+                variant['phone_numbers'] = [phone]
+            elif change == 1:  # typo in the name, other phone, same email
+                position = rnd.randrange(1, len(family))
+                variant['full_name'] = f'{given} {family[:position]}{family[position + 1:]}'
+                variant['phone_numbers'] = []
+            else:  # diacritics dropped, no email
+                variant['full_name'] = variant['full_name'].replace('á', 'a').replace('ě', 'e').replace('ř', 'r')
+                variant['emails'] = []
+            contacts[index] = variant
+            pairs.append((index - 1, index))
+    return contacts, pairs
+
+
+def measure(count: int) -> dict:
+    """Time find_duplicates and check how many injected duplicates it found."""
+    contacts, pairs = synthetic_library(count)
+    start = time.perf_counter()
+    clusters = find_duplicates(contacts)
+    elapsed = time.perf_counter() - start
+    cluster_of = {key: number for number, cluster in enumerate(clusters) for key in cluster['ids']}
+    found = sum(1 for first, second in pairs if first in cluster_of and cluster_of.get(first) == cluster_of.get(second))
+    return {
+        'contacts': len(contacts), 'seconds': elapsed, 'contacts_per_second': len(contacts) / elapsed,
+        'clusters': len(clusters), 'recall': found / len(pairs) if pairs else 1.0,
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    result = measure(count)
+    print(f"{result['contacts']} contacts in {result['seconds']:.1f} s ({result['contacts_per_second']:.0f} contacts/s)")
+    print(f"{result['clusters']} clusters, recall of injected duplicates {result['recall']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Export throughput of the bulk writer against the former vobject serialization, and of every output format.
+
+Run with:
+    python -m benchmarks.bench_export [number of contacts]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_store import synthetic_contacts
+from Contact import create_vcard
+from serializers import SERIALIZERS, serializer_for
+from vcf_writer import serialize_vcard, write_vcard_files, write_vcards
+
+
+def vobject_serialize(contact: dict) -> str:
+    """Former export path, addresses are left out since create_vcard cannot serialize them."""
+    return create_vcard(dict(contact, addresses=[])).serialize()
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def measure(count: int, vobject_sample: int = 5000) -> dict:
+    """Seconds to serialize, stream and write single files for count contacts."""
+    contacts = list(synthetic_contacts(count))
+    sample = contacts[:vobject_sample]
+    with tempfile.TemporaryDirectory() as directory:
+        stream_seconds = timed(lambda: write_vcards(contacts, Path(directory) / 'all.vcf'))
+        stream_bytes = (Path(directory) / 'all.vcf').stat().st_size
+        files_seconds = timed(lambda: write_vcard_files(contacts, directory))
+        formats = {name: timed(lambda: serializer_for(name).write(contacts, Path(directory) / name))
+                   for name in SERIALIZERS}
+    return {
+        'contacts': count,
+        'serialize_per_second': len(sample) / timed(lambda: [serialize_vcard(c) for c in sample]),
+        'vobject_per_second': len(sample) / timed(lambda: [vobject_serialize(c) for c in sample]),
+        'stream_seconds': stream_seconds,
+        'stream_mb_per_second': stream_bytes / stream_seconds / 2 ** 20,
+        'files_seconds': files_seconds,
+        **{f'{name}_per_second': count / seconds for name, seconds in formats.items()},
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    result = measure(count)
+    print(f"{result['contacts']} contacts")
+    print(f"serialize: {result['serialize_per_second']:.0f} cards/s (vobject {result['vobject_per_second']:.0f} cards/s)")
+    print(f"single stream: {result['stream_seconds']:.1f} s ({result['stream_mb_per_second']:.0f} MB/s)")
+    print(f"one file per contact: {result['files_seconds']:.1f} s")
+    for name in SERIALIZERS:
+        print(f"{name} stream: {result[f'{name}_per_second']:.0f} cards/s")
+
+
+if __name__ == '__main__':
+    main()
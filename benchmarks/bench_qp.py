@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Quoted-printable export: the property-aware writer against the former whole-card encoding.
+
+The former quoted_printable() serialized a vobject card, encoded all of it with quopri and
+patched the N/FN headers with bytes.replace, it is kept here as legacy_quoted_printable.
+
+Run with:
+    python -m benchmarks.bench_qp [number of contacts]
+"""
+
+import io
+import sys
+import time
+from quopri import encodestring
+
+from benchmarks.corpus import corpus_contacts
+from Contact import create_vcard, quoted_printable
+from vcf_writer import write_qp_vcards
+
+
+def legacy_quoted_printable(vcf) -> bytes:
+    a = encodestring(vcf.serialize().encode('utf-8'))
+    a = a.replace(b'\nN:', b'\nN;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:')
+    a = a.replace(b'FN:', b'FN;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:')
+    a = a.replace(b';CHARSET=3DUTF-8:', b';ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:')
+    return a
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def measure(count: int, rounds: int = 3) -> dict:
+    """Cards per second of both encoders on the same vobject cards, and of the bulk writer on dictionaries."""
+    contacts = [contact for _, contact in corpus_contacts(count)]
+    cards = [create_vcard(contact) for contact in contacts]
+    buffer = bytearray(2 ** 20)
+    legacy = min(timed(lambda: [legacy_quoted_printable(card) for card in cards]) for _ in range(rounds))
+    current = min(timed(lambda: [quoted_printable(card) for card in cards]) for _ in range(rounds))
+    bulk = min(timed(lambda: write_qp_vcards(contacts, io.BytesIO(), buffer)) for _ in range(rounds))
+    return {
+        'contacts': count,
+        'legacy_per_second': count / legacy,
+        'quoted_printable_per_second': count / current,
+        'bulk_per_second': count / bulk,
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    result = measure(count)
+    print(f"{result['contacts']} contacts, vobject cards")
+    print(f"former quoted_printable: {result['legacy_per_second']:.0f} cards/s")
+    print(f"quoted_printable: {result['quoted_printable_per_second']:.0f} cards/s")
+    print(f"write_qp_vcards from dictionaries: {result['bulk_per_second']:.0f} cards/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Start-up cost of the library and the command line, measured with python -X importtime.
+
+Run with:
+    python -m benchmarks.bench_startup [runs] [--json]
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+STATEMENTS = {
+    'import_contact': 'import Contact',
+    'main_help': "import main; main.main(['--help'])",
+}
+HEAVY_MODULES = ('vobject', 'unidecode', 'dedupe', 'difflib', 'search_index', 'vcf_writer', 'gzip', 'tempfile',
+                 'concurrent.futures.process', 'argparse', 'subprocess', 'tkinter', 'streamlit')
+
+
+def import_times(statement: str) -> tuple:
+    """({module: cumulative microseconds}, total microseconds) of the imports done by statement in a fresh
+    interpreter, the total being the sum over the top level imports."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True,
+                            cwd=ROOT, timeout=120)
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    times, total = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        if not name.startswith('  '):  # nested imports are indented by two more spaces
+            total += int(cumulative)
+    return times, total
+
+
+def measure(runs: int = 5) -> dict:
+    """Best of runs start-up time of each statement in milliseconds and the heavy modules it imports."""
+    result = {}
+    for name, statement in STATEMENTS.items():
+        best = None
+        for _ in range(runs):
+            times, total = import_times(statement)
+            if best is None or total < best:
+                best = total
+        result[name] = {'milliseconds': best / 1000,
+                        'heavy_modules': [module for module in HEAVY_MODULES if module in times]}
+    return result
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if argument != '--json']
+    result = measure(int(arguments[0]) if arguments else 5)
+    if '--json' in sys.argv:
+        print(json.dumps(result))
+        return
+    for name, timing in result.items():
+        heavy = ', '.join(timing['heavy_modules']) or 'none'
+        print(f"{name}: {timing['milliseconds']:.1f} ms (heavy modules: {heavy})")
+
+
+if __name__ == '__main__':
+    main()
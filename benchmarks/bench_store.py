@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Memory of ContactStore against the former dict-of-dicts ContactList.dic.
+
+Run with:
+    python -m benchmarks.bench_store [number of contacts]
+"""
+
+import random
+import sys
+import tracemalloc
+
+from contact_store import ContactStore
+
+
+def synthetic_contacts(count: int, seed: int = 0):
+    """Contacts with realistic repetition of names, organizations and cities."""
+    rnd = random.Random(seed)
+    given = [f'Given{i}' for i in range(300)]
+    family = [f'Family{i}' for i in range(2000)]
+    organizations = [f'Organization {i} s.r.o.' for i in range(100)] + [None] * 50
+    cities = [f'City {i}, Region {i % 14}, {10000 + i}, Czechia' for i in range(500)]
+    for index in range(count):
+        first, last = rnd.choice(given), rnd.choice(family)
+        yield {
+            'full_name': f'{first} {last}',
+            'given_name': first,
+            'family_name': last,
+            'phone_numbers': [f'+420 7{rnd.randrange(10 ** 8):08d}' for _ in range(rnd.randint(1, 2))],
+            'emails': [f'{first}.{last}{index}@example.com'.lower()],
+            'addresses': [f'Street {rnd.randrange(300)}, {rnd.choice(cities)}'] if rnd.random() < 0.6 else [],
+            'organization': rnd.choice(organizations),
+            'job_title': rnd.choice(['Engineer', 'Manager', 'Sales', None]),
+            'birthday': f'19{rnd.randint(50, 99)}-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)}' if rnd.random() < 0.3 else None,
+            'notes': None,
+        }
+
+
+def traced_size(build) -> int:
+    """Bytes still allocated by the object build() returns."""
+    tracemalloc.start()
+    try:
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size
+
+
+def measure(count: int) -> dict:
+    """Traced bytes of both representations for the same synthetic contacts."""
+    dicts = traced_size(lambda: {index: contact for index, contact in enumerate(synthetic_contacts(count), start=1)})
+    store = traced_size(lambda: ContactStore(enumerate(synthetic_contacts(count), start=1)))
+    return {'contacts': count, 'dict_bytes': dicts, 'store_bytes': store, 'ratio': store / dicts}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    result = measure(count)
+    print(f"{result['contacts']} contacts")
+    print(f"  dict-of-dicts: {result['dict_bytes'] / 2 ** 20:8.1f} MB ({result['dict_bytes'] / count:.0f} B/contact)")
+    print(f"  ContactStore:  {result['store_bytes'] / 2 ** 20:8.1f} MB ({result['store_bytes'] / count:.0f} B/contact)")
+    print(f"  ratio:         {result['ratio']:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
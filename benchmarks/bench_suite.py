@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Throughput of ContactList on a synthetic corpus: load, parse, search, dedupe, export and peak RSS.
+
+Every layout is measured in a fresh interpreter, so the peak resident set size belongs to it alone.
+The results are printed (or written as JSON) and compared against a stored baseline, rates that
+fall more than the tolerance below it (or a peak RSS that grows above it) are regressions.
+
+Run with:
+    python -m benchmarks.bench_suite [--count N] [--layout single|files] [--fast] [--workers N] [--json]
+    python -m benchmarks.bench_suite --save-baseline    # store the results as benchmarks/baseline.json
+    python -m benchmarks.bench_suite --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from benchmarks.corpus import LAYOUTS, write_corpus
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+QUERIES = ('given12 family3', 'family1999', 'nov', 'алексеева', '+420 7', 'organization 5', 'example.com given5')
+QUERY_ROUNDS = 20  # times every query runs after the index is built
+TOLERANCE = 0.2  # allowed slowdown against the baseline
+LOWER_IS_BETTER = ('peak_rss_mb',)  # every other compared metric is a rate
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, None where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # bytes on macOS, KiB elsewhere
+
+
+def timed(function):
+    """(result, seconds) of calling function."""
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def measure(count: int, layout: str = 'single', fast: bool = False, workers: int = 1, seed: int = 0) -> dict:
+    """Metrics of one layout measured in this process."""
+    from Contact import ContactList, parse_vcf_bytes
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = write_corpus(directory, count, layout, seed)
+        path = corpus['path']
+        files = sorted(path.glob('*.vcf')) if layout == 'files' else [path]
+        raw = [(str(file), file.read_bytes()) for file in files]
+        start_rss = peak_rss_mb()
+        with redirect_stdout(io.StringIO()):  # progress lines of ContactList
+            contacts_lib, load_seconds = timed(lambda: ContactList(str(path), is_dir=layout == 'files', fast=fast,
+                                                                   workers=workers))
+    parsed, parse_seconds = timed(lambda: [parse_vcf_bytes(location, data, fast) for location, data in raw])
+    _, index_seconds = timed(lambda: contacts_lib.query(QUERIES[0]))
+    _, search_seconds = timed(lambda: [contacts_lib.query(text) for _ in range(QUERY_ROUNDS) for text in QUERIES])
+    clusters, dedupe_seconds = timed(contacts_lib.find_duplicates)
+    output = io.BytesIO()
+    _, export_seconds = timed(lambda: contacts_lib.export_stream(output))
+    cards = len(contacts_lib.dic)
+    peak = peak_rss_mb()
+    return {
+        'layout': layout, 'contacts': cards, 'files': corpus['files'], 'bytes': corpus['bytes'],
+        'errors': sum(len(errors) for _, errors in parsed),
+        'load_seconds': load_seconds, 'load_cards_per_second': cards / load_seconds,
+        'load_mb_per_second': corpus['bytes'] / 2 ** 20 / load_seconds,
+        'parse_cards_per_second': sum(len(contacts) for contacts, _ in parsed) / parse_seconds,
+        'index_seconds': index_seconds,
+        'search_queries_per_second': QUERY_ROUNDS * len(QUERIES) / search_seconds,
+        'dedupe_clusters': len(clusters), 'dedupe_cards_per_second': cards / dedupe_seconds,
+        'export_cards_per_second': cards / export_seconds,
+        'export_mb_per_second': len(output.getvalue()) / 2 ** 20 / export_seconds,
+        'peak_rss_mb': peak, 'start_rss_mb': start_rss,
+    }
+
+
+def run(count: int, layouts=LAYOUTS, fast: bool = False, workers: int = 1) -> dict:
+    """Measure every layout in a fresh interpreter, returns the JSON document with all results."""
+    results = {}
+    for layout in layouts:
+        command = [sys.executable, '-m', 'benchmarks.bench_suite', '--child', '--count', str(count), '--layout', layout,
+                   '--workers', str(workers)] + ['--fast'] * fast
+        child = subprocess.run(command, capture_output=True, text=True, cwd=ROOT, check=True)
+        results[layout] = json.loads(child.stdout)
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'count': count, 'fast': fast,
+            'workers': workers, 'results': results}
+
+
+def compare(current: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """Regressions of current against baseline as (layout, metric, baseline value, current value, change)."""
+    regressions = []
+    for layout, metrics in current['results'].items():
+        reference = baseline.get('results', {}).get(layout, {})
+        for metric, value in metrics.items():
+            if not (metric.endswith('_per_second') or metric in LOWER_IS_BETTER):
+                continue
+            if not reference.get(metric) or value is None:
+                continue
+            change = value / reference[metric] - 1
+            if (change > tolerance) if metric in LOWER_IS_BETTER else (change < -tolerance):
+                regressions.append((layout, metric, reference[metric], value, change))
+    return regressions
+
+
+def print_results(document: dict):
+    print(f"{document['count']} contacts, python {document['python']}, fast={document['fast']}, "
+          f"workers={document['workers']}")
+    for layout, metrics in document['results'].items():
+        print(f"{layout}: {metrics['files']} files, {metrics['bytes'] / 2 ** 20:.1f} MB, {metrics['errors']} errors")
+        for metric, value in metrics.items():
+            if isinstance(value, float):
+                print(f'  {metric:26} {value:12.1f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_suite', description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000, help='contacts in the corpus (default 20000)')
+    parser.add_argument('--layout', choices=LAYOUTS, action='append', help='default both')
+    parser.add_argument('--fast', action='store_true', help='native parser for the common fields')
+    parser.add_argument('--workers', type=int, default=1, help='parser processes (default 1)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--baseline', type=Path, help='compare against this results file')
+    parser.add_argument('--save-baseline', type=Path, nargs='?', const=BASELINE, help=f'default {BASELINE.name}')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help=f'default {TOLERANCE}')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        print(json.dumps(measure(args.count, args.layout[0], args.fast, args.workers)))
+        return 0
+    document = run(args.count, args.layout or LAYOUTS, args.fast, args.workers)
+    if args.json:
+        print(json.dumps(document, indent=2))
+    else:
+        print_results(document)
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(document, indent=2) + '\n', encoding='utf-8')
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        if (baseline.get('count'), baseline.get('fast'), baseline.get('workers')) != (args.count, args.fast, args.workers):
+            print(f"... baseline was measured with --count {baseline.get('count')}, fast={baseline.get('fast')}, "
+                  f"workers={baseline.get('workers')}, rates may differ for that alone", file=sys.stderr)
+        regressions = compare(document, baseline, args.tolerance)
+        for layout, metric, before, after, change in regressions:
+            print(f'... regression {layout} {metric}: {before:.1f} -> {after:.1f} ({change:+.0%})', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic vCard corpora for the benchmarks.
+
+The contacts of bench_store.synthetic_contacts are written as a mix of vCard 2.1, 3.0 and 4.0
+cards, some with Czech or Russian names; non-ASCII 2.1 values are quoted-printable encoded
+(CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE with soft line breaks) as phones export them.
+The same count and seed always give the same bytes.
+
+Run with:
+    python -m benchmarks.corpus DIRECTORY [number of contacts] [single|files]
+"""
+
+import random
+import sys
+from pathlib import Path
+from quopri import encodestring
+
+from benchmarks.bench_store import synthetic_contacts
+from vcf_writer import escape, file_names, fold
+
+VERSIONS = ('2.1', '3.0', '4.0')
+LAYOUTS = ('single', 'files')  # one .vcf with every card, or one .vcf per contact
+NON_ASCII_RATE = 0.3  # contacts renamed to a Czech or Russian name
+CZECH = [('Jiří', 'Dvořák'), ('Tomáš', 'Růžička'), ('Zdeněk', 'Šťastný'), ('Věra', 'Nováková'), ('Lenka', 'Černá')]
+RUSSIAN = [('Вагда', 'Алексеева'), ('Николай', 'Иванов'), ('Алия', 'Ермакова'), ('Сергей', 'Кузнецов')]
+
+
+def corpus_contacts(count: int, seed: int = 0):
+    """Yield (vCard version, contact) pairs, the contacts as parse_vcard is expected to return them."""
+    rnd = random.Random(seed)
+    for index, contact in enumerate(synthetic_contacts(count, seed)):
+        if rnd.random() < NON_ASCII_RATE:
+            given, family = rnd.choice(CZECH + RUSSIAN)
+            contact.update(full_name=f'{given} {family}', given_name=given, family_name=family)
+        contact['addresses'] = []  # left out, 2.1 and 4.0 write ADR differently
+        yield VERSIONS[index % len(VERSIONS)], contact
+
+
+def qp_property(name: str, value: str) -> str:
+    """A 2.1 property line, quoted-printable encoded when the value is not plain ASCII."""
+    if value.isascii():
+        return f'{name}:{value}\r\n'
+    encoded = encodestring(value.encode('utf-8')).decode('ascii').replace('=\n', '=\r\n')
+    return f'{name};CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:{encoded}\r\n'
+
+
+def corpus_card(version: str, contact: dict) -> str:
+    """One contact as a card of the given vCard version."""
+    name = f"{escape(contact['family_name'])};{escape(contact['given_name'])};;;"
+    if version == '2.1':
+        lines = [qp_property('N', name), qp_property('FN', escape(contact['full_name']))]
+        lines += [f'TEL;CELL:{number}\r\n' for number in contact['phone_numbers']]
+        lines += [f'EMAIL;INTERNET:{email}\r\n' for email in contact['emails']]
+        if contact['organization']:
+            lines.append(qp_property('ORG', escape(contact['organization'])))
+        if contact['job_title']:
+            lines.append(qp_property('TITLE', escape(contact['job_title'])))
+    else:
+        kind = 'CELL' if version == '3.0' else 'cell'
+        lines = [fold(f"FN:{escape(contact['full_name'])}"), fold(f'N:{name}')]
+        lines += [fold(f'TEL;TYPE={kind}:{number}') for number in contact['phone_numbers']]
+        lines += [fold(f'EMAIL;TYPE=INTERNET:{email}') for email in contact['emails']]
+        if contact['organization']:
+            lines.append(fold(f"ORG:{escape(contact['organization'])}"))
+        if contact['job_title']:
+            lines.append(fold(f"TITLE:{escape(contact['job_title'])}"))
+    if contact['birthday']:
+        lines.append(f"BDAY:{contact['birthday']}\r\n")
+    return f'BEGIN:VCARD\r\nVERSION:{version}\r\n{"".join(lines)}END:VCARD\r\n'
+
+
+def write_corpus(directory, count: int, layout: str = 'single', seed: int = 0) -> dict:
+    """Write a corpus of count contacts into directory, returns {'path', 'files', 'bytes', 'cards'}.
+    path is the .vcf file (single) or the directory of files (files) to load.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout {layout!r}, use 'single' or 'files'")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    pairs = list(corpus_contacts(count, seed))
+    size = 0
+    if layout == 'single':
+        path = directory / 'corpus.vcf'
+        with open(path, mode='wb') as output:
+            for version, contact in pairs:
+                size += output.write(corpus_card(version, contact).encode('utf-8'))
+        return {'path': path, 'files': 1, 'bytes': size, 'cards': count}
+    versions = dict((id(contact), version) for version, contact in pairs)
+    for file_name, contact in file_names(contact for _, contact in pairs):
+        size += (directory / file_name).write_bytes(corpus_card(versions[id(contact)], contact).encode('utf-8'))
+    return {'path': directory, 'files': count, 'bytes': size, 'cards': count}
+
+
+def main():
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    written = write_corpus(sys.argv[1], count, sys.argv[3] if len(sys.argv) > 3 else 'single')
+    print(f"{written['cards']} cards in {written['files']} files, {written['bytes'] / 2 ** 20:.1f} MB: {written['path']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Columnar snapshots of a contact library for analytics: Arrow IPC, Parquet and CSV.
+
+A snapshot has one row per contact, its ContactList index as 'id' and the parse_vcard fields
+as columns, phones, emails and addresses as lists of strings (JSON arrays in CSV cells,
+where an empty string reads back as None).
+Rows are converted and written in record batches of batch_rows, so memory stays bounded
+by one batch whatever the library size. Reading a snapshot back only copies strings, which
+is far faster than parsing the vCards again.
+
+Arrow and Parquet need the pyarrow package, imported on first use, CSV only the standard library.
+"""
+
+import csv
+import json
+import os
+from io import TextIOWrapper
+from itertools import repeat
+from pathlib import Path
+
+from contact_store import FIELD_ORDER
+
+FORMATS = {'.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow', '.parquet': 'parquet', '.csv': 'csv'}
+TABLE_SUFFIXES = tuple(FORMATS)
+LIST_FIELDS = ('phone_numbers', 'emails', 'addresses')
+BATCH_ROWS = 65536  # contacts converted and written at once
+
+
+def load_pyarrow():
+    """The pyarrow module, with a hint when it is missing."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('... Arrow and Parquet files need the pyarrow package (pip install pyarrow)') from None
+    return pyarrow
+
+
+def table_format(path, name: str = None) -> str:
+    """Format asked for, else the one of the suffix of path: 'arrow', 'parquet' or 'csv'."""
+    name = name or FORMATS.get(Path(str(path)).suffix.lower())
+    if name not in ('arrow', 'parquet', 'csv'):
+        raise ValueError(f'unknown table format of {path}, use .arrow, .feather, .parquet or .csv')
+    return name
+
+
+def arrow_schema(pyarrow):
+    return pyarrow.schema([('id', pyarrow.int64())] + [
+        (field, pyarrow.list_(pyarrow.string()) if field in LIST_FIELDS else pyarrow.string())
+        for field in FIELD_ORDER])
+
+
+def column_batches(items, batch_rows: int = BATCH_ROWS):
+    """Yield {'id': [...], field: [...]} columns of at most batch_rows (key, contact) pairs,
+    values as strings or None, list fields as lists of strings.
+    """
+    columns = None
+    for key, contact in items:
+        if columns is None:
+            columns = {'id': [], **{field: [] for field in FIELD_ORDER}}
+        columns['id'].append(key)
+        for field in FIELD_ORDER:
+            value = contact.get(field)
+            if field in LIST_FIELDS:
+                value = [value] if isinstance(value, str) else [str(item) for item in value or ()]
+            elif value is not None:
+                value = str(value)
+            columns[field].append(value)
+        if len(columns['id']) >= batch_rows:
+            yield columns
+            columns = None
+    if columns:
+        yield columns
+
+
+def contacts_of(columns: dict, rows: int):
+    """Yield parse_vcard dictionaries from {field: values} columns, a missing field as None (lists as [])."""
+    values = [columns.get(field) or repeat(None, rows) for field in FIELD_ORDER]
+    for row in zip(*values):
+        contact = dict(zip(FIELD_ORDER, row))
+        for field in LIST_FIELDS:
+            if contact[field] is None:
+                contact[field] = []
+        yield contact
+
+
+def write_csv(items, text, batch_rows: int = BATCH_ROWS) -> int:
+    """Write (key, contact) pairs as CSV rows into a text stream, list fields as JSON arrays. Returns the row count."""
+    writer = csv.writer(text)
+    writer.writerow(('id',) + FIELD_ORDER)
+    count = 0
+    for columns in column_batches(items, batch_rows):
+        for field in LIST_FIELDS:
+            columns[field] = [json.dumps(values, ensure_ascii=False) for values in columns[field]]
+        writer.writerows(zip(*columns.values()))
+        count += len(columns['id'])
+    return count
+
+
+def write_table(items, output, name: str = None, batch_rows: int = BATCH_ROWS) -> int:
+    """Write (key, contact) pairs into an Arrow IPC, Parquet or CSV file: a path, or a binary file object
+    with the format named. Returns the row count.
+    """
+    is_path = isinstance(output, (str, os.PathLike))
+    name = table_format(output if is_path else '', name)
+    if name == 'csv':
+        if is_path:
+            with open(output, mode='w', encoding='utf-8', newline='') as text:
+                return write_csv(items, text, batch_rows)
+        text = TextIOWrapper(output, encoding='utf-8', newline='')
+        try:
+            return write_csv(items, text, batch_rows)
+        finally:
+            text.detach()  # flushed, the stream of the caller stays open
+    pyarrow = load_pyarrow()
+    schema = arrow_schema(pyarrow)
+    sink = str(output) if is_path else output
+    if name == 'parquet':
+        from pyarrow import parquet
+        writer = parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_file(sink, schema)
+    count = 0
+    with writer:
+        for columns in column_batches(items, batch_rows):
+            writer.write_batch(pyarrow.RecordBatch.from_pydict(columns, schema=schema))
+            count += len(columns['id'])
+    return count
+
+
+def batch_columns(batch) -> dict:
+    """{field: Python values} of the known columns of a record batch."""
+    names = batch.schema.names
+    return {field: batch.column(names.index(field)).to_pylist() for field in FIELD_ORDER if field in names}
+
+
+def read_table(path, name: str = None, batch_rows: int = BATCH_ROWS):
+    """Yield the contacts of an Arrow IPC, Parquet or CSV snapshot one batch at a time, the ids are left out."""
+    name = table_format(path, name)
+    if name == 'csv':
+        with open(path, encoding='utf-8', newline='') as text:
+            for row in csv.DictReader(text):
+                yield {field: (json.loads(row[field]) if row.get(field) else []) if field in LIST_FIELDS
+                       else row.get(field) or None for field in FIELD_ORDER}
+        return
+    pyarrow = load_pyarrow()
+    if name == 'parquet':
+        from pyarrow import parquet
+        for batch in parquet.ParquetFile(str(path)).iter_batches(batch_size=batch_rows):
+            yield from contacts_of(batch_columns(batch), batch.num_rows)
+        return
+    with pyarrow.memory_map(str(path)) as source:
+        reader = pyarrow.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            yield from contacts_of(batch_columns(batch), batch.num_rows)
+
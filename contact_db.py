@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""Persistent contact library in SQLite, opened without parsing anything.
+
+ContactDatabase keeps the contacts of a ContactList under stable ids together with what is derived
+from them: normalized phone numbers and emails in indexed tables, and the search tokens of names,
+emails, phones and notes in an FTS5 table. ContactTable is the lazy mapping facade standing in for
+ContactList.dic: a contact is read from disk when asked for, and new contacts are written in
+batches of batch_rows, one transaction per batch. The database runs in WAL mode, so another
+process can read the library while it is being loaded.
+"""
+
+import json
+import sqlite3
+from collections.abc import ItemsView, MutableMapping, Sequence, ValuesView
+
+from contact_store import FIELD_ORDER
+from phones import DEFAULT_COUNTRY, calling_code, normalize
+
+DATABASE_VERSION = 2  # user_version of the schema, a library of another version is not opened
+BATCH_ROWS = 10000  # contacts written per transaction
+ANCHOR_ROWS = 1024  # KeySequence remembers every this many-th id, pages start from the nearest one
+LIST_FIELDS = ('phone_numbers', 'emails', 'addresses')  # stored as JSON arrays
+SEARCH_NAMES = ('full_name', 'given_name', 'family_name', 'organization')  # the names column of search
+COLUMNS = ', '.join(FIELD_ORDER)
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS contacts (id INTEGER PRIMARY KEY AUTOINCREMENT, {COLUMNS});
+    CREATE TABLE IF NOT EXISTS phones (number TEXT NOT NULL, id INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS emails (address TEXT NOT NULL, id INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, state TEXT);
+    CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+    CREATE INDEX IF NOT EXISTS phones_number ON phones (number);
+    CREATE INDEX IF NOT EXISTS phones_id ON phones (id);
+    CREATE INDEX IF NOT EXISTS emails_address ON emails (address);
+    CREATE INDEX IF NOT EXISTS emails_id ON emails (id);
+'''
+SEARCH_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(names, emails, phones, notes, prefix='2')"
+
+
+def list_value(value) -> list:
+    """Values of a multi-valued field, a single string as a list of one."""
+    return [value] if isinstance(value, str) else [str(item) for item in value or ()]
+
+
+def contact_of(row) -> dict:
+    """parse_vcard dictionary of a contacts row without its id."""
+    contact = dict(zip(FIELD_ORDER, row))
+    for field in LIST_FIELDS:
+        contact[field] = json.loads(contact[field]) if contact[field] else []
+    return contact
+
+
+def normalize_email(address: str):
+    """Lookup form of an email address, None for an empty one."""
+    return address.strip().casefold() or None
+
+
+class ContactDatabase:
+    """SQLite file holding a contact library: ContactTable for ContactList.dic, PhoneTable for ContactList.phones,
+    FileTable for ContactList.manifest, plus the loaded directories and the country phone numbers are normalized for.
+    Nothing is parsed or read in full when it is opened. Without a country the stored one is kept (DEFAULT_COUNTRY
+    for a new library), another country given explicitly normalizes the stored numbers again.
+    """
+
+    def __init__(self, path, country: str = None, batch_rows: int = BATCH_ROWS):
+        if country is not None:
+            calling_code(country)  # fail early on an unknown country
+        self.path = str(path)
+        try:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f'{self.path} is no contact library: {e}') from None
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, DATABASE_VERSION):
+            self.connection.close()
+            raise ValueError(f'{self.path} is a contact library of version {version}, '
+                             f'this one reads version {DATABASE_VERSION}')
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.execute(SEARCH_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:  # SQLite built without FTS5, ContactList searches in memory then
+            self.fts = False
+        self.connection.execute(f'PRAGMA user_version={DATABASE_VERSION}')
+        self.connection.commit()
+        self.contacts = ContactTable(self, batch_rows)
+        self.phones = PhoneTable(self)
+        self.files = FileTable(self.connection)
+        self.directories = self.get('directories', [])
+        self.country = self.get('country', country or DEFAULT_COUNTRY)
+        if country is not None and self.country != country:  # asked for explicitly, not just the default
+            self.reindex_phones(country)
+
+    def get(self, name: str, default=None):
+        """Stored setting, default when there is none."""
+        row = self.connection.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, name: str, value) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (name, json.dumps(value)))
+
+    def reindex_phones(self, country: str) -> None:
+        """Normalize every stored phone number again for another default country."""
+        self.contacts.write_pending()
+        self.country = country
+        self.connection.execute('DELETE FROM phones')
+        self.connection.executemany('INSERT INTO phones VALUES (?, ?)', (
+            (number, key) for key, numbers in self.connection.execute(
+                'SELECT id, phone_numbers FROM contacts WHERE phone_numbers IS NOT NULL').fetchall()
+            for number in self.contacts.numbers(json.loads(numbers))))
+        self.set('country', country)
+        self.connection.commit()
+
+    def search(self, text: str, limit: int = 20) -> list:
+        """Ids of contacts having every term of text as a word or word prefix (SearchIndex tokens), best first."""
+        from search_index import query_terms
+
+        terms = query_terms(text)
+        if not terms or limit <= 0:
+            return []
+        self.contacts.write_pending()
+        match = ' AND '.join(f'"{term}"*' for term in terms)  # terms are [a-z0-9]+
+        return [row[0] for row in self.connection.execute(
+            'SELECT rowid FROM search WHERE search MATCH ? ORDER BY rank LIMIT ?', (match, limit))]
+
+    def email_owners(self, address: str) -> list:
+        """Ids of the contacts having the email address, in any case."""
+        self.contacts.write_pending()
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT id FROM emails WHERE address = ? ORDER BY id', (normalize_email(address),))]
+
+    def commit(self) -> None:
+        """Write the pending contacts and settings."""
+        self.contacts.write_pending()
+        self.set('directories', self.directories)
+        self.set('country', self.country)
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    def __repr__(self) -> str:
+        return f'ContactDatabase({self.path!r}, {len(self.contacts)} contacts)'
+
+
+class ContactTable(MutableMapping):
+    """Lazy mapping id -> contact over the contacts table, in place of the in-memory ContactStore.
+    Reading a key materializes a fresh contact dictionary, changes have to be written back with table[key] = contact.
+    New contacts wait in pending until batch_rows of them are written in one transaction, or until a read needs them.
+    """
+    __slots__ = ('database', 'connection', 'batch_rows', 'pending', 'top')
+
+    def __init__(self, database: ContactDatabase, batch_rows: int = BATCH_ROWS):
+        self.database = database
+        self.connection = database.connection
+        self.batch_rows = batch_rows
+        self.pending = {}  # id -> contact not written yet
+        # the highest id ever stored, ids of deleted contacts are not given out again
+        self.top = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence "
+                                           "WHERE name = 'contacts'").fetchone()[0]
+
+    def numbers(self, phone_numbers: list) -> tuple:
+        """Distinct normalized numbers of a contact, as PhoneIndex keeps them."""
+        country = self.database.country
+        return tuple(dict.fromkeys(filter(None, (normalize(number, country) for number in phone_numbers))))
+
+    def write_pending(self) -> None:
+        """Write the pending contacts with their phones, emails and search tokens, without committing."""
+        if not self.pending:
+            return
+        from search_index import phone_tokens, text_tokens
+
+        country = self.database.country
+        rows, phones, emails, search = [], [], [], []
+        replaced = [(key,) for key in self.pending if type(key) is not int or key <= self.top]
+        for key, contact in self.pending.items():
+            lists = {field: list_value(contact.get(field)) for field in LIST_FIELDS}
+            row = [key]
+            for field in FIELD_ORDER:
+                value = lists[field] if field in LIST_FIELDS else contact.get(field)
+                if field in LIST_FIELDS:
+                    value = json.dumps(value, ensure_ascii=False) if value else None
+                elif value is not None:
+                    value = str(value)
+                row.append(value)
+            rows.append(row)
+            phones += ((number, key) for number in self.numbers(lists['phone_numbers']))
+            emails += ((address, key) for address in dict.fromkeys(filter(None, map(normalize_email, lists['emails']))))
+            if self.database.fts:
+                search.append((key,
+                               ' '.join(token for field in SEARCH_NAMES for token in text_tokens(contact.get(field))),
+                               ' '.join(token for email in lists['emails'] for token in text_tokens(email)),
+                               ' '.join(token for number in lists['phone_numbers']
+                                        for token in phone_tokens(number, country)),
+                               ' '.join(text_tokens(contact.get('notes')))))
+        if replaced:
+            self.delete_derived(replaced)
+        self.connection.executemany(f"INSERT OR REPLACE INTO contacts VALUES (?{', ?' * len(FIELD_ORDER)})", rows)
+        self.connection.executemany('INSERT INTO phones VALUES (?, ?)', phones)
+        self.connection.executemany('INSERT INTO emails VALUES (?, ?)', emails)
+        if search:
+            self.connection.executemany('INSERT INTO search (rowid, names, emails, phones, notes) '
+                                        'VALUES (?, ?, ?, ?, ?)', search)
+        self.top = max([self.top, *(key for key in self.pending if type(key) is int)])
+        self.pending.clear()
+
+    def delete_derived(self, keys: list) -> None:
+        """Drop the phones, emails and search tokens of [(id,)]."""
+        self.connection.executemany('DELETE FROM phones WHERE id = ?', keys)
+        self.connection.executemany('DELETE FROM emails WHERE id = ?', keys)
+        if self.database.fts:
+            self.connection.executemany('DELETE FROM search WHERE rowid = ?', keys)
+
+    def flush(self) -> None:
+        """Write the pending contacts and commit them in one transaction."""
+        self.write_pending()
+        self.connection.commit()
+
+    def field(self, key, field: str):
+        """One field of the contact stored under key, without materializing the others."""
+        if field not in FIELD_ORDER:
+            raise KeyError(field)
+        self.write_pending()
+        row = self.connection.execute(f'SELECT {field} FROM contacts WHERE id = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return (json.loads(row[0]) if row[0] else []) if field in LIST_FIELDS else row[0]
+
+    def field_values(self, field: str):
+        """Yield (id, value) of one field for every contact in id order."""
+        if field not in FIELD_ORDER:
+            raise KeyError(field)
+        self.write_pending()
+        for key, value in self.connection.execute(f'SELECT id, {field} FROM contacts ORDER BY id'):
+            yield key, (json.loads(value) if value else []) if field in LIST_FIELDS else value
+
+    def key_sequence(self) -> 'KeySequence':
+        """Ids in order as an indexable sequence read page by page."""
+        return KeySequence(self.connection, len(self))
+
+    @property
+    def size(self) -> int:
+        """Rows stored, replaced and deleted rows leave no garbage here unlike in ContactStore."""
+        return len(self)
+
+    def compact(self) -> None:
+        """Nothing to drop, see size."""
+
+    def __getitem__(self, key) -> dict:
+        if key in self.pending:
+            self.write_pending()
+        row = self.connection.execute(f'SELECT {COLUMNS} FROM contacts WHERE id = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return contact_of(row)
+
+    def __setitem__(self, key, contact: dict) -> None:
+        self.pending[key] = contact
+        if len(self.pending) >= self.batch_rows:
+            self.flush()
+
+    def __delitem__(self, key) -> None:
+        self.write_pending()
+        if self.connection.execute('DELETE FROM contacts WHERE id = ?', (key,)).rowcount == 0:
+            raise KeyError(key)
+        self.delete_derived([(key,)])
+
+    def __contains__(self, key) -> bool:
+        if key in self.pending:
+            return True
+        try:
+            return self.connection.execute('SELECT 1 FROM contacts WHERE id = ?', (key,)).fetchone() is not None
+        except sqlite3.Error:  # a key SQLite cannot bind
+            return False
+
+    def __iter__(self):
+        self.write_pending()
+        return (row[0] for row in self.connection.execute('SELECT id FROM contacts ORDER BY id'))
+
+    def __len__(self) -> int:
+        self.write_pending()
+        return self.connection.execute('SELECT COUNT(*) FROM contacts').fetchone()[0]
+
+    def items(self):
+        return ContactItems(self)
+
+    def values(self):
+        return ContactValues(self)
+
+    def rows(self):
+        """Yield (id, contact) of every contact in id order from one query."""
+        self.write_pending()
+        for row in self.connection.execute(f'SELECT id, {COLUMNS} FROM contacts ORDER BY id'):
+            yield row[0], contact_of(row[1:])
+
+    def clear(self) -> None:
+        self.pending.clear()
+        self.connection.executescript('DELETE FROM contacts; DELETE FROM phones; DELETE FROM emails;')
+        if self.database.fts:
+            self.connection.execute('DELETE FROM search')
+        self.connection.commit()
+
+    def __repr__(self) -> str:
+        return f'ContactTable({len(self)} contacts in {self.database.path!r})'
+
+
+class ContactItems(ItemsView):
+    """items() of a ContactTable, iterated with one query instead of one per key."""
+
+    def __iter__(self):
+        return self._mapping.rows()
+
+
+class ContactValues(ValuesView):
+    """values() of a ContactTable, iterated with one query instead of one per key."""
+
+    def __iter__(self):
+        return (contact for _, contact in self._mapping.rows())
+
+
+class KeySequence(Sequence):
+    """Ids of the contacts table in order at the time it was made, read as they are shown.
+    Pages are found by id (WHERE id > ?) instead of OFFSET, which would walk every row before them: the next
+    page starts after the last id read, any other one from the nearest of the ids at every ANCHOR_ROWS-th position.
+    """
+    __slots__ = ('connection', 'length', 'anchors', 'end')
+
+    def __init__(self, connection, length: int):
+        self.connection = connection
+        self.length = length
+        self.anchors = None  # ids at positions 0, ANCHOR_ROWS, 2 * ANCHOR_ROWS, ..., read when first needed
+        self.end = (0, None)  # (position, id before it) after the last page read
+
+    def ids(self, start: int, count: int) -> list:
+        """count ids from position start on."""
+        if start == self.end[0] and self.end[1] is not None:
+            rows = self.connection.execute('SELECT id FROM contacts WHERE id > ? ORDER BY id LIMIT ?',
+                                           (self.end[1], count))
+        elif start < ANCHOR_ROWS:
+            rows = self.connection.execute('SELECT id FROM contacts ORDER BY id LIMIT ? OFFSET ?', (count, start))
+        else:
+            if self.anchors is None:
+                self.anchors = [row[0] for row in self.connection.execute(
+                    'SELECT id FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS position FROM contacts) '
+                    'WHERE position % ? = 0', (ANCHOR_ROWS,))]
+            block = min(start // ANCHOR_ROWS, len(self.anchors) - 1)
+            rows = self.connection.execute('SELECT id FROM contacts WHERE id >= ? ORDER BY id LIMIT ? OFFSET ?',
+                                           (self.anchors[block], count, start - block * ANCHOR_ROWS))
+        ids = [row[0] for row in rows]
+        if ids:
+            self.end = (start + len(ids), ids[-1])
+        return ids
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step != 1:
+                return [self[position] for position in range(start, stop, step)]
+            return self.ids(start, stop - start) if stop > start else []
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        ids = self.ids(index, 1)
+        if not ids:
+            raise IndexError(index)
+        return ids[0]
+
+    def index(self, key, start: int = 0, stop: int = None) -> int:
+        """Position of key, counted on the primary key instead of walking the sequence."""
+        found = self.connection.execute('SELECT COUNT(*), EXISTS(SELECT 1 FROM contacts WHERE id = ?) '
+                                        'FROM contacts WHERE id < ?', (key, key)).fetchone()
+        stop = self.length if stop is None else stop
+        if not found[1] or not start <= found[0] < stop:
+            raise ValueError(f'{key!r} is not in the sequence')
+        return found[0]
+
+    def __iter__(self):
+        return (row[0] for row in self.connection.execute('SELECT id FROM contacts ORDER BY id LIMIT ?',
+                                                          (self.length,)))
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class PhoneTable:
+    """The phones table in place of the in-memory PhoneIndex of ContactList.
+    Its rows are written and deleted by ContactTable together with the contacts, add() and remove() have nothing to do.
+    """
+    __slots__ = ('database',)
+
+    def __init__(self, database: ContactDatabase):
+        self.database = database
+
+    @property
+    def country(self) -> str:
+        return self.database.country
+
+    def add(self, key, phone_numbers) -> None:
+        """Written with the contact."""
+
+    def remove(self, key) -> None:
+        """Deleted with the contact."""
+
+    def lookup(self, number) -> list:
+        """Ids of the contacts having number, in any format."""
+        self.database.contacts.write_pending()
+        return [row[0] for row in self.database.connection.execute(
+            'SELECT id FROM phones WHERE number = ? ORDER BY id', (normalize(number, self.country),))]
+
+    @property
+    def numbers(self) -> dict:
+        """{contact id: normalized numbers} read in one query, as PhoneIndex.numbers."""
+        self.database.contacts.write_pending()
+        numbers = {}
+        for number, key in self.database.connection.execute('SELECT number, id FROM phones ORDER BY id, rowid'):
+            numbers[key] = numbers.get(key, ()) + (number,)
+        return numbers
+
+    @property
+    def owners(self) -> dict:
+        """{normalized number: contact ids} read in one query, as PhoneIndex.owners."""
+        self.database.contacts.write_pending()
+        owners = {}
+        for number, key in self.database.connection.execute('SELECT number, id FROM phones ORDER BY id'):
+            owners.setdefault(number, []).append(key)
+        return owners
+
+    def __len__(self) -> int:
+        self.database.contacts.write_pending()
+        return self.database.connection.execute('SELECT COUNT(DISTINCT number) FROM phones').fetchone()[0]
+
+
+class FileTable(MutableMapping):
+    """Mapping file path -> {'mtime', 'size', 'hash', 'ids'} over the files table, in place of ContactList.manifest.
+    A state read from it is a copy, changes have to be written back with table[path] = state.
+    """
+    __slots__ = ('connection',)
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __getitem__(self, path) -> dict:
+        row = self.connection.execute('SELECT state FROM files WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return json.loads(row[0])
+
+    def __setitem__(self, path, state: dict) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (path, json.dumps(state)))
+
+    def __delitem__(self, path) -> None:
+        if self.connection.execute('DELETE FROM files WHERE path = ?', (path,)).rowcount == 0:
+            raise KeyError(path)
+
+    def __iter__(self):
+        return iter([row[0] for row in self.connection.execute('SELECT path FROM files ORDER BY rowid')])
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
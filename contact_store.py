@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Compact columnar storage for ContactList.dic."""
+
+from array import array
+from collections.abc import MutableMapping
+
+# parse_vcard key order, kept when a contact is materialized back into a dictionary
+FIELD_ORDER = ('full_name', 'given_name', 'family_name', 'phone_numbers', 'emails', 'addresses',
+               'organization', 'job_title', 'birthday', 'notes')
+INTERNED_FIELDS = ('given_name', 'family_name', 'organization', 'job_title')  # few distinct values
+PLAIN_FIELDS = ('full_name', 'birthday', 'notes')  # mostly unique values
+MULTI_FIELDS = ('phone_numbers', 'emails')
+
+
+class StringTable:
+    """Interning table, every distinct string is stored once and referenced by its id (0 is None)."""
+    __slots__ = ('strings', 'ids')
+
+    def __init__(self):
+        self.strings = [None]
+        self.ids = {None: 0}
+
+    def intern(self, value) -> int:
+        """Return the id of value, adding it to the table when new."""
+        index = self.ids.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self.ids[value] = index
+        return index
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class StringColumn:
+    """Unique strings packed as utf-8 into one buffer with end offsets, no Python object per value."""
+    __slots__ = ('data', 'offsets', 'nulls')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+        self.nulls = bytearray()  # 1 for a None value
+
+    def append(self, value) -> None:
+        if value is None:
+            self.nulls.append(1)
+        else:
+            self.nulls.append(0)
+            self.data += str(value).encode('utf-8', 'surrogatepass')
+        self.offsets.append(len(self.data))
+
+    def get(self, index: int):
+        if self.nulls[index]:
+            return None
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8', 'surrogatepass')
+
+    def __len__(self):
+        return len(self.nulls)
+
+
+class MultiColumn:
+    """Multi-valued field, all items in one string column plus per-row offsets into it."""
+    __slots__ = ('items', 'offsets')
+
+    def __init__(self):
+        self.items = StringColumn()
+        self.offsets = array('Q', [0])
+
+    def append(self, values) -> None:
+        """Add the values of one row."""
+        if isinstance(values, str):
+            values = [values]
+        for value in values or ():
+            self.items.append(value)
+        self.offsets.append(len(self.items))
+
+    def get(self, row: int) -> list:
+        """Return the values of one row as a new list."""
+        return [self.items.get(index) for index in range(self.offsets[row], self.offsets[row + 1])]
+
+
+class AddressColumn(MultiColumn):
+    """Addresses split into the street and the interned rest (city, region, code, country)."""
+    __slots__ = ('tails', 'table')
+
+    def __init__(self, table: StringTable):
+        super().__init__()
+        self.tails = array('I')
+        self.table = table
+
+    def append(self, values) -> None:
+        if isinstance(values, str):
+            values = [values]
+        for value in values or ():
+            street, separator, tail = value.partition(', ')
+            self.items.append(street)
+            self.tails.append(self.table.intern(tail if separator else None))
+        self.offsets.append(len(self.items))
+
+    def get(self, row: int) -> list:
+        strings = self.table.strings
+        values = []
+        for index in range(self.offsets[row], self.offsets[row + 1]):
+            tail = strings[self.tails[index]]
+            street = self.items.get(index)
+            values.append(street if tail is None else f'{street}, {tail}')
+        return values
+
+
+class ContactStore(MutableMapping):
+    """Columnar contact storage with the mapping interface of the former dict-of-dicts.
+    Reading a key materializes a fresh contact dictionary, so changes have to be written back with store[key] = contact.
+    Rows are append-only, replaced or deleted rows stay as garbage until compact().
+    """
+    __slots__ = ('rows', 'table', 'interned', 'plain', 'multi', 'size', 'ordered')
+
+    def __init__(self, contacts=None):
+        self.rows = None  # key -> row number, None while keys arrive as 1, 2, 3, ... (key k is row k - 1)
+        self.table = StringTable()
+        self.interned = {field: array('I') for field in INTERNED_FIELDS}
+        self.plain = {field: StringColumn() for field in PLAIN_FIELDS}
+        self.multi = {field: MultiColumn() for field in MULTI_FIELDS}
+        self.multi['addresses'] = AddressColumn(self.table)
+        self.size = 0  # rows written, including garbage
+        self.ordered = None  # tuple returned by key_sequence() once keys are not dense, until a key is added or deleted
+        if contacts:
+            self.update(contacts)
+
+    def append(self, contact: dict) -> int:
+        """Write contact into a new row and return the row number."""
+        for field, column in self.interned.items():
+            column.append(self.table.intern(contact.get(field)))
+        for field, column in self.plain.items():
+            column.append(contact.get(field))
+        for field, column in self.multi.items():
+            column.append(contact.get(field))
+        self.size += 1
+        return self.size - 1
+
+    def row(self, row: int) -> dict:
+        """Materialize one row into a parse_vcard dictionary."""
+        strings = self.table.strings
+        contact = {}
+        for field in FIELD_ORDER:
+            if field in self.interned:
+                contact[field] = strings[self.interned[field][row]]
+            elif field in self.plain:
+                contact[field] = self.plain[field].get(row)
+            else:
+                contact[field] = self.multi[field].get(row)
+        return contact
+
+    def field(self, key, field: str):
+        """One field of the contact stored under key, without materializing the others."""
+        row = self.row_of(key)
+        if field in self.interned:
+            return self.table.strings[self.interned[field][row]]
+        if field in self.plain:
+            return self.plain[field].get(row)
+        return self.multi[field].get(row)
+
+    def row_of(self, key) -> int:
+        """Row number holding key, raises KeyError for unknown keys."""
+        if self.rows is not None:
+            return self.rows[key]
+        if type(key) is int and 0 < key <= self.size:
+            return key - 1
+        raise KeyError(key)
+
+    def key_sequence(self):
+        """Keys in iteration order as an immutable indexable sequence, a range while keys are 1, 2, 3, ...
+        Otherwise a tuple built once and reused until a key is added or deleted, replacing contacts keeps it.
+        """
+        if self.rows is None:
+            return range(1, self.size + 1)
+        if self.ordered is None:
+            self.ordered = tuple(self.rows)
+        return self.ordered
+
+    def _index_rows(self) -> dict:
+        """Leave the dense mode, from now on keys are mapped through a dictionary."""
+        if self.rows is None:
+            self.rows = {key: key - 1 for key in range(1, self.size + 1)}
+        return self.rows
+
+    def compact(self) -> None:
+        """Drop rows of replaced or deleted contacts."""
+        live = [(key, self[key]) for key in self]
+        self.clear()
+        for key, contact in live:
+            self[key] = contact
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def __getitem__(self, key) -> dict:
+        return self.row(self.row_of(key))
+
+    def __setitem__(self, key, contact: dict) -> None:
+        if self.rows is None and type(key) is int and key == self.size + 1:
+            self.append(contact)
+        else:
+            rows = self._index_rows()
+            if key not in rows:
+                self.ordered = None
+            rows[key] = self.append(contact)
+
+    def __delitem__(self, key) -> None:
+        del self._index_rows()[key]
+        self.ordered = None
+
+    def __contains__(self, key) -> bool:
+        try:
+            self.row_of(key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        if self.rows is None:
+            return iter(range(1, self.size + 1))
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return self.size if self.rows is None else len(self.rows)
+
+    def __repr__(self) -> str:
+        return f'ContactStore({len(self)} contacts, {len(self.table)} distinct strings)'
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Duplicate detection for contact libraries.
+
+Contacts are only compared inside blocks of contacts sharing a blocking key
+(normalized phone number, email, normalized name or its phonetic code), so the work grows
+with the block sizes instead of the square of the library size.
+"""
+
+import re
+from difflib import SequenceMatcher
+
+from unidecode import unidecode
+
+from phones import DEFAULT_COUNTRY, normalize
+
+TOKEN = re.compile(r'[a-z0-9]+')
+SOUNDEX_CODES = {letter: str(code) for code, letters in enumerate(
+    ['aehiouwy', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r']) for letter in letters}
+
+
+def soundex(token: str) -> str:
+    """American Soundex code of an ASCII token (digits are kept as they are)."""
+    if not token or not token[0].isalpha():
+        return token
+    code, previous = token[0], SOUNDEX_CODES.get(token[0], '')
+    for letter in token[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != '0' and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def name_tokens(contact: dict) -> list:
+    """Sorted transliterated lowercase tokens of the contact's name."""
+    name = contact.get('full_name') or ' '.join(filter(None, [contact.get('given_name'), contact.get('family_name')]))
+    return sorted(TOKEN.findall(unidecode(name).casefold())) if name else []
+
+
+def profile(contact: dict, country: str = DEFAULT_COUNTRY, phones=None) -> tuple:
+    """(normalized name, normalized phones, emails, blocking keys) of a contact.
+    phones are the already normalized numbers of the contact, when known.
+    """
+    tokens = name_tokens(contact)
+    name = ' '.join(tokens)
+    if phones is None:
+        phones = {normalize(number, country) for number in contact.get('phone_numbers') or []} - {None}
+    else:
+        phones = set(phones)
+    emails = {email.strip().casefold() for email in contact.get('emails') or [] if email and email.strip()}
+    keys = {f'tel:{phone}' for phone in phones} | {f'mail:{email}' for email in emails}
+    if tokens:
+        keys.add(f'name:{name}')
+        keys.add('sound:' + ' '.join(sorted(soundex(token) for token in tokens)))
+    return name, phones, emails, keys
+
+
+def score(first: tuple, second: tuple, threshold: float = 0.0) -> tuple:
+    """Similarity of two profiles in 0..1 and the reasons behind it.
+    Name similarity is only computed exactly when the pair can still reach threshold.
+    """
+    reasons = []
+    if first[1] & second[1]:
+        reasons.append('phone')
+    if first[2] & second[2]:
+        reasons.append('email')
+    shared = bool(reasons)  # shared identifier, the name decides how sure we are
+    ratio = 0.0
+    if first[0] and second[0]:
+        if first[0] == second[0]:
+            ratio = 1.0
+        else:
+            needed = (threshold - 0.75) / 0.25 if shared else threshold
+            matcher = SequenceMatcher(None, first[0], second[0])
+            if matcher.real_quick_ratio() >= needed and matcher.quick_ratio() >= needed:
+                ratio = matcher.ratio()
+    if ratio >= 0.9:
+        reasons.append('name')
+    return (0.75 + 0.25 * ratio if shared else ratio), reasons
+
+
+def is_duplicate(first: dict, second: dict, threshold: float = 0.9, country: str = DEFAULT_COUNTRY) -> bool:
+    """Whether two contacts look like the same person."""
+    first, second = profile(first, country), profile(second, country)
+    return bool(first[3] & second[3]) and score(first, second, threshold)[0] >= threshold
+
+
+def find_duplicates(contacts, threshold: float = 0.9, max_block: int = 50, window: int = 10,
+                    country: str = DEFAULT_COUNTRY, phones=None) -> list:
+    """Group the contacts of a mapping {id: contact} into duplicate clusters.
+    Blocks up to max_block contacts are compared pairwise, bigger ones only against
+    their window nearest neighbours in name order.
+    phones is an optional {id: normalized numbers} mapping (PhoneIndex.numbers) saving the normalization.
+    Returns [{'ids': [...], 'score': weakest link, 'reasons': [...]}] ordered by first id.
+    """
+    profiles = {}
+    blocks = {}
+    for key, contact in contacts.items():
+        known = None if phones is None else phones.get(key, ())
+        profiles[key] = current = profile(contact, country, known)
+        for block_key in current[3]:
+            blocks.setdefault(block_key, []).append(key)
+
+    parent = {}
+
+    def find(key):
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:  # path compression
+            parent[key], key = root, parent[key]
+        return root
+
+    links = {}  # root -> (weakest score, reasons)
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) > max_block:
+            members = sorted(members, key=lambda member: profiles[member][0])
+            pairs = ((members[i], members[j]) for i in range(len(members))
+                     for j in range(i + 1, min(i + 1 + window, len(members))))
+        else:
+            pairs = ((members[i], members[j]) for i in range(len(members)) for j in range(i + 1, len(members)))
+        for first, second in pairs:
+            root_first, root_second = find(first), find(second)
+            if root_first == root_second:
+                continue
+            similarity, reasons = score(profiles[first], profiles[second], threshold)
+            if similarity < threshold:
+                continue
+            parent.setdefault(root_first, root_first)
+            parent[root_second] = root_first
+            weakest, known = links.pop(root_first, (1.0, set()))
+            other_weakest, other_known = links.pop(root_second, (1.0, set()))
+            links[root_first] = (min(weakest, other_weakest, similarity), known | other_known | set(reasons))
+
+    clusters = {}
+    for key in parent:
+        clusters.setdefault(find(key), []).append(key)
+    result = []
+    for root, members in clusters.items():
+        weakest, reasons = links[root]
+        result.append({'ids': sorted(members), 'score': round(weakest, 3), 'reasons': sorted(reasons)})
+    return sorted(result, key=lambda cluster: cluster['ids'][0])
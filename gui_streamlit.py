@@ -1,39 +1,81 @@
 # -*- coding: utf-8 -*-
 """Streamlit GUI for VCF contact editor - matching tkinter layout exactly."""
 
+import math
+import os
+import uuid
+from io import BytesIO
+
 import streamlit as st
 from pathlib import Path
-from Contact import ContactList, create_vcard, parse_vcard, quoted_printable, smash_it
+from Contact import MAX_MATCHES, ContactList, create_vcard
+from parse_cache import open_default_cache
+from profiling import from_environment, profile_target
 
-try:
-    import vobject
-except ImportError:
-    raise Exception('Cannot work with VCF contacts, please install vobject')
+UPLOAD_WORKERS = min(4, os.cpu_count() or 1)  # processes parsing uploaded files
+CACHED_VERSIONS = 8  # library versions whose export is kept in the cache
+PAGE_SIZES = [25, 50, 100, 250]  # rows per page of the contact table
+SORT_COLUMNS = {'library order': None, 'name': 'full_name', 'given name': 'given_name',
+                'family name': 'family_name', 'organization': 'organization', 'email': 'emails',
+                'phone': 'phone_numbers'}
 
 
 def init_session_state():
     """Initialize session state variables."""
     defaults = {
         'contacts_lib': None,
+        'library_id': '',  # new for every loaded library, with ContactList.version the key of cached views
+        'export_requested': False,
         'active_index': 0,
         'location': '',
         'mode': 'Directory',
         'uploaded_mode': False,
         'show_file_input': True,
+        'profiler': None,  # set from VCF_PROFILE below, times loads and table renders of this session
     }
     for key, val in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = val
+    if st.session_state.profiler is None:
+        st.session_state.profiler = from_environment()
+
+
+@st.cache_resource
+def parse_cache():
+    """One parse cache shared by all sessions of the server."""
+    return open_default_cache()
+
+
+@st.cache_resource(max_entries=CACHED_VERSIONS)
+def export_blob(_contacts_lib, library_id: str, version: int) -> bytes:
+    """The whole library as one vCard file, serialized once per library version (_contacts_lib is not hashed)."""
+    stream = BytesIO()
+    _contacts_lib.export_stream(stream)
+    return stream.getvalue()
+
+
+def dump_profile():
+    """Write the profile of this session to VCF_PROFILE, after a load or when asked for."""
+    if st.session_state.profiler:
+        st.session_state.profiler.dump(profile_target())
+
+
+def set_library(contacts_lib):
+    """Make contacts_lib the library of this session, views cached for the previous one are not used again."""
+    st.session_state.contacts_lib = contacts_lib
+    st.session_state.library_id = uuid.uuid4().hex
+    st.session_state.export_requested = False
 
 
 def load_contacts(path: str, is_dir: bool):
     """Load contacts from file or directory."""
     try:
-        st.session_state.contacts_lib = ContactList(path, is_dir=is_dir)
+        set_library(ContactList(path, is_dir=is_dir, cache=parse_cache(), profile=st.session_state.profiler))
         st.session_state.location = path
-        st.session_state.active_index = 1 if st.session_state.contacts_lib.dic else 0
+        st.session_state.active_index = next(iter(st.session_state.contacts_lib.dic), 0)  # ids may have gaps
         st.session_state.uploaded_mode = False
         st.session_state.show_file_input = False
+        dump_profile()
         return True
     except Exception as e:
         st.error(f"Error loading: {e}")
@@ -41,23 +83,23 @@ def load_contacts(path: str, is_dir: bool):
 
 
 def load_from_uploaded_files(uploaded_files):
-    """Load contacts from uploaded VCF files."""
+    """Load contacts from uploaded VCF files, parsed in chunks on worker processes."""
     try:
-        st.session_state.contacts_lib = ContactList('', is_dir=False)
-        st.session_state.contacts_lib.dic = {}
-        st.session_state.contacts_lib.counter = 0
-        
-        for uploaded_file in uploaded_files:
-            content = uploaded_file.read().decode('utf-8')
-            for vcard in vobject.readComponents(content, allowQP=True):
-                contact = parse_vcard(vcard)
-                st.session_state.contacts_lib.counter += 1
-                st.session_state.contacts_lib.dic[st.session_state.contacts_lib.counter] = contact
-        
+        set_library(ContactList('', is_dir=False, profile=st.session_state.profiler))
+        bar = st.progress(0.0, text="Parsing uploaded files...")
+
+        def progress(done, total):
+            bar.progress(min(done / total, 1.0) if total else 0.0,
+                         text=f"Parsing uploaded files... {done // 1024} / {(total or 0) // 1024} KiB")
+
+        st.session_state.contacts_lib.load_uploads(uploaded_files, workers=UPLOAD_WORKERS, progress=progress)
+        bar.empty()
+
         st.session_state.location = f'Uploaded: {len(uploaded_files)} file(s)'
-        st.session_state.active_index = 1 if st.session_state.contacts_lib.dic else 0
+        st.session_state.active_index = next(iter(st.session_state.contacts_lib.dic), 0)  # ids may have gaps
         st.session_state.uploaded_mode = True
         st.session_state.show_file_input = False
+        dump_profile()
         return True
     except Exception as e:
         st.error(f"Error: {e}")
@@ -73,6 +115,74 @@ def get_display_name(contact: dict) -> str:
     return "Unknown"
 
 
+def first(values) -> str:
+    """First item of a multi-valued field for a table cell."""
+    if isinstance(values, list):
+        return values[0] if values else ''
+    return values or ''
+
+
+def step(offset: int) -> bool:
+    """Make the contact offset places away from the active one in library order active, True when it moved.
+    Ids may have gaps (removed contacts, a reopened library), so the position is looked up in the ordered keys.
+    """
+    contacts_lib = st.session_state.contacts_lib
+    if not contacts_lib or not contacts_lib.dic:
+        return False
+    keys = contacts_lib.dic.key_sequence()
+    try:
+        row = keys.index(st.session_state.active_index) + offset
+    except ValueError:  # nothing active yet, only > starts at the first contact
+        row = 0 if offset > 0 else -1
+    if 0 <= row < len(keys):
+        st.session_state.active_index = keys[row]
+        return True
+    return False
+
+
+def reset_page():
+    st.session_state.table_page = 1
+
+
+def contact_table(contacts_lib):
+    """Search, sort and page controls over the library, only the rows of the current page are sent to the browser."""
+    text = st.text_input("Search", key='table_search', placeholder="name, organization, email or phone",
+                         on_change=reset_page).strip()
+    col_sort, col_desc = st.columns([3, 1])
+    with col_sort:
+        column = st.selectbox("Sort by", list(SORT_COLUMNS), key='table_sort', on_change=reset_page)
+    with col_desc:
+        descending = st.checkbox("desc", key='table_descending', on_change=reset_page)
+    col_size, col_page = st.columns(2)
+    with col_size:
+        size = st.selectbox("Rows", PAGE_SIZES, index=1, key='table_size', on_change=reset_page)
+    number = st.session_state.get('table_page', 1)  # set before the rerun when the pager was used
+    total, keys = contacts_lib.page(text, SORT_COLUMNS[column], descending, (number - 1) * size, size)
+    pages = max(1, math.ceil(total / size))
+    if number > pages:  # the library shrank under the page shown, the last page is read on the rerun
+        st.session_state.table_page = pages
+        st.rerun()
+    with col_page:
+        st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key='table_page')
+
+    rows = []
+    for key in keys:
+        contact = contacts_lib.dic[key]
+        rows.append({'#': key, 'name': get_display_name(contact), 'phone': first(contact.get('phone_numbers')),
+                     'email': first(contact.get('emails')), 'organization': contact.get('organization') or ''})
+    # a new key per view, so a row selected on another page or ordering is not carried over
+    view = f"table_{st.session_state.library_id}_{contacts_lib.version}_{text}_{column}_{descending}_{size}_{number}"
+    event = st.dataframe(rows, hide_index=True, use_container_width=True, on_select='rerun',
+                         selection_mode='single-row', key=view)
+    limited = ' (best matches)' if text and total == MAX_MATCHES else ''
+    st.caption(f"{total} contacts{limited}")
+    if event.selection.rows:
+        key = keys[event.selection.rows[0]]
+        if key != st.session_state.active_index:
+            st.session_state.active_index = key
+            st.rerun()
+
+
 def run():
     """Main Streamlit application - clean tkinter-style layout."""
     st.set_page_config(page_title="VCF Contact Editor", page_icon="📇", layout="wide")
@@ -110,22 +220,18 @@ def run():
     
     with c2:
         if st.button("export", use_container_width=True):
-            pass  # Handled below if contacts exist
+            st.session_state.export_requested = True  # serialized below, only once asked for
     
     with c3:
-        if st.button("<", use_container_width=True):
-            if st.session_state.contacts_lib and st.session_state.active_index > 1:
-                st.session_state.active_index -= 1
-                st.rerun()
+        if st.button("<", use_container_width=True) and step(-1):
+            st.rerun()
     
     with c4:
         save_clicked = st.button("save", use_container_width=True)
     
     with c5:
-        if st.button(">", use_container_width=True):
-            if st.session_state.contacts_lib and st.session_state.active_index < len(st.session_state.contacts_lib.dic):
-                st.session_state.active_index += 1
-                st.rerun()
+        if st.button(">", use_container_width=True) and step(1):
+            st.rerun()
     
     with c6:
         if st.button("quit", use_container_width=True):
@@ -147,13 +253,19 @@ def run():
         if uploaded:
             if load_from_uploaded_files(uploaded):
                 st.rerun()
-    
+
+        if st.session_state.mode == 'File':  # a library kept in SQLite opens without parsing
+            database = st.text_input("or open a library kept on the server", placeholder="/path/to/library.sqlite")
+            if database and st.button("open library") and load_contacts(database, is_dir=False):
+                st.rerun()
+
     st.divider()
     
-    # ==================== EXPORT DOWNLOAD (if contacts exist) ====================
-    if st.session_state.contacts_lib and st.session_state.contacts_lib.dic:
+    # ==================== EXPORT DOWNLOAD (after export was clicked) ====================
+    contacts_lib = st.session_state.contacts_lib
+    if st.session_state.export_requested and contacts_lib and contacts_lib.dic:
         with st.container():
-            all_vcards = '\n'.join([create_vcard(c).serialize() for c in st.session_state.contacts_lib.dic.values()])
+            all_vcards = export_blob(contacts_lib, st.session_state.library_id, contacts_lib.version)
             st.download_button("⬇️ Download All Contacts", all_vcards, "contacts_export.vcf", "text/vcard")
     
     # ==================== MAIN CONTENT: List + Form ====================
@@ -164,16 +276,8 @@ def run():
     # LEFT: Contact List
     with col_list:
         if contacts:
-            options = [f"{idx}. {get_display_name(c)}" for idx, c in contacts.items()]
-            current = st.session_state.active_index - 1 if st.session_state.active_index > 0 else 0
-            current = min(current, len(options) - 1) if options else 0
-            
-            selected = st.selectbox("Contacts", options, index=current, label_visibility="collapsed")
-            if selected:
-                new_idx = int(selected.split('.')[0])
-                if new_idx != st.session_state.active_index:
-                    st.session_state.active_index = new_idx
-                    st.rerun()
+            with contacts_lib.phase('gui.table'):
+                contact_table(contacts_lib)
         else:
             # Empty list placeholder
             st.selectbox("Contacts", ["(no contacts)"], disabled=True, label_visibility="collapsed")
@@ -232,6 +336,14 @@ def run():
                                  f"{packed['full_name']}.vcf", "text/vcard",
                                  use_container_width=True)
 
+    # ==================== PROFILE (VCF_PROFILE set) ====================
+    if contacts_lib and contacts_lib.profiler:
+        with st.expander("Profile"):
+            st.json(contacts_lib.stats())
+            if st.button("write profile"):  # table renders since the last load are added
+                dump_profile()
+                st.caption(f"written to {profile_target()}")
+
 
 if __name__ == '__main__':
     run()
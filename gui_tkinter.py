@@ -1,9 +1,216 @@
 # -*- coding: utf-8 -*-
 """Tkinter GUI for VCF contact editor."""
 
+import time
+from copy import copy
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Event, Thread
 from tkinter import Button, Entry, IntVar, Label, Listbox, Radiobutton, Scrollbar, TclError, Tk
-from tkinter.filedialog import asksaveasfile, askopenfilename, askdirectory
+from tkinter.filedialog import asksaveasfilename, askopenfilename, askdirectory
+from tkinter.font import Font
+from tkinter.ttk import Progressbar
 from Contact import ContactList, create_vcard, quoted_printable, smash_it
+from parse_cache import ParseCache, open_default_cache
+from profiling import from_environment, profile_target
+
+SEARCH_LIMIT = 200  # matches listed while searching
+WHEEL_ROWS = 3  # rows scrolled by one mouse wheel step
+POLL_MS = 100  # how often the Tk loop takes parsed files from a background load
+STORE_SECONDS = 0.05  # time per poll spent storing parsed files, keeps the window responsive
+QUEUE_FILES = 2000  # parsed files waiting for the Tk loop at most
+NOTICE_SECONDS = 3  # how long a message stays in the progress status before the progress comes back
+
+
+class VirtualList:
+    """Listbox showing only the visible window of a long key sequence, rows are labelled when they come into view.
+    The scrollbar is driven by the position in the keys, so (re)filling costs the same for any library size.
+    """
+
+    def __init__(self, master, label, command, height=7):
+        self.label = label  # key -> row text
+        self.command = command  # called with (key, row) when the user picks a row
+        self.keys = []
+        self.top = 0  # row shown first
+        self.rows = height  # rows that fit into the listbox
+        self.selected = None  # selected row, may be scrolled out of view
+        self.listbox = Listbox(master, height=height, exportselection=False)
+        self.scroll = Scrollbar(master, orient='vertical', command=self.yview)
+        self.listbox.bind('<<ListboxSelect>>', self.on_click)
+        self.listbox.bind('<Configure>', self.on_resize)
+        self.listbox.bind('<MouseWheel>', self.on_wheel)
+        self.listbox.bind('<Button-4>', lambda evt: self.scroll_to(self.top - WHEEL_ROWS))
+        self.listbox.bind('<Button-5>', lambda evt: self.scroll_to(self.top + WHEEL_ROWS))
+        self.listbox.bind('<Up>', lambda evt: self.move(-1))
+        self.listbox.bind('<Down>', lambda evt: self.move(1))
+        self.listbox.bind('<Prior>', lambda evt: self.move(-self.rows))
+        self.listbox.bind('<Next>', lambda evt: self.move(self.rows))
+
+    def grid(self, column=0, columnspan=1, **options):
+        """Grid the listbox over the given columns, the scrollbar into the column after them."""
+        self.listbox.grid(column=column, columnspan=columnspan, **options, sticky='nsew')
+        self.scroll.grid(column=column + columnspan, **options, sticky='nsw')
+
+    def set_keys(self, keys, keep_position=False):
+        """Show another key sequence (list or range), from its start unless it only grew."""
+        self.keys = keys
+        if not keep_position:
+            self.top = 0
+            self.selected = None
+        self.draw()
+
+    def draw(self):
+        """Label the visible rows only and move the scrollbar."""
+        end = min(len(self.keys), self.top + self.rows)
+        self.listbox.delete(0, 'end')
+        if end > self.top:
+            self.listbox.insert('end', *[self.label(key) for key in self.keys[self.top:end]])
+        if self.selected is not None and self.top <= self.selected < end:
+            self.listbox.selection_set(self.selected - self.top)
+            self.listbox.activate(self.selected - self.top)
+        size = len(self.keys)
+        self.scroll.set(self.top / size, end / size) if size else self.scroll.set(0, 1)
+
+    def yview(self, *args):
+        """Scrollbar command ('moveto', fraction) or ('scroll', amount, 'units' / 'pages')."""
+        if args[0] == 'moveto':
+            self.scroll_to(round(float(args[1]) * len(self.keys)))
+        elif args[0] == 'scroll':
+            self.scroll_to(self.top + int(args[1]) * (self.rows if args[2] == 'pages' else 1))
+
+    def scroll_to(self, top):
+        top = max(0, min(top, len(self.keys) - self.rows))
+        if top != self.top:
+            self.top = top
+            self.draw()
+        return 'break'
+
+    def see(self, row):
+        """Scroll so that row is visible."""
+        if row < self.top:
+            self.scroll_to(row)
+        elif row >= self.top + self.rows:
+            self.scroll_to(row - self.rows + 1)
+
+    def select(self, row):
+        self.selected = row
+        self.see(row)
+        self.draw()
+
+    def move(self, offset):
+        """Keyboard navigation, keeps going past the visible window."""
+        if self.keys:
+            row = 0 if self.selected is None else max(0, min(self.selected + offset, len(self.keys) - 1))
+            self.select(row)
+            self.command(self.keys[row], row)
+        return 'break'
+
+    def on_click(self, evt):
+        if self.listbox.curselection():
+            row = self.top + int(self.listbox.curselection()[0])
+            if row < len(self.keys) and row != self.selected:
+                self.selected = row
+                self.command(self.keys[row], row)
+
+    def on_wheel(self, evt):
+        return self.scroll_to(self.top + (WHEEL_ROWS if evt.delta < 0 else -WHEEL_ROWS))
+
+    def on_resize(self, evt):
+        # the listbox is stretched by the grid, its height option is not updated
+        line = Font(font=self.listbox['font']).metrics('linespace') + 1
+        border = 2 * (int(self.listbox['borderwidth']) + int(self.listbox['highlightthickness']))
+        rows = max(1, (evt.height - border) // line)
+        if rows != self.rows:
+            self.rows = rows
+            self.top = max(0, min(self.top, len(self.keys) - rows))
+            self.draw()
+
+
+class BackgroundLoad:
+    """Parses a directory on a worker thread, the Tk loop stores the parsed files it takes from the queue.
+    ContactList is changed by the Tk thread only, contacts appear in the list as their files arrive.
+    Once everything is stored, the worker builds the search index and the Tk loop attaches it unless the library
+    changed meanwhile, so the first search does not index the whole folder on the Tk thread.
+    The worker parses through a copy of the list with a parse cache connection of its own, so contacts already
+    stored can be saved and refreshed by the Tk thread during the load.
+    """
+
+    def __init__(self, contacts_lib, directory):
+        self.contacts_lib = contacts_lib
+        self.directory = directory
+        self.queue = Queue(maxsize=QUEUE_FILES)
+        self.cancel = Event()
+        self.total = 0  # files to load, 0 until the directory is listed
+        self.files = 0  # files stored
+        self.contacts = 0  # contacts stored
+        self.started = time.perf_counter()
+        self.parsed = Event()  # every file is queued
+        self.stored = Event()  # the Tk loop has taken every file from the queue
+        self.index = None  # SearchIndex of the library, built once it is stored unless cancelled
+        self.indexed = None  # library version the index was built for
+        self.parser = copy(contacts_lib)  # parses only, dic is not touched through it
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        cache = self.parser.cache
+        try:
+            if cache:
+                self.parser.cache = ParseCache(cache.path, cache.max_bytes)
+            files = self.parser.directory_files(self.directory)
+            self.total = len(files)
+            for parsed in self.parser.parse_files(files, cancel=self.cancel):
+                while not self.cancel.is_set():
+                    try:
+                        self.queue.put(parsed, timeout=0.1)
+                        break
+                    except Full:
+                        pass
+        except Exception as e:
+            print(f"Error loading directory {self.directory}: {e}")
+        finally:
+            if cache and self.parser.cache is not cache:
+                self.parser.cache.close()
+            self.parsed.set()
+        while not self.stored.wait(POLL_MS / 1000):
+            if self.cancel.is_set():
+                return
+        if not self.cancel.is_set() and self.contacts_lib.search_index is None:
+            version = self.contacts_lib.version
+            try:
+                index = self.contacts_lib.build_search_index()
+            except RuntimeError:  # a contact saved while indexing, query() builds the index instead
+                return
+            self.index, self.indexed = index, version
+
+    def take(self, seconds: float) -> bool:
+        """Store parsed files for at most seconds, returns False once all of them are stored."""
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            running = not self.parsed.is_set()  # checked first, everything is queued once it is set
+            try:
+                parsed = self.queue.get_nowait()
+            except Empty:
+                if not running:
+                    self.stored.set()
+                return running
+            self.contacts_lib.store_file(*parsed)
+            self.files += 1
+            self.contacts += len(parsed[2])
+        return True
+
+    def status(self) -> str:
+        rate = self.contacts / max(time.perf_counter() - self.started, 1e-6)
+        return f'{self.files} / {self.total or "?"} files, {rate:.0f} contacts/s'
+
+    def indexing(self) -> bool:
+        """True while the worker builds the search index."""
+        return self.stored.is_set() and self.thread.is_alive()
+
+    def stop(self):
+        """Cancel the load and wait for the worker, it gives up before the next file or after the index."""
+        self.cancel.set()
+        self.thread.join()
 
 
 class MainWindow:
@@ -15,9 +222,14 @@ class MainWindow:
             'index': 0,
             'loading': True,  # flag after load a file/dir
             'location': '',
+            'keys': [],  # contact indexes shown in the list, in list order
             'mode': IntVar(value=0)  # folder value active
         }
         self.contacts_lib = None  # here is the whole vcf library held
+        self.loader = None  # BackgroundLoad of a directory still arriving
+        self.notice_until = 0  # perf_counter time until which a message is shown instead of the progress
+        self.parse_cache = open_default_cache()  # reopening a folder skips parsing of unchanged files
+        self.profiler = from_environment()  # VCF_PROFILE=file.json (or .prof) times loads and list refreshes
         self.tk_btn = {}
         self.tk_form = {}
 
@@ -47,16 +259,23 @@ class MainWindow:
         self.tk_btn['next'].grid(row=1, column=4, pady=5, sticky='nsew')
         self.tk_btn['exit'].grid(row=1, column=5, pady=5, sticky='nsew')
 
-        # ===================== (Contacts list)
-        self.tk_contacts_list = Listbox(self.master, height=7)  # selectmode='SINGLE'
-        self.tk_contacts_list.bind('<<ListboxSelect>>', self.on_select)
-        self.tk_contacts_scroll = Scrollbar(self.master, orient='vertical')
+        # ===================== (Contacts list - only the visible rows are drawn)
+        self.tk_contacts_list = VirtualList(self.master, self.list_label, self.on_select, height=7)
+        self.tk_contacts_list.grid(row=2, column=0, rowspan=5, columnspan=2)
 
-        self.tk_contacts_list['yscrollcommand'] = self.tk_contacts_scroll.set
-        self.tk_contacts_scroll['command'] = self.tk_contacts_list.yview
+        # ===================== (Search box - filters the list while typing)
+        self.tk_search = Entry(self.master)
+        self.tk_search.bind('<KeyRelease>', self.on_search)
+        self.tk_search.grid(row=7, column=0, columnspan=2, sticky='nsew')
 
-        self.tk_contacts_list.grid(row=2, column=0, rowspan=5, columnspan=2, sticky='nsew')
-        self.tk_contacts_scroll.grid(row=2, column=0, rowspan=5, columnspan=2, sticky='nse')
+        # ===================== (Progress of a directory load - shown while loading)
+        self.tk_progress = Progressbar(self.master, mode='determinate')
+        self.tk_progress_status = Label(self.master, text='')
+        self.tk_btn['stop'] = Button(self.master, text='cancel', command=self.cancel_load)
+        self.tk_progress.grid(row=8, column=0, columnspan=2, sticky='nsew')
+        self.tk_progress_status.grid(row=8, column=2, columnspan=3, sticky='w')
+        self.tk_btn['stop'].grid(row=8, column=5, sticky='nsew')
+        self.show_progress(False)
 
         # TODO: 1. Switcher between folder and file mode not working
         # TODO: 2. Exporting / Merging
@@ -84,11 +303,70 @@ class MainWindow:
             self.active['location'] = askdirectory()
             really = True
         if self.active['location']:
-            self.contacts_lib = ContactList(self.active['location'], is_dir=really)
+            if self.loader:
+                self.loader.stop()
+                self.loader = None
+                self.show_progress(False)
+            if really:  # directories load in the background, contacts are listed as they arrive
+                self.contacts_lib = ContactList('', cache=self.parse_cache, profile=self.profiler)
+                self.loader = BackgroundLoad(self.contacts_lib, self.active['location'])
+                self.show_progress(True)
+                self.master.after(POLL_MS, self.poll_load)
+            else:
+                self.loader = None
+                self.contacts_lib = ContactList(self.active['location'], is_dir=really, cache=self.parse_cache,
+                                                profile=self.profiler)
             self.active['loading'] = True
         else:
             self.active['location'] = backup  # reverting to previous value
 
+    def poll_load(self):
+        """Store what the background load has parsed so far and extend the list."""
+        loader = self.loader
+        if loader is None or loader.contacts_lib is not self.contacts_lib:
+            return  # replaced by another load
+        running = loader.take(STORE_SECONDS)
+        with self.contacts_lib.phase('gui.list'):
+            self.active['keys'] = self.listed_keys()
+            self.tk_contacts_list.set_keys(self.active['keys'], keep_position=True)
+        self.tk_progress['maximum'] = max(loader.total, 1)
+        self.tk_progress['value'] = loader.files
+        if time.perf_counter() > self.notice_until:
+            self.tk_progress_status['text'] = 'indexing for search...' if loader.indexing() else loader.status()
+        if running or loader.indexing():
+            self.master.after(POLL_MS, self.poll_load)
+            return
+        if loader.index is not None and loader.indexed == self.contacts_lib.version:
+            self.contacts_lib.search_index = loader.index
+        if loader.cancel.is_set():
+            print(f'... loading cancelled, {loader.files} of {loader.total} files loaded')
+        else:
+            self.contacts_lib.directories.append(loader.directory)  # refresh() looks for new files from now on
+        self.loader = None
+        self.show_progress(False)
+        self.active['loading'] = True
+        self.refresh()  # the search text filters the list from now on
+
+    def cancel_load(self):
+        if self.loader:
+            self.loader.cancel.set()  # poll_load finishes the load with what is stored
+            self.tk_progress_status['text'] = 'cancelling...'
+
+    def show_progress(self, visible):
+        for widget in (self.tk_progress, self.tk_progress_status, self.tk_btn['stop']):
+            if visible:
+                widget.grid()
+            else:
+                widget.grid_remove()
+
+    def notify(self, text):
+        """Show text in the progress status for a while, the progress of a load comes back after it."""
+        self.tk_progress_status['text'] = text
+        self.notice_until = time.perf_counter() + NOTICE_SECONDS
+        if not self.loader:  # the status is hidden without a load
+            self.tk_progress_status.grid()
+            self.master.after(NOTICE_SECONDS * 1000, lambda: self.loader or self.tk_progress_status.grid_remove())
+
     def build_fields(self, contact):
         """Main function for building a right side form with contact details"""
         for i, key in enumerate(contact, start=1):
@@ -117,27 +395,45 @@ class MainWindow:
         except TclError:
             print('... skipping field', key, 'already deleted')
 
-    def on_select(self, evt):
-        w = evt.widget
-        if w == self.tk_contacts_list and w.curselection():  # click in contact list
-            index = int(w.curselection()[0])
-            value = int(w.get(index).split('.')[0])
-            self.active['index'] = value
-            self.active['contact'] = self.contacts_lib.dic[value]
-            self.build_fields(self.contacts_lib.dic[value])
+    def list_label(self, key):
+        contact = self.contacts_lib.dic[key]
+        if isinstance(contact['full_name'], str):
+            return f'{key}. {contact["full_name"]}'
+        return f'{key}. {contact["family_name"]}'
+
+    def listed_keys(self):
+        """Keys behind the list: the best matches of the search text, all contacts while a folder still loads
+        (the worker indexes it at the end)."""
+        text = self.tk_search.get().strip()
+        if text and not self.loader:
+            return self.contacts_lib.query(text, SEARCH_LIMIT)
+        return self.contacts_lib.dic.key_sequence()
+
+    def on_select(self, key, row):
+        # click or arrow key in contact list
+        self.active['index'] = key
+        self.active['contact'] = self.contacts_lib.dic[key]
+        with self.contacts_lib.phase('gui.form'):
+            self.build_fields(self.active['contact'])
+        self.refresh()
+
+    def on_search(self, evt):
+        self.active['loading'] = True
         self.refresh()
 
     def refresh(self):
         try:
             a = self.contacts_lib.dic
             if self.active['loading']:
-                # clear and fill again contact list
-                self.tk_contacts_list.delete(0, 'end')
-                for record in a.keys():
-                    if isinstance(a[record]['full_name'], str):
-                        self.tk_contacts_list.insert('end', f'{record}. {a[record]["full_name"]}')
-                    else:
-                        self.tk_contacts_list.insert('end', f'{record}. {a[record]["family_name"]}')
+                with self.contacts_lib.phase('gui.list'):
+                    # swap the keys behind the list, only the best matches while searching
+                    self.active['keys'] = self.listed_keys()
+                    self.tk_contacts_list.set_keys(self.active['keys'])
+                    if self.active['contact']:
+                        try:
+                            self.tk_contacts_list.select(self.active['keys'].index(self.active['index']))
+                        except ValueError:
+                            pass  # filtered out or deleted
                 self.active['loading'] = False
             self.tk_current_location['text'] = f'Location: {self.active["location"]}'
         except AttributeError:
@@ -149,42 +445,55 @@ class MainWindow:
 
     def prev(self):
         if self.contacts_lib:
-            if self.active['index'] > 1:
-                self.active['index'] -= 1
-                self.control()
+            self.step(-1)
 
     def next(self):
         if self.contacts_lib:
-            if self.active['index'] < len(self.contacts_lib.dic):
-                self.active['index'] += 1
-                self.control()
-
-    def control(self):
+            self.step(1)
+
+    def step(self, offset):
+        # indexes may have gaps after a refresh, so moving goes through the list order
+        keys = self.active['keys']
+        row = self.tk_contacts_list.selected  # saves a scan of the keys
+        if row is None or row >= len(keys) or keys[row] != self.active['index']:
+            try:
+                row = keys.index(self.active['index'])
+            except ValueError:  # nothing selected yet, only next starts at the top
+                if offset < 0:
+                    return
+                row = -1
+        row += offset
+        if 0 <= row < len(keys):
+            self.active['index'] = keys[row]
+            self.control(row)
+
+    def control(self, row):
         # setting active contact based on previously activated record
         self.active['contact'] = self.contacts_lib.dic[self.active['index']]
         self.build_fields(self.contacts_lib.dic[self.active['index']])
 
-        self.tk_contacts_list.selection_clear(0, "end")
-        self.tk_contacts_list.selection_set(int(self.active['index']) - 1)
-        self.tk_contacts_list.see(int(self.active['index']) - 1)
-        self.tk_contacts_list.activate(int(self.active['index']) - 1)
-        self.tk_contacts_list.selection_anchor(int(self.active['index']) - 1)
+        self.tk_contacts_list.select(row)
 
     def export(self):
         if self.contacts_lib:
             if self.active['mode'].get():  # file mode, export to directory
                 final_loc = askdirectory()
             else:
-                final_loc = asksaveasfile(mode='w', defaultextension=".txt")
+                final_loc = asksaveasfilename(defaultextension='.vcf',
+                                              filetypes=[('vCard', '*.vcf'), ('gzip vCard', '*.vcf.gz')])
             if self.active['location'] != final_loc and final_loc:
                 if self.active['mode'].get():
-                    self.contacts_lib.export(final_loc)
+                    for message in self.contacts_lib.export(final_loc, overwrite=True)[1]:  # replaced files
+                        print(message)
                 else:
                     self.contacts_lib.merge(final_loc)
 
     def save(self):
         if not self.active['contact']:
             return
+        if self.active['index'] not in self.contacts_lib.dic:  # its file has not arrived from the loader yet
+            self.notify('contact not loaded yet, wait for its file')
+            return
         if self.active['mode'].get():
             print('...not implemented yet')
         else:  # folder mode
@@ -212,10 +521,24 @@ class MainWindow:
         smash_it(path)
         with open(new_path, 'wb') as changed:
             changed.write(quoted_printable(v))
-        self.contacts_lib = ContactList(self.active['location'], is_dir=True)
+        self.contacts_lib.refresh()  # re-parses just the saved (and otherwise changed) files
+        if str(Path(new_path)) not in self.contacts_lib.manifest:  # renamed while the folder is still loading
+            self.contacts_lib.open_vcf(str(Path(new_path)))
+        saved = self.contacts_lib.manifest.get(str(Path(new_path)))
+        if saved and saved['ids']:
+            self.active['index'] = saved['ids'][0]
+            self.active['contact'] = self.contacts_lib.dic[self.active['index']]
+        self.active['loading'] = True
         self.refresh()
 
     def quit(self):
+        if self.loader:
+            self.loader.stop()
+        if self.contacts_lib:
+            self.contacts_lib.commit()  # a library opened from a .sqlite file keeps its pending changes
+        if self.profiler:
+            self.profiler.dump(profile_target())
+            print('... profile written to', profile_target())
         self.master.destroy()
 
 
@@ -6,22 +6,326 @@ Run with:
     python main.py          # Tkinter GUI (default)
     python main.py --tk     # Tkinter GUI
     python main.py --st     # Streamlit GUI (launches via subprocess)
-    
+
+Headless batch commands (no GUI toolkit is imported):
+    python main.py load INPUT...                 # load and report files, contacts, errors
+    python main.py stats INPUT...                # field and phone number counts
+    python main.py dedupe INPUT...               # duplicate clusters
+    python main.py normalize INPUT... -o OUT     # phone numbers in E.164 form
+    python main.py export INPUT... -o DIR        # one file per contact
+    python main.py merge INPUT... -o OUT.vcf.gz  # one (compressed) file
+    python main.py convert INPUT... -o OUT.jsonl # vCard <-> JSON lines
+    python main.py convert INPUT... --to jcard   # vCard 4.0, jCard (JSON lines) or xCard (.xml) output
+    python main.py convert INPUT... -o OUT.parquet # Arrow (.arrow), Parquet or CSV snapshot
+    python main.py load INPUT... --database lib.sqlite  # add to a library kept in SQLite
+    python main.py stats --database lib.sqlite   # commands on it without parsing anything
+    python main.py COMMAND --help                # options of a command
+    python main.py COMMAND ... --profile OUT.json  # phase timings (OUT.prof: cProfile data)
+
+INPUT is a .vcf file, a directory, a .jsonl, .arrow, .parquet or .csv file or - for stdin, OUT - is stdout.
+Exit code 0 means success, 1 that some files or cards could not be read or written, 2 a usage error.
+
 Or run interfaces directly:
     python gui_tkinter.py
     streamlit run gui_streamlit.py
 """
 
+import io
+import json
+import os
 import sys
-import subprocess
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+COMMANDS = ('load', 'stats', 'dedupe', 'normalize', 'export', 'merge', 'convert')
+EXIT_OK = 0
+EXIT_ERRORS = 1  # some input could not be read or parsed, or an exported file not written
+EXIT_USAGE = 2  # as argparse
+JSON_SUFFIXES = ('.jsonl', '.json')
+OUTPUT_FORMATS = ('vcf', 'jsonl', 'vcard4', 'jcard', 'xcard', 'arrow', 'parquet', 'csv')  # vcf is vCard 3.0,
+# jsonl the contact dictionaries, arrow/parquet/csv columnar snapshots
+TABLE_FORMATS = ('arrow', 'parquet', 'csv')
+
+
+class ErrorLog:
+    """Stands in for stdout while loading: messages go to stderr, error messages are counted."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.failures = 0
+
+    def write(self, text):
+        self.failures += sum(line.startswith('Error') for line in text.splitlines())
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def read_jsonl(contacts_lib, stream, location):
+    """Add the contacts of a JSON lines stream, one object per line (an 'id' key is ignored)."""
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            contact = json.loads(line)
+            contact.pop('id', None)
+            contacts_lib.add(contact)
+        except (ValueError, AttributeError) as e:
+            print(f"Error loading line {number} in {location}: {e}")
+
+
+def load_library(args):
+    """ContactList of all inputs in the given order, returns (contacts_lib, number of errors)."""
+    from columnar import TABLE_SUFFIXES
+    from Contact import ContactList
+
+    cache = None
+    if args.cache:
+        from parse_cache import open_default_cache
+        cache = open_default_cache()
+    profiler = None
+    if args.profile:
+        from profiling import PSTATS_SUFFIXES, Profiler
+        profiler = Profiler(cprofile=args.profile.endswith(PSTATS_SUFFIXES))
+    with redirect_stdout(io.StringIO()):  # the hint for an empty location is not meant for batch runs
+        contacts_lib = ContactList('', fast=args.fast, workers=args.workers, country=args.country, cache=cache,
+                                   profile=profiler, database=args.database)
+    log = ErrorLog()
+    with redirect_stdout(log):
+        files = []  # consecutive files are parsed together, in parallel with --workers
+        for location in args.inputs + [None]:
+            if files and (location is None or location == '-' or not Path(location).is_file()
+                          or location.endswith(JSON_SUFFIXES + TABLE_SUFFIXES)):
+                for parsed in contacts_lib.parse_files(files):
+                    contacts_lib.store_file(*parsed)
+                files = []
+            if location is None:
+                break
+            if location == '-':
+                if args.input_format == 'jsonl':
+                    read_jsonl(contacts_lib, io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'), 'stdin')
+                else:
+                    contacts_lib.load_uploads([sys.stdin.buffer])
+            elif Path(location).is_dir():
+                contacts_lib.load_directory(location)
+            elif not Path(location).is_file():
+                print(f"Error loading file {location}: no such file or directory")
+            elif location.endswith(TABLE_SUFFIXES):
+                contacts_lib.load_table(location)
+            elif location.endswith(JSON_SUFFIXES) or args.input_format == 'jsonl':
+                with open(location, encoding='utf-8') as stream:
+                    read_jsonl(contacts_lib, stream, location)
+            else:
+                files.append(str(Path(location)))
+        contacts_lib.commit()
+    return contacts_lib, log.failures
 
 
-def main():
-    """Launch the appropriate GUI based on command line arguments."""
-    if len(sys.argv) > 1:
-        arg = sys.argv[1].lower()
-        
+def open_binary_output(location):
+    """Binary stream of an output path, stdout for -."""
+    from vcf_writer import open_output
+
+    return sys.stdout.buffer if location == '-' else open_output(location)
+
+
+def write_contacts(contacts, location, output_format):
+    """Write contacts as vCards, jCard, xCard, JSON lines ({'id': ..., **contact}) or a columnar table
+    into a file or stdout.
+    """
+    from serializers import serializer_for
+
+    if output_format in TABLE_FORMATS:
+        from columnar import write_table
+
+        write_table(contacts, sys.stdout.buffer if location == '-' else location, output_format)
+        if location == '-':
+            sys.stdout.buffer.flush()
+        return
+    if output_format == 'jsonl':
+        stream = sys.stdout if location == '-' else open(location, mode='w', encoding='utf-8')
+        try:
+            for key, contact in contacts:
+                stream.write(json.dumps({'id': key, **contact}, ensure_ascii=False) + '\n')
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        return
+    output = open_binary_output(location)
+    try:
+        serializer = serializer_for('vcard3' if output_format == 'vcf' else output_format)
+        serializer.write((contact for _, contact in contacts), output)
+    finally:
+        if output is sys.stdout.buffer:
+            output.flush()
+        else:
+            output.close()
+
+
+def output_format(args):
+    """Format asked for, else guessed from the output suffix."""
+    if args.to:
+        return args.to
+    if args.output.endswith(JSON_SUFFIXES):
+        return 'jsonl'
+    from columnar import FORMATS
+
+    suffix = Path(args.output).suffix.lower()
+    if suffix in FORMATS:
+        return FORMATS[suffix]
+    return 'xcard' if args.output.endswith('.xml') else 'vcf'
+
+
+def report(args, result: dict):
+    """Print a result as one JSON line or as name: value lines."""
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for name, value in result.items():
+            print(f'{name}: {value}')
+
+
+def command_load(args, contacts_lib, errors, seconds):
+    contacts = len(contacts_lib.dic)
+    report(args, {'files': len(contacts_lib.manifest), 'contacts': contacts, 'errors': errors,
+                  'seconds': round(seconds, 3), 'contacts_per_second': round(contacts / max(seconds, 1e-9))})
+
+
+def command_stats(args, contacts_lib, errors, seconds):
+    filled = dict.fromkeys(('full_name', 'phone_numbers', 'emails', 'addresses', 'organization', 'birthday'), 0)
+    for contact in contacts_lib.dic.values():
+        for field in filled:
+            if contact.get(field):
+                filled[field] += 1
+    owners = contacts_lib.phones.owners
+    report(args, {'files': len(contacts_lib.manifest), 'contacts': len(contacts_lib.dic), 'errors': errors,
+                  **{f'with_{field}': count for field, count in filled.items()},
+                  'distinct_numbers': len(owners), 'shared_numbers': sum(len(ids) > 1 for ids in owners.values())})
+
+
+def command_dedupe(args, contacts_lib, errors, seconds):
+    for cluster in contacts_lib.find_duplicates(args.threshold):
+        names = [contacts_lib.dic[key].get('full_name') for key in cluster['ids']]
+        if args.json:
+            print(json.dumps({**cluster, 'names': names}, ensure_ascii=False))
+        else:
+            print(f"{cluster['score']:.2f} {' '.join(map(str, cluster['ids']))}: {' | '.join(map(str, names))}")
+
+
+def command_normalize(args, contacts_lib, errors, seconds):
+    from phones import normalize
+
+    def normalized():
+        for key, contact in contacts_lib.dic.items():
+            numbers = contact.get('phone_numbers') or []
+            numbers = [numbers] if isinstance(numbers, str) else numbers
+            contact['phone_numbers'] = [normalize(number, contacts_lib.phones.country) or number for number in numbers]
+            yield key, contact
+
+    write_contacts(normalized(), args.output, output_format(args))
+
+
+def command_export(args, contacts_lib, errors, seconds):
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    _, messages = contacts_lib.export(args.output, workers=max(args.workers, 8), overwrite=args.overwrite)
+    for message in messages:
+        print(message, file=sys.stderr)
+    return sum(message.startswith('Error') for message in messages)
+
+
+def command_merge(args, contacts_lib, errors, seconds):
+    if args.output == '-':
+        contacts_lib.merge(sys.stdout.buffer, order=args.order)
+        sys.stdout.buffer.flush()
+    else:
+        contacts_lib.merge(args.output, order=args.order, compression=args.compression)
+
+
+def command_convert(args, contacts_lib, errors, seconds):
+    write_contacts(contacts_lib.dic.items(), args.output, output_format(args))
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='main.py', description='Headless batch commands over VCF contacts.')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('inputs', nargs='*', metavar='INPUT',
+                        help='.vcf file, directory, .jsonl, .arrow, .parquet or .csv file or - for stdin')
+    common.add_argument('--database', metavar='FILE',
+                        help='SQLite library the inputs are added to (created if missing)')
+    common.add_argument('-w', '--workers', type=int, default=1, help='parser processes (default 1)')
+    common.add_argument('--fast', action='store_true', help='native parser for the common fields')
+    common.add_argument('--country', help='default country of phone numbers (default CZ, or the one of --database)')
+    common.add_argument('--cache', action='store_true', help='use the persistent parse cache')
+    common.add_argument('--from', dest='input_format', choices=('vcf', 'jsonl'), help='format of stdin (default vcf)')
+    common.add_argument('--json', action='store_true', help='JSON lines output')
+    common.add_argument('--profile', metavar='FILE', help='write phase timings as JSON (.prof/.pstats: cProfile data)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('load', parents=[common], help='load and report files, contacts and errors')
+    load.set_defaults(func=command_load)
+    stats = commands.add_parser('stats', parents=[common], help='field and phone number counts')
+    stats.set_defaults(func=command_stats)
+    dedupe = commands.add_parser('dedupe', parents=[common], help='duplicate clusters')
+    dedupe.set_defaults(func=command_dedupe)
+    dedupe.add_argument('--threshold', type=float, default=0.9, help='similarity needed (default 0.9)')
+    for name, text, func in (('normalize', 'phone numbers in E.164 form', command_normalize),
+                             ('convert', 'vCard <-> JSON lines, vCard 4.0, jCard, xCard', command_convert)):
+        command = commands.add_parser(name, parents=[common], help=text)
+        command.set_defaults(func=func)
+        command.add_argument('-o', '--output', default='-', help='output file, - for stdout (default)')
+        command.add_argument('--to', choices=OUTPUT_FORMATS, help='output format (default by suffix, else vcf)')
+    export = commands.add_parser('export', parents=[common], help='one file per contact')
+    export.set_defaults(func=command_export)
+    export.add_argument('-o', '--output', required=True, help='output directory')
+    export.add_argument('--overwrite', action='store_true', help='replace files already in the directory')
+    merge = commands.add_parser('merge', parents=[common], help='all contacts in one file')
+    merge.set_defaults(func=command_merge)
+    merge.add_argument('-o', '--output', default='-', help='.vcf, .vcf.gz or .vcf.zst file, - for stdout (default)')
+    merge.add_argument('--order', choices=('family_name', 'source'), help='default library order')
+    merge.add_argument('--compression', choices=('gzip', 'zstd'), help='default by suffix')
+    return parser
+
+
+def run_command(argv) -> int:
+    """Run a batch command, returns the exit code."""
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit as e:
+        return EXIT_OK if e.code == 0 else EXIT_USAGE
+    if args.workers < 1:
+        print('... --workers must be at least 1', file=sys.stderr)
+        return EXIT_USAGE
+    if not args.inputs and not args.database:
+        print('... give at least one INPUT or a --database', file=sys.stderr)
+        return EXIT_USAGE
+    start = time.perf_counter()
+    try:
+        contacts_lib, errors = load_library(args)
+        failures = args.func(args, contacts_lib, errors, time.perf_counter() - start)  # files not written
+        if contacts_lib.profiler:
+            contacts_lib.profiler.dump(args.profile)
+    except BrokenPipeError:  # the reader went away (| head), nothing more to say
+        sys.stdout = open(os.devnull, mode='w')
+        return EXIT_ERRORS
+    except (OSError, ValueError, ImportError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return EXIT_ERRORS
+    return EXIT_ERRORS if errors or failures else EXIT_OK
+
+
+def main(argv=None):
+    """Launch the appropriate GUI or batch command based on command line arguments."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return run_command(argv)
+    if argv:
+        arg = argv[0].lower()
+
         if arg in ('--st', '--streamlit', '-s'):
+            import subprocess
+
             print("Launching Streamlit interface...")
             subprocess.run([sys.executable, '-m', 'streamlit', 'run', 'gui_streamlit.py'])
         elif arg in ('--tk', '--tkinter', '-t'):
@@ -33,11 +337,13 @@ def main():
         else:
             print(f"Unknown argument: {arg}")
             print(__doc__)
+            return EXIT_USAGE
     else:
         # Default to Tkinter
         from gui_tkinter import run
         run()
+    return EXIT_OK
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
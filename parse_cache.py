@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache of parsed VCF files, so reopening a library does not run the parser again."""
+
+import json
+import os
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+CACHE_VERSION = 2  # bump when parsing gives other results (parse_vcard dictionary, charsets), old entries are dropped
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory of the application."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA') or Path.home() / '.cache'
+    return Path(base) / 'vcf_editor'
+
+
+def open_default_cache():
+    """ParseCache in the default location, None (with a message) when it cannot be opened."""
+    try:
+        return ParseCache()
+    except (OSError, sqlite3.Error) as e:
+        print(f'... parse cache disabled: {e}')
+        return None
+
+
+class ParseCache:
+    """SQLite cache of parse results keyed by file path + mtime + size, with the content hash as a second key.
+    A file is found by its stat without reading it, a copied or touched file by its content hash.
+    Parse results are stored compressed once per content hash, least recently used ones are evicted
+    when the stored data grows over max_bytes.
+    """
+
+    def __init__(self, path=None, max_bytes: int = DEFAULT_MAX_BYTES):
+        if path is None:
+            default_cache_dir().mkdir(parents=True, exist_ok=True)
+            path = default_cache_dir() / 'parse_cache.sqlite'
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.max_entry = max_bytes // 4  # bigger files are streamed and not cached
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != CACHE_VERSION:
+            self.connection.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS results;')
+            self.connection.execute(f'PRAGMA user_version={CACHE_VERSION}')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, hash TEXT);
+            CREATE TABLE IF NOT EXISTS results (hash TEXT PRIMARY KEY, data BLOB, bytes INTEGER, used REAL);
+            CREATE INDEX IF NOT EXISTS results_used ON results (used);
+        ''')
+        self.connection.commit()
+        self.bytes = self.connection.execute('SELECT COALESCE(SUM(bytes), 0) FROM results').fetchone()[0]
+
+    def get(self, location: str, state: dict):
+        """Return (contacts, errors, hash) cached for the file described by state (file_state), None on a miss.
+        Without state['hash'] only the stat is compared, with it the content hash is tried as well.
+        """
+        row = self.connection.execute('SELECT mtime, size, hash FROM files WHERE path = ?', (location,)).fetchone()
+        if row and (row[0], row[1]) == (state['mtime'], state['size']):
+            digest = row[2]
+        elif state.get('hash'):
+            digest = state['hash']
+        else:
+            return None
+        result = self.connection.execute('SELECT data FROM results WHERE hash = ?', (digest,)).fetchone()
+        if result is None:
+            return None
+        self.connection.execute('UPDATE results SET used = ? WHERE hash = ?', (time.time(), digest))
+        if not row or row != (state['mtime'], state['size'], digest):
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                    (location, state['mtime'], state['size'], digest))
+        self.hits += 1
+        contacts, errors = json.loads(zlib.decompress(result[0]))
+        return contacts, errors, digest
+
+    def put(self, location: str, state: dict, contacts: list, errors: list) -> None:
+        """Store the parse result of a file read with state (including its hash)."""
+        self.misses += 1
+        if state['size'] > self.max_entry:
+            return
+        data = zlib.compress(json.dumps([contacts, errors], ensure_ascii=False).encode('utf-8'), 1)
+        old = self.connection.execute('SELECT bytes FROM results WHERE hash = ?', (state['hash'],)).fetchone()
+        self.bytes += len(data) - (old[0] if old else 0)
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                (state['hash'], data, len(data), time.time()))
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                (location, state['mtime'], state['size'], state['hash']))
+
+    def commit(self) -> None:
+        """Evict least recently used results over the size limit and write the pending changes."""
+        if self.bytes > self.max_bytes:
+            target = self.max_bytes * 0.9  # some headroom, so not every put evicts
+            evicted = []
+            for digest, size in self.connection.execute('SELECT hash, bytes FROM results ORDER BY used'):
+                if self.bytes <= target:
+                    break
+                evicted.append((digest,))
+                self.bytes -= size
+            self.connection.executemany('DELETE FROM results WHERE hash = ?', evicted)
+            self.connection.execute('DELETE FROM files WHERE hash NOT IN (SELECT hash FROM results)')
+            self.evictions += len(evicted)
+        self.connection.commit()
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        self.connection.executescript('DELETE FROM files; DELETE FROM results;')
+        self.connection.commit()
+        self.bytes = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this session and the stored size."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'bytes': self.bytes,
+                'entries': self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]}
+
+    def __repr__(self) -> str:
+        return f'ParseCache({self.path!r}, {self.hits} hits, {self.misses} misses)'
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Offline phone number normalization and the number -> contacts index of ContactList."""
+
+import re
+
+# Country calling codes by ISO 3166 region, enough for the default country setting (no network, no metadata files)
+CALLING_CODES = {
+    'AT': '43', 'AU': '61', 'BE': '32', 'BG': '359', 'BR': '55', 'BY': '375', 'CA': '1', 'CH': '41', 'CN': '86',
+    'CZ': '420', 'DE': '49', 'DK': '45', 'EE': '372', 'ES': '34', 'FI': '358', 'FR': '33', 'GB': '44', 'GR': '30',
+    'HR': '385', 'HU': '36', 'IE': '353', 'IL': '972', 'IN': '91', 'IT': '39', 'JP': '81', 'KR': '82', 'LT': '370',
+    'LU': '352', 'LV': '371', 'MX': '52', 'NL': '31', 'NO': '47', 'NZ': '64', 'PL': '48', 'PT': '351', 'RO': '40',
+    'RS': '381', 'RU': '7', 'SE': '46', 'SI': '386', 'SK': '421', 'TR': '90', 'UA': '380', 'US': '1', 'ZA': '27',
+}
+KEEP_LEADING_ZERO = {'IT'}  # national numbers keep their 0 after the country code
+NANP = {'US', 'CA'}  # trunk prefix 1, international prefix 011
+DEFAULT_COUNTRY = 'CZ'
+MIN_DIGITS = 6  # shorter numbers (112, service codes) identify nobody
+MAX_DIGITS = 15  # E.164 limit
+EXTENSION = re.compile(r'(?:;ext=|\s*(?:ext\.?|x|#)\s*\d+$)', re.IGNORECASE)
+NOT_DIGIT = re.compile(r'\D')
+
+
+def calling_code(country: str) -> str:
+    """Calling code of an ISO region ('CZ') or the code itself ('420', '+420')."""
+    country = country.strip().lstrip('+')
+    if country.isdigit():
+        return country
+    try:
+        return CALLING_CODES[country.upper()]
+    except KeyError:
+        raise ValueError(f'unknown country {country!r}, use its calling code instead') from None
+
+
+def normalize(number, country: str = DEFAULT_COUNTRY):
+    """E.164-style form ('+420777123456') of a phone number as written in a vCard, None when it is no usable number.
+    Numbers without an international prefix are taken as national numbers of country.
+    """
+    if not number:
+        return None
+    number = str(number).strip()
+    if number[:4].lower() == 'tel:':
+        number = number[4:]
+    number = EXTENSION.split(number, 1)[0]
+    international = number.startswith('+')
+    digits = NOT_DIGIT.sub('', number)
+    region = country.upper()
+    if not international:
+        if digits.startswith('00'):
+            digits, international = digits[2:], True
+        elif region in NANP and digits.startswith('011'):
+            digits, international = digits[3:], True
+        else:
+            if region in NANP and len(digits) == 11 and digits.startswith('1'):
+                digits = digits[1:]
+            elif region not in KEEP_LEADING_ZERO:
+                digits = digits[1:] if digits.startswith('0') else digits
+            if len(digits) < MIN_DIGITS:
+                return None
+            digits = calling_code(country) + digits
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return None
+    return '+' + digits
+
+
+class PhoneIndex:
+    """Normalized phone number -> ids of the contacts having it, kept in step with ContactList.dic."""
+    __slots__ = ('country', 'owners', 'numbers')
+
+    def __init__(self, country: str = DEFAULT_COUNTRY):
+        calling_code(country)  # fail early on an unknown country
+        self.country = country
+        self.owners = {}  # normalized number -> [contact ids]
+        self.numbers = {}  # contact id -> normalized numbers, for removal
+
+    def add(self, key, phone_numbers) -> None:
+        """Index the phone numbers of the contact stored under key."""
+        if isinstance(phone_numbers, str):
+            phone_numbers = [phone_numbers]
+        numbers = tuple(dict.fromkeys(filter(None, (normalize(number, self.country)
+                                                    for number in phone_numbers or ()))))
+        if not numbers:
+            return
+        self.numbers[key] = numbers
+        for number in numbers:
+            self.owners.setdefault(number, []).append(key)
+
+    def remove(self, key) -> None:
+        """Forget the numbers of the contact stored under key."""
+        for number in self.numbers.pop(key, ()):
+            owners = self.owners[number]
+            owners.remove(key)
+            if not owners:
+                del self.owners[number]
+
+    def lookup(self, number) -> list:
+        """Ids of the contacts having number, in any format."""
+        return list(self.owners.get(normalize(number, self.country), ()))
+
+    def clear(self) -> None:
+        self.owners.clear()
+        self.numbers.clear()
+
+    def __len__(self) -> int:
+        return len(self.owners)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Opt-in timing instrumentation of ContactList loads, views and the GUI refresh paths.
+
+A Profiler sums wall and CPU (thread) time per phase and keeps bytes, cards and errors per file.
+Phases nest, so 'load' includes 'read', 'parse' and 'store', and 'parse' the per-card 'vobject',
+'extract' (parse_vcard) or 'fast_parse'. Phases timed in worker processes are added up across
+the workers and can exceed the wall time of the load. With cprofile=True the outermost phases of
+the creating thread also run under cProfile.
+
+A ContactList without a profiler only enters a shared nullcontext per file and per operation.
+The GUIs and main.py turn profiling on when VCF_PROFILE names a file to dump the results to.
+"""
+
+import os
+import time
+from threading import get_ident
+
+from Contact import fast_parse_vcard, load_vobject, parse_vcard, parse_vcf_bytes
+
+PROFILE_ENV = 'VCF_PROFILE'  # file the GUIs dump profiling results to, .prof or .pstats for cProfile data
+PSTATS_SUFFIXES = ('.prof', '.pstats')
+SLOWEST_FILES = 10  # files listed in stats()
+
+
+class Phase:
+    """Context manager adding its wall and CPU time to one phase of a Profiler, reusable but not reentrant.
+    seconds holds the wall time of the last use.
+    """
+    __slots__ = ('profiler', 'totals', 'wall', 'cpu', 'seconds')
+
+    def __init__(self, profiler, totals):
+        self.profiler = profiler
+        self.totals = totals  # [calls, wall seconds, cpu seconds] of the phase
+        self.wall = self.cpu = self.seconds = 0.0
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.cprofile is not None and get_ident() == profiler.owner:
+            if not profiler.depth:
+                profiler.cprofile.enable()
+            profiler.depth += 1
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        totals = self.totals
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+        self.seconds = wall
+        profiler = self.profiler
+        if profiler.cprofile is not None and get_ident() == profiler.owner:
+            profiler.depth -= 1
+            if not profiler.depth:
+                profiler.cprofile.disable()
+        return False
+
+
+class Profiler:
+    """Per-phase wall/CPU time and per-file bytes, cards, errors and seconds."""
+    __slots__ = ('phases', 'files', 'cprofile', 'owner', 'depth')
+
+    def __init__(self, cprofile: bool = False):
+        self.phases = {}  # name -> [calls, wall seconds, cpu seconds]
+        self.files = {}  # location -> [seconds, bytes, cards, errors], chunks of an upload add up
+        self.cprofile = None
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        self.owner = get_ident()  # cProfile follows the creating thread only
+        self.depth = 0
+
+    def phase(self, name: str) -> Phase:
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = [0, 0.0, 0.0]
+        return Phase(self, totals)
+
+    def file(self, location: str, seconds, size, cards: int, errors: int) -> None:
+        """Record one file (or upload chunk), seconds and size may be None when unknown."""
+        totals = self.files.get(location)
+        if totals is None:
+            totals = self.files[location] = [0.0, 0, 0, 0]
+        totals[0] += seconds or 0.0
+        totals[1] += size or 0
+        totals[2] += cards
+        totals[3] += errors
+
+    def merge(self, phases: dict) -> None:
+        """Add phases timed elsewhere (a worker process), as {name: [calls, wall, cpu]}."""
+        for name, (calls, wall, cpu) in phases.items():
+            totals = self.phase(name).totals
+            totals[0] += calls
+            totals[1] += wall
+            totals[2] += cpu
+
+    def parse_block(self, block: str, fast: bool = False) -> dict:
+        """Contact.parse_block with the fast parser, vobject and parse_vcard timed apart."""
+        if fast:
+            with self.phase('fast_parse'):
+                try:
+                    return fast_parse_vcard(block)
+                except (ValueError, LookupError):
+                    pass
+        with self.phase('vobject'):
+            vcard = load_vobject().readOne(block, allowQP=True)
+        with self.phase('extract'):
+            return parse_vcard(vcard)
+
+    def stats(self, slowest: int = SLOWEST_FILES) -> dict:
+        """Snapshot of everything recorded so far, phases by wall time."""
+        files = self.files.values()
+        ranked = sorted(self.files.items(), key=lambda item: item[1][0], reverse=True)[:slowest]
+        return {
+            'phases': {name: {'calls': calls, 'wall_seconds': wall, 'cpu_seconds': cpu}
+                       for name, (calls, wall, cpu) in sorted(self.phases.items(), key=lambda item: -item[1][1])},
+            'files': len(self.files),
+            'bytes': sum(totals[1] for totals in files),
+            'cards': sum(totals[2] for totals in files),
+            'errors': sum(totals[3] for totals in files),
+            'errors_by_file': {location: totals[3] for location, totals in self.files.items() if totals[3]},
+            'slowest_files': [{'location': location, 'seconds': seconds, 'bytes': size, 'cards': cards,
+                               'errors': errors} for location, (seconds, size, cards, errors) in ranked],
+        }
+
+    def dump(self, path) -> None:
+        """Write cProfile data (.prof/.pstats, needs cprofile=True) or the stats() snapshot as JSON."""
+        if str(path).endswith(PSTATS_SUFFIXES):
+            if self.cprofile is None:
+                raise ValueError('cProfile data needs Profiler(cprofile=True)')
+            self.cprofile.dump_stats(str(path))
+            return
+        import json
+        with open(path, mode='w', encoding='utf-8') as output:
+            json.dump(self.stats(), output, indent=2, ensure_ascii=False)
+
+    def reset(self) -> None:
+        self.phases.clear()
+        self.files.clear()
+        if self.cprofile is not None:
+            self.cprofile.clear()
+
+
+def profile_target():
+    """File named by VCF_PROFILE, None when profiling is not asked for."""
+    return os.environ.get(PROFILE_ENV) or None
+
+
+def from_environment():
+    """Profiler for the GUIs when VCF_PROFILE is set, with cProfile for a .prof/.pstats target."""
+    target = profile_target()
+    return Profiler(cprofile=target.endswith(PSTATS_SUFFIXES)) if target else None
+
+
+def profiled_parse_vcf_bytes(location: str, data, fast: bool = False, encoding: str = None,
+                             decode_errors: str = 'strict', first_card: int = 1):
+    """parse_vcf_bytes for worker processes, returns (contacts, errors, phases) with the phases for Profiler.merge."""
+    profiler = Profiler()
+    with profiler.phase('parse'):
+        contacts, errors = parse_vcf_bytes(location, data, fast, encoding, decode_errors, first_card,
+                                           parse=profiler.parse_block)
+    return contacts, errors, profiler.phases
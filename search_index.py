@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Full-text and prefix search over a contact library.
+
+Tokens are transliterated (unidecode) and case-folded words of the names and the
+organization, the local part and domain of emails and the digits of phone numbers.
+An inverted index maps every token to the ids of the contacts having it; prefix
+lookups go through the tokens kept sorted, a flat equivalent of a trie that does not
+need a node object per character.
+"""
+
+import heapq
+import re
+import sys
+from bisect import bisect_left, insort
+
+from unidecode import unidecode
+
+from phones import DEFAULT_COUNTRY, normalize
+
+TOKEN = re.compile(r'[a-z0-9]+')
+PHONE_QUERY = re.compile(r'[+\d][\d\s()./-]*\Z')
+DIGIT_GROUP = re.compile(r'\d+')
+TEXT_FIELDS = ('full_name', 'given_name', 'family_name', 'organization')
+MIN_PHONE_TOKEN = 3  # shortest phone digit suffix indexed
+MAX_EXPANSIONS = 2000  # tokens a prefix is expanded to at most
+CANDIDATES = 20  # candidates ranked per requested result before stopping the expansion
+RECENT_LIMIT = 4096  # tokens kept apart from the big sorted list before a merge
+
+
+def text_tokens(value) -> list:
+    """Transliterated case-folded words of a text."""
+    if not value:
+        return []
+    text = str(value)
+    return TOKEN.findall((text if text.isascii() else unidecode(text)).lower())
+
+
+def phone_tokens(number: str, country: str = DEFAULT_COUNTRY) -> list:
+    """Digits of a phone number as written and normalized, plus its suffixes starting at a digit group."""
+    groups = DIGIT_GROUP.findall(str(number))
+    tokens = [''.join(groups[start:]) for start in range(len(groups))]
+    normalized = normalize(number, country)
+    if normalized:
+        tokens.append(normalized[1:])
+    return [token for token in tokens if len(token) >= MIN_PHONE_TOKEN]
+
+
+def contact_tokens(contact: dict, country: str = DEFAULT_COUNTRY) -> set:
+    """Every token a contact can be found by."""
+    tokens = set()
+    for field in TEXT_FIELDS:
+        tokens.update(text_tokens(contact.get(field)))
+    emails = contact.get('emails') or []
+    for email in [emails] if isinstance(emails, str) else emails:
+        tokens.update(text_tokens(email))
+    phones = contact.get('phone_numbers') or []
+    for number in [phones] if isinstance(phones, str) else phones:
+        tokens.update(phone_tokens(number, country))
+    return tokens
+
+
+def query_terms(text: str) -> list:
+    """Search terms of a query, a phone number written with separators stays one term."""
+    text = text.strip()
+    if PHONE_QUERY.match(text):
+        digits = ''.join(DIGIT_GROUP.findall(text))
+        return [digits[2:] if digits.startswith('00') else digits]
+    return list(dict.fromkeys(text_tokens(text)))
+
+
+def term_score(term: str, tokens) -> float:
+    """How well a contact's tokens match one search term: 1 for a whole token, less for a longer token."""
+    best = 0.0
+    for token in tokens:
+        if token.startswith(term):
+            best = max(best, len(term) / len(token))
+    return best
+
+
+class SearchIndex:
+    """Inverted index token -> contact ids with prefix lookup, updated contact by contact."""
+    __slots__ = ('country', 'postings', 'tokens', 'sorted', 'recent', 'pending')
+
+    def __init__(self, country: str = DEFAULT_COUNTRY):
+        self.country = country
+        self.postings = {}  # token -> contact id, or [contact ids] when more contacts have it
+        self.tokens = {}  # contact id -> tokens, for removal and ranking
+        self.sorted = []  # every token in order, may still hold tokens whose contacts are gone
+        self.recent = []  # sorted tokens added since the last merge
+        self.pending = []  # tokens of a bulk load, sorted on the next query
+
+    def add(self, key, contact: dict) -> None:
+        """Index the contact stored under key."""
+        tokens = tuple(sys.intern(token) for token in contact_tokens(contact, self.country))
+        self.tokens[key] = tokens
+        postings = self.postings
+        for token in tokens:
+            ids = postings.get(token, postings)  # postings itself marks a new token, None is a valid id
+            if ids is postings:
+                postings[token] = key  # most tokens (phones, emails) belong to one contact, no list for them
+                self.pending.append(token)
+            elif type(ids) is list:
+                ids.append(key)
+            else:
+                postings[token] = [ids, key]
+
+    def remove(self, key) -> None:
+        """Forget the contact stored under key."""
+        for token in self.tokens.pop(key, ()):
+            ids = self.postings[token]
+            if type(ids) is list:
+                ids.remove(key)
+                if len(ids) == 1:
+                    self.postings[token] = ids[0]
+            else:
+                del self.postings[token]  # stays in the sorted lists until the next merge
+
+    def ids(self, token: str) -> list:
+        """Ids of the contacts having token."""
+        ids = self.postings.get(token, ())
+        return ids if type(ids) is list or ids == () else [ids]
+
+    def update(self, key, contact: dict) -> None:
+        self.remove(key)
+        self.add(key, contact)
+
+    def _sort_pending(self) -> None:
+        """Move new tokens into the sorted lists, a bulk of them goes straight into the big one."""
+        if len(self.pending) + len(self.recent) > RECENT_LIMIT:
+            self.sorted = sorted({*self.sorted, *self.recent, *self.pending} & self.postings.keys())
+            self.recent = []
+        else:
+            for token in self.pending:
+                insort(self.recent, token)
+        self.pending = []
+
+    def expand(self, prefix: str) -> list:
+        """Tokens starting with prefix, the whole word first and then shorter ones first."""
+        if self.pending:
+            self._sort_pending()
+        found = []
+        for tokens in (self.sorted, self.recent):
+            position = bisect_left(tokens, prefix)
+            while position < len(tokens) and tokens[position].startswith(prefix) and len(found) < MAX_EXPANSIONS:
+                if tokens[position] in self.postings:
+                    found.append(tokens[position])
+                position += 1
+        return sorted(set(found), key=lambda token: (len(token), token))
+
+    def query(self, text: str, limit: int = 20) -> list:
+        """Ids of contacts matching every term of text (as a word or word prefix), best matches first."""
+        terms = query_terms(text)
+        if not terms or limit <= 0:
+            return []
+        expansions = {term: self.expand(term) for term in terms}
+        # candidates come from the term with the fewest contacts, the others only filter and rank them
+        anchor = min(terms, key=lambda term: sum(map(self.count, expansions[term])))
+        others = [term for term in terms if term != anchor]
+        wanted = limit * CANDIDATES  # enough to rank, common words would otherwise walk the whole library
+        ranked, seen = [], set()
+        for token in expansions[anchor]:
+            anchor_score = len(anchor) / len(token)
+            for key in self.ids(token):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = anchor_score
+                for term in others:
+                    matched = term_score(term, self.tokens[key])
+                    if not matched:
+                        break
+                    score += matched
+                else:
+                    ranked.append((-score, len(seen), key))
+                    if len(ranked) >= wanted:
+                        break
+            if len(ranked) >= wanted:
+                break
+        return [key for _, _, key in heapq.nsmallest(limit, ranked)]
+
+    def count(self, token: str) -> int:
+        """Number of contacts having token."""
+        ids = self.postings.get(token, ())
+        return len(ids) if type(ids) is list or ids == () else 1
+
+    def clear(self) -> None:
+        self.__init__(self.country)
+
+    def __len__(self) -> int:
+        return len(self.postings)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Pluggable output formats for parse_vcard dictionaries: vCard 3.0, vCard 4.0, jCard and xCard.
+
+Every format is a Serializer subclass registered under its name in SERIALIZERS. card() turns one
+contact into text from vcf_writer.fields(), write() streams many of them between the format's
+header and footer through vcf_writer.write_chunked, so no vobject objects are built and memory
+does not grow with the number of contacts. jCard (RFC 7095) is written as JSON lines, one card
+array per line, xCard (RFC 6351) as one <vcards> document.
+
+parse_vcard does not keep the TYPE of phones, emails and addresses, they are written as
+DEFAULT_TYPES unless other types (or None for no TYPE) are given. Nor does it keep the parts of an
+address, only their joined text, which vCard 4.0, jCard and xCard carry in the LABEL parameter of
+an ADR with empty components (vCard 3.0 has no LABEL parameter and keeps it as the street).
+"""
+
+import os
+import re
+from abc import ABC, abstractmethod
+from json.encoder import encode_basestring
+from pathlib import Path
+
+from vcf_writer import BUFFER_SIZE, fields, fold, serialize_vcard, text_value, write_chunked
+
+DEFAULT_TYPES = {'TEL': 'cell', 'EMAIL': 'home', 'ADR': 'home'}
+DATE = re.compile(r'(\d{4}|-)-?(\d{2})-?(\d{2})(T[\d:]+(?:Z|[+-][\d:]+)?)?$')  # year or --, month, day, time
+XML_NAMESPACE = 'urn:ietf:params:xml:ns:vcard-4.0'
+XML_ESCAPES = {ord('&'): '&amp;', ord('<'): '&lt;', ord('>'): '&gt;',
+               **{code: '\ufffd' for code in range(32) if chr(code) not in '\t\n\r'}}  # not allowed in XML 1.0
+EMPTY_ADR = ('',) * 7  # components of an ADR whose address is in LABEL
+CARET_ESCAPES = {ord('^'): '^^', ord('\n'): '^n', ord('"'): "^'"}  # RFC 6868, in quoted parameter values
+XML_PARTS = {'N': ('surname', 'given', 'additional', 'prefix', 'suffix'),
+             'ADR': ('pobox', 'ext', 'street', 'locality', 'region', 'code', 'country')}
+SERIALIZERS = {}  # name -> Serializer subclass
+
+
+def register(serializer):
+    """Class decorator adding a Serializer subclass to SERIALIZERS under its name."""
+    SERIALIZERS[serializer.name] = serializer
+    return serializer
+
+
+def serializer_for(name: str, types: dict = None) -> 'Serializer':
+    """Serializer instance of a registered format."""
+    try:
+        return SERIALIZERS[name](types)
+    except KeyError:
+        raise ValueError(f"unknown format {name!r}, use one of {', '.join(SERIALIZERS)}") from None
+
+
+def format_of(path, default: str = 'vcard3') -> str:
+    """Format registered for the suffix of an output path, default for anything else."""
+    suffix = Path(str(path)).suffix.lower()
+    for name, serializer in SERIALIZERS.items():
+        if suffix in serializer.suffixes:
+            return name
+    return default
+
+
+def date_value(value: str, extended: bool = False):
+    """(value type, date) of a BDAY: 'date' or 'date-time' with the ISO 8601 date in basic or extended format,
+    ('text', value) when it is no date.
+    """
+    match = DATE.match(value)
+    if match is None:
+        return 'text', value
+    year, month, day, time = match.groups()
+    if year == '-':  # --MMDD, no year
+        date = f'--{month}-{day}' if extended else f'--{month}{day}'
+    else:
+        date = f'{year}-{month}-{day}' if extended else f'{year}{month}{day}'
+    return ('date-time', date + time) if time else ('date', date)
+
+
+class Serializer(ABC):
+    """Writes parse_vcard dictionaries in one format, subclasses set name, suffixes, header, footer and card()."""
+    name = None
+    suffixes = ()  # output suffixes format_of() maps to the format
+    header = footer = ''  # text around the cards of a stream
+    __slots__ = ('types',)
+
+    def __init__(self, types: dict = None):
+        self.types = dict(DEFAULT_TYPES, **(types or {}))  # property name -> TYPE, None for none
+
+    @abstractmethod
+    def card(self, contact: dict) -> str:
+        """Text of one contact in the format."""
+
+    def properties(self, contact: dict):
+        """vcf_writer.fields() with the TYPE of this serializer."""
+        for name, kind, value in fields(contact):
+            yield name, kind and self.types.get(name), value
+
+    def write(self, contacts, output, buffer_size: int = BUFFER_SIZE) -> int:
+        """Write contacts into a binary stream or path, returns the card count."""
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, mode='wb') as stream:
+                return self.write(contacts, stream, buffer_size)
+        if self.header:
+            output.write(self.header.encode('utf-8'))
+        count = write_chunked((self.card(contact).encode('utf-8', 'surrogatepass') for contact in contacts),
+                              output, buffer_size)
+        if self.footer:
+            output.write(self.footer.encode('utf-8'))
+        return count
+
+
+@register
+class VCard30(Serializer):
+    """vCard 3.0 (RFC 2426), as vcf_writer.serialize_vcard when the types are the default."""
+    name = 'vcard3'
+    suffixes = ('.vcf', '.vcard')
+    __slots__ = ()
+
+    def card(self, contact: dict) -> str:
+        if self.types == DEFAULT_TYPES:
+            return serialize_vcard(contact)
+        lines = ['BEGIN:VCARD\r\n', 'VERSION:3.0\r\n']
+        for name, kind, value in self.properties(contact):
+            lines.append(fold(f'{name};TYPE={kind.upper()}:{text_value(value)}' if kind
+                              else f'{name}:{text_value(value)}'))
+        lines.append('END:VCARD\r\n')
+        return ''.join(lines)
+
+
+@register
+class VCard40(Serializer):
+    """vCard 4.0 (RFC 6350), BDAY in the basic date format or marked VALUE=text when it is no date."""
+    name = 'vcard4'
+    __slots__ = ()
+
+    def card(self, contact: dict) -> str:
+        lines = ['BEGIN:VCARD\r\n', 'VERSION:4.0\r\n']
+        for name, kind, value in self.properties(contact):
+            parameters = f';TYPE={kind}' if kind else ''
+            if name == 'ADR':
+                parameters += f';LABEL="{value[2].translate(CARET_ESCAPES)}"'
+                value = EMPTY_ADR
+            elif name == 'BDAY':
+                kind_of_value, value = date_value(value)
+                if kind_of_value == 'text':
+                    parameters = ';VALUE=text'
+            lines.append(fold(f'{name}{parameters}:{text_value(value)}'))
+        lines.append('END:VCARD\r\n')
+        return ''.join(lines)
+
+
+@register
+class JCard(Serializer):
+    """jCard (RFC 7095) JSON lines, ["vcard", [properties]] per line."""
+    name = 'jcard'
+    __slots__ = ()
+
+    def card(self, contact: dict) -> str:
+        """The JSON text is put together here, a json.dumps of nested lists per card is about three times slower."""
+        parts = ['["vcard",[["version",{},"text","4.0"]']
+        for name, kind, value in self.properties(contact):
+            parameters = f'"type":{encode_basestring(kind)}' if kind else ''
+            if name == 'ADR':
+                label = f'"label":{encode_basestring(value[2])}'
+                parameters = f'{parameters},{label}' if parameters else label
+                value = EMPTY_ADR
+            kind_of_value, value = date_value(value, extended=True) if name == 'BDAY' else ('text', value)
+            if isinstance(value, str):
+                value = encode_basestring(value)
+            else:
+                value = f"[{','.join(map(encode_basestring, value))}]"
+            parts.append(f',["{name.lower()}",{{{parameters}}},"{kind_of_value}",{value}]')
+        parts.append(']]\n')
+        return ''.join(parts)
+
+
+@register
+class XCard(Serializer):
+    """xCard (RFC 6351), one <vcard> element per line inside a <vcards> document."""
+    name = 'xcard'
+    suffixes = ('.xml',)
+    header = f'<?xml version="1.0" encoding="UTF-8"?>\n<vcards xmlns="{XML_NAMESPACE}">\n'
+    footer = '</vcards>\n'
+    __slots__ = ()
+
+    def card(self, contact: dict) -> str:
+        elements = ['<vcard>']
+        for name, kind, value in self.properties(contact):
+            tag = name.lower()
+            elements.append(f'<{tag}>')
+            parameters = f'<type><text>{kind.translate(XML_ESCAPES)}</text></type>' if kind else ''
+            if name == 'ADR':
+                parameters += f'<label><text>{value[2].translate(XML_ESCAPES)}</text></label>'
+                value = EMPTY_ADR
+            if parameters:
+                elements.append(f'<parameters>{parameters}</parameters>')
+            if name in XML_PARTS:
+                elements += [f'<{part}>{text.translate(XML_ESCAPES)}</{part}>' if text else f'<{part}/>'
+                             for part, text in zip(XML_PARTS[name], value)]
+            else:
+                kind_of_value, value = date_value(value) if name == 'BDAY' else ('text', value)
+                elements.append(f'<{kind_of_value}>{value.translate(XML_ESCAPES)}</{kind_of_value}>')
+            elements.append(f'</{tag}>')
+        elements.append('</vcard>\n')
+        return ''.join(elements)
@@ -0,0 +1,21 @@
+"""Shared pytest setup - wall-clock benchmarks run only when asked for."""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmarks', action='store_true',
+                     help='also run the tests marked benchmark, they assert timings of this machine')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: asserts wall-clock timings, skipped without --benchmarks')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='wall-clock benchmark, run with --benchmarks')
+    for item in items:
+        if item.get_closest_marker('benchmark'):
+            item.add_marker(skip)
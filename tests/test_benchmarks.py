@@ -0,0 +1,72 @@
+"""Unit tests for the benchmark corpus generator and suite."""
+
+import pytest
+
+from benchmarks.bench_suite import compare, measure
+from benchmarks.corpus import corpus_card, corpus_contacts, write_corpus
+from Contact import ContactList
+
+
+@pytest.fixture(params=[False, True], ids=['vobject', 'fast'])
+def fast(request):
+    return request.param
+
+
+class TestCorpus:
+    """Tests for benchmarks/corpus.py."""
+
+    def test_deterministic(self, tmp_path):
+        """The same count and seed give the same bytes, another seed other ones."""
+        first = write_corpus(tmp_path / 'a', 300)['path'].read_bytes()
+        assert write_corpus(tmp_path / 'b', 300)['path'].read_bytes() == first
+        assert write_corpus(tmp_path / 'c', 300, seed=1)['path'].read_bytes() != first
+
+    def test_versions_and_qp(self):
+        """Cards come in all three versions, non-ASCII 2.1 values quoted-printable encoded."""
+        cards = [corpus_card(version, contact) for version, contact in corpus_contacts(300)]
+        text = ''.join(cards)
+        assert {'VERSION:2.1', 'VERSION:3.0', 'VERSION:4.0'} <= set(line for card in cards for line in card.split('\r\n'))
+        assert 'FN;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:' in text
+        assert '=\r\n' in text  # soft line breaks of long values
+        assert 'Алексеева' in text  # 3.0 and 4.0 stay plain utf-8
+
+    @pytest.mark.parametrize('layout', ['single', 'files'])
+    def test_loads_back(self, tmp_path, layout, fast):
+        """Both layouts load into exactly the generated contacts with either parser."""
+        written = write_corpus(tmp_path, 300, layout)
+        contacts_lib = ContactList(str(written['path']), is_dir=layout == 'files', fast=fast)
+        expected = [contact for _, contact in corpus_contacts(300)]
+        loaded = list(contacts_lib.dic.values())
+        if layout == 'files':  # files are loaded in name order
+            key = lambda contact: (contact['full_name'], contact['emails'])
+            loaded, expected = sorted(loaded, key=key), sorted(expected, key=key)
+        assert loaded == expected
+        assert written['files'] == (300 if layout == 'files' else 1)
+
+    def test_unknown_layout(self, tmp_path):
+        with pytest.raises(ValueError):
+            write_corpus(tmp_path, 10, 'zip')
+
+
+class TestSuite:
+    """Tests for benchmarks/bench_suite.py."""
+
+    def test_measure(self):
+        """Every phase is measured on a small corpus without errors."""
+        result = measure(200, 'single', fast=True)
+        assert (result['contacts'], result['errors']) == (200, 0)
+        for metric in ('load_cards_per_second', 'parse_cards_per_second', 'search_queries_per_second',
+                       'dedupe_cards_per_second', 'export_cards_per_second'):
+            assert result[metric] > 0
+
+    def test_compare(self):
+        """Rates falling and peak RSS growing beyond the tolerance are regressions, improvements are not."""
+        baseline = {'results': {'single': {'load_cards_per_second': 1000.0, 'export_cards_per_second': 1000.0,
+                                           'peak_rss_mb': 100.0, 'load_seconds': 1.0}}}
+        current = {'results': {'single': {'load_cards_per_second': 700.0, 'export_cards_per_second': 2000.0,
+                                          'peak_rss_mb': 130.0, 'load_seconds': 9.0},
+                               'files': {'load_cards_per_second': 1.0}}}
+        regressions = compare(current, baseline, tolerance=0.2)
+        assert [(layout, metric) for layout, metric, *_ in regressions] == [
+            ('single', 'load_cards_per_second'), ('single', 'peak_rss_mb')]
+        assert compare(current, baseline, tolerance=0.5) == []
@@ -0,0 +1,122 @@
+"""Unit tests for columnar.py - Arrow IPC, Parquet and CSV snapshots of a contact library."""
+
+import io
+import sys
+
+import pytest
+
+from benchmarks.bench_store import synthetic_contacts
+from columnar import read_table, table_format, write_table
+from Contact import ContactList
+from main import main
+from vcf_writer import serialize_vcard
+
+
+@pytest.fixture
+def contacts_lib(capsys):
+    """Library of synthetic contacts, one with values CSV and Arrow have to quote or keep as lists."""
+    contacts_lib = ContactList('')
+    for contact in synthetic_contacts(30):
+        contacts_lib.add(contact)
+    contacts_lib.add({'full_name': 'Kůň, "Eva"\nMalá', 'given_name': None, 'family_name': None,
+                      'phone_numbers': '777 123 456', 'emails': [], 'addresses': ['Dlouhá 5, Praha', 'Brno'],
+                      'organization': None, 'job_title': None, 'birthday': None, 'notes': 'a;b'})
+    capsys.readouterr()
+    return contacts_lib
+
+
+def expected(contacts_lib) -> list:
+    """The contacts as a snapshot reads them back, a single phone string as a list."""
+    return [dict(contact, phone_numbers=[contact['phone_numbers']])
+            if isinstance(contact['phone_numbers'], str) else contact for contact in contacts_lib.dic.values()]
+
+
+def reloaded(path, table_format: str = None) -> ContactList:
+    contacts_lib = ContactList('')
+    contacts_lib.load_table(path, table_format)
+    return contacts_lib
+
+
+class TestCsv:
+    """CSV snapshots, written and read without pyarrow."""
+
+    def test_roundtrip(self, contacts_lib, tmp_path, capsys):
+        assert contacts_lib.export_table(tmp_path / 'library.csv') == 31
+        assert list(reloaded(tmp_path / 'library.csv').dic.values()) == expected(contacts_lib)
+        header = (tmp_path / 'library.csv').read_text(encoding='utf-8').splitlines()[0]
+        assert header.startswith('id,full_name,')
+
+    def test_stream(self, contacts_lib):
+        """A binary stream gets the format named and stays open."""
+        output = io.BytesIO()
+        assert write_table(contacts_lib.dic.items(), output, 'csv', batch_rows=4) == 31
+        assert not output.closed and output.getvalue().count(b'\r\n') >= 32
+
+
+class TestArrow:
+    """Arrow IPC and Parquet snapshots, they need pyarrow."""
+
+    @pytest.mark.parametrize('suffix', ['.arrow', '.feather', '.parquet'])
+    def test_roundtrip(self, contacts_lib, tmp_path, capsys, suffix):
+        pytest.importorskip('pyarrow')
+        path = tmp_path / f'library{suffix}'
+        assert contacts_lib.export_table(path) == 31
+        assert list(reloaded(path).dic.values()) == expected(contacts_lib)
+        assert 'Error' not in capsys.readouterr().out
+
+    def test_record_batches(self, contacts_lib, tmp_path):
+        """Rows are written batch_rows at a time, as list columns."""
+        pyarrow = pytest.importorskip('pyarrow')
+        from pyarrow import parquet
+
+        contacts_lib.export_table(tmp_path / 'library.arrow', batch_rows=8)
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(str(tmp_path / 'library.arrow')))
+        assert reader.num_record_batches == 4
+        assert reader.schema.field('phone_numbers').type == pyarrow.list_(pyarrow.string())
+        assert reader.read_all().column('id').to_pylist() == list(contacts_lib.dic.keys())
+        contacts_lib.export_table(tmp_path / 'library.parquet', batch_rows=8)
+        assert parquet.ParquetFile(str(tmp_path / 'library.parquet')).num_row_groups == 4
+        assert len(list(read_table(tmp_path / 'library.parquet', batch_rows=5))) == 31
+
+    def test_missing_pyarrow(self, contacts_lib, tmp_path, monkeypatch):
+        """Without pyarrow the error says what to install, CSV still works."""
+        monkeypatch.setitem(sys.modules, 'pyarrow', None)
+        with pytest.raises(ImportError, match='pip install pyarrow'):
+            contacts_lib.export_table(tmp_path / 'library.parquet')
+        assert contacts_lib.export_table(tmp_path / 'library.csv') == 31
+
+
+class TestFormats:
+    """Tests for picking the format."""
+
+    def test_table_format(self):
+        assert table_format('a.PARQUET') == 'parquet' and table_format('a.ipc') == 'arrow'
+        assert table_format('-', 'csv') == 'csv'
+        with pytest.raises(ValueError):
+            table_format('a.vcf')
+
+    def test_missing_file(self, capsys, tmp_path):
+        assert reloaded(tmp_path / 'missing.csv').dic == {}
+        assert 'Error loading file' in capsys.readouterr().out
+
+
+class TestCommandLine:
+    """main.py convert into and loading from snapshots."""
+
+    def test_convert(self, tmp_path, capsys):
+        source = tmp_path / 'in.vcf'
+        source.write_text(''.join(map(serialize_vcard, synthetic_contacts(20))), encoding='utf-8')
+        assert main(['convert', str(source), '-o', str(tmp_path / 'out.csv')]) == 0
+        assert main(['load', str(tmp_path / 'out.csv'), str(source), '--json']) == 0
+        assert '"contacts": 40' in capsys.readouterr().out
+
+
+class TestColumnarBenchmark:
+    """Reloading a snapshot against parsing the vCards."""
+
+    @pytest.mark.benchmark
+    def test_snapshot_faster_than_parsing(self):
+        from benchmarks.bench_columnar import measure
+
+        result = measure(2000)
+        assert result['csv_load_seconds'] < result['vcf_fast_seconds']
@@ -1,16 +1,32 @@
 """Unit tests for Contact.py - VCF contact handling."""
 
+import io
+import os
+import quopri
+import random
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 from pathlib import Path
 
 import pytest
 import vobject
 
 from Contact import (
+    RELEASE_BYTES,
     ContactList,
     create_vcard,
+    decode_card,
+    fast_parse_vcard,
+    iter_card_chunks,
+    iter_card_spans,
     name_value,
+    parse_block,
     parse_vcard,
+    parse_vcf_bytes,
+    utf16_charset,
 )
 
 
@@ -311,6 +327,18 @@ class TestContactList:
         contact_list = ContactList(temp_vcf_file, is_dir=False)
         assert contact_list.counter == 1
 
+    def test_version_follows_changes(self, temp_vcf_file):
+        """Every add, update and remove should bump the version, reading should not."""
+        contact_list = ContactList(temp_vcf_file, is_dir=False)
+        version = contact_list.version
+        assert version == 1
+        contact_list.query('john')
+        assert contact_list.version == version
+        key = contact_list.add({'full_name': 'Jane Doe'})
+        contact_list.update(key, {'full_name': 'Jane Roe'})
+        contact_list.remove(key)
+        assert contact_list.version == version + 3
+
     def test_load_multiple_vcards_from_single_file(self):
         """Should load multiple vCards from a single file."""
         multi_vcard = """BEGIN:VCARD
@@ -350,6 +378,53 @@ END:VCARD"""
             assert 'John Doe.vcf' in [f.name for f in exported_files]
 
 
+@pytest.fixture
+def table_library():
+    """ContactList with names, organizations and an empty one for page views."""
+    contact_list = ContactList('')
+    for name, organization in [('Petr Šťastný', 'Beta'), ('adam Zelený', None), ('Eva Adámková', 'alfa'),
+                               ('Jan Novák', 'Gama'), ('Jana Nová', 'Beta')]:
+        given, family = name.split()
+        contact_list.add({'full_name': name, 'given_name': given, 'family_name': family, 'organization': organization})
+    return contact_list
+
+
+class TestPage:
+    """Tests for ContactList.page and sorted_keys behind the Streamlit table."""
+
+    def test_library_order(self, table_library):
+        """Without text and sort, pages follow the indexes."""
+        assert table_library.page(size=2) == (5, [1, 2])
+        assert table_library.page(start=4, size=2) == (5, [5])
+        assert table_library.page(start=10) == (5, [])
+        assert table_library.page(descending=True, size=2) == (5, [5, 4])
+        assert table_library.page(descending=True, start=4, size=2) == (5, [1])
+
+    def test_sorted(self, table_library):
+        """Sorting is transliterated and case-insensitive, empty values go last."""
+        assert table_library.page(sort='family_name')[1] == [3, 5, 4, 1, 2]
+        assert table_library.page(sort='organization')[1] == [3, 1, 5, 4, 2]
+        assert table_library.page(sort='given_name', descending=True, size=2)[1] == [1, 5]
+        with pytest.raises(ValueError):
+            table_library.page(sort='notes')
+
+    def test_search(self, table_library):
+        """Text filters through the search index, results can be sorted too."""
+        assert table_library.page('jan') == (2, [4, 5])
+        assert table_library.page('jan', sort='family_name') == (2, [5, 4])
+        assert table_library.page('beta', sort='given_name', descending=True) == (2, [1, 5])
+        assert table_library.page('nobody') == (0, [])
+
+    def test_order_cached_until_change(self, table_library):
+        """The sorted order is built once per library version."""
+        keys = table_library.sorted_keys('family_name')
+        assert table_library.sorted_keys('family_name') is keys
+        key = table_library.add({'full_name': 'Aaron Aaronson', 'family_name': 'Aaronson'})
+        assert table_library.sorted_keys('family_name')[0] == key
+        table_library.remove(key)
+        assert table_library.sorted_keys('family_name') == keys
+
+
 # --- Tests for name_value helper ---
 
 class TestNameValue:
@@ -545,3 +620,526 @@ class TestRoundTrip:
         finally:
             Path(temp_path).unlink(missing_ok=True)
 
+
+
+# --- Streaming reader ---
+
+def write_synthetic_vcf(path, megabytes):
+    """Write a synthetic single-file library of roughly the given size."""
+    card = "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Person {0}\r\nN:Person;{0};;;\r\nTEL;TYPE=CELL:{0:010d}\r\nEND:VCARD\r\n"
+    chunk = ''.join(card.format(i) for i in range(10000))
+    with open(path, mode='w', encoding='utf-8', newline='') as f:
+        for _ in range(megabytes * 2 ** 20 // len(chunk) + 1):
+            f.write(chunk)
+
+
+def peak_rss_of_streaming(path):
+    """Load a file with ContactList.open_vcf in a fresh interpreter and return (contacts, memory in bytes the load
+    needed on top of what it kept): peak RSS less the RSS left with the loaded contacts."""
+    script = (
+        "import sys\n"
+        "from Contact import ContactList\n"
+        "contacts_lib = ContactList('', fast=True)\n"
+        "contacts_lib.open_vcf(sys.argv[1])\n"
+        "status = dict(line.split(':', 1) for line in open('/proc/self/status').read().splitlines())\n"
+        "print(len(contacts_lib.dic), (int(status['VmHWM'].split()[0]) - int(status['VmRSS'].split()[0])) * 1024)\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script, str(path)], capture_output=True, text=True,
+                            cwd=Path(__file__).parent.parent, check=True)
+    count, peak = result.stdout.split()[-2:]
+    return int(count), int(peak)
+
+
+class TestStreamingReader:
+    """Tests for the card by card BEGIN:VCARD ... END:VCARD reader."""
+
+    def test_blocks_split_per_card(self):
+        """Should yield one span per card and ignore text between cards."""
+        data = b"garbage\nBEGIN:VCARD\nFN:One\nEND:VCARD\n\nbegin:vcard\nFN:Two\nend:vcard\n"
+        blocks = [data[start:end] for start, end in iter_card_spans(data)]
+        assert blocks == [b"BEGIN:VCARD\nFN:One\nEND:VCARD\n", b"begin:vcard\nFN:Two\nend:vcard\n"]
+
+    def test_nested_card_stays_in_parent(self):
+        """A vCard 2.1 AGENT card should not split the parent block."""
+        data = b"BEGIN:VCARD\nAGENT:\nBEGIN:VCARD\nFN:Agent\nEND:VCARD\nFN:Parent\nEND:VCARD\n"
+        blocks = [data[start:end] for start, end in iter_card_spans(data)]
+        assert len(blocks) == 1
+        assert b'FN:Parent' in blocks[0]
+
+    def test_iter_vcf_fills_dic_lazily(self):
+        """Contacts should appear in dic one by one while the generator is consumed."""
+        sample_path = Path(__file__).parent.parent / 'sample' / 'contacts.vcf'
+        contact_list = ContactList('', is_dir=False)
+        loader = contact_list.iter_vcf(str(sample_path))
+        index, contact = next(loader)
+        assert index == 1
+        assert len(contact_list.dic) == 1
+        assert contact['full_name'] == 'Alice Johnson'
+        assert len(list(loader)) == 7
+        assert len(contact_list.dic) == 8
+
+    def test_broken_card_is_skipped(self, capsys):
+        """One unparsable card should not drop the rest of the file."""
+        data = """BEGIN:VCARD
+VERSION:3.0
+FN:Good One
+END:VCARD
+BEGIN:VCARD
+VERSION:3.0
+this line is not a property
+END:VCARD
+BEGIN:VCARD
+VERSION:3.0
+FN:Good Two
+END:VCARD
+"""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.vcf', delete=False, encoding='utf-8') as f:
+            f.write(data)
+            temp_path = f.name
+        try:
+            contact_list = ContactList(temp_path, is_dir=False)
+            assert [c['full_name'] for c in contact_list.dic.values()] == ['Good One', 'Good Two']
+            assert 'Error loading card 2' in capsys.readouterr().out
+        finally:
+            Path(temp_path).unlink(missing_ok=True)
+
+    @pytest.mark.benchmark
+    @pytest.mark.skipif(not Path('/proc/self/status').exists(), reason='reads VmHWM of Linux')
+    def test_peak_memory_flat_for_large_file(self, tmp_path):
+        """The mapped file is released as it is parsed, loading a multi-hundred-MB file needs no more memory than
+        a small one beyond the contacts kept: at most the pages read since the last release."""
+        small, large = tmp_path / 'small.vcf', tmp_path / 'large.vcf'
+        write_synthetic_vcf(small, 4)
+        write_synthetic_vcf(large, 256)
+        small_cards, small_peak = peak_rss_of_streaming(small)
+        large_cards, large_peak = peak_rss_of_streaming(large)
+        assert large_cards > 50 * small_cards
+        assert large_peak < small_peak + RELEASE_BYTES + 2 ** 20
+
+
+# --- Fast parser ---
+
+SAMPLE_DIR = Path(__file__).parent.parent / 'sample'
+
+EQUIVALENCE_CARDS = [
+    "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:A\\, B\\; C\\nD\\\\E\r\nN:Fam\\,ily;Giv,en;;;\r\nNOTE:line1\\nline2\\, x\r\n"
+    "TITLE:T\\;x\r\nORG:Acme;Dept\\;x\r\nBDAY:1990-01-02\r\nTEL;TYPE=CELL:+1 (555) 123\r\nEMAIL:a@b.c\r\n"
+    "ADR;TYPE=HOME:pobox;ext;Street 1\\, x;City;Reg;123;CZ\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\r\nVERSION:2.1\r\nN;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:=D0=98=D0=B2;=D0=9D=D0=B8\r\n"
+    "FN;CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE:=D0=98=D0=B2=\r\n=D0=9D\r\nTEL;CELL:123\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\r\nVERSION:2.1\r\nFN;ENCODING=QUOTED-PRINTABLE:a=3Db\r\nNOTE;QUOTED-PRINTABLE:x=20y\r\n"
+    "NOTE;ENCODING=QUOTED-PRINTABLE;CHARSET=windows-1250:=8A=E8\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Long\r\n  folded\r\nN:A\r\n ;B\r\nNOTE:a\r\n\tb\r\nADR:;;street\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\r\nVERSION:3.0\r\nitem1.TEL:123\r\nitem1.X-ABLabel:mobile\r\nfn:x\r\nfn:y\r\nN:Only\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:a,b;c\r\nTEL:a\\;b,c;d\\,e\r\nEMAIL:x;y,z\\nq\r\nNOTE:n;o,t\\e\\N\r\n"
+    "BDAY:1\\,2;3\r\nORG:a\\,b;c\r\nADR:a,b;;c\\,d;e\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:\r\nTITLE:\r\nORG:\r\nN:;;;;\r\nADR:\r\nADR:;;;;;;\r\n\r\nTEL:1\r\nEND:VCARD\r\n",
+    "BEGIN:VCARD\nVERSION:4.0\nFN:x:y\nN:\\;a;b\nTEL;VALUE=uri;TYPE=cell:tel:+1-555\nBDAY;VALUE=date:19900102\nEND:VCARD",
+    "BEGIN:VCARD\r\nVERSION:4.0\r\nFN:L\r\nADR;TYPE=home;LABEL=\"a; b: c^n^'d^'\":;;;;;;\r\nADR;LABEL=x,y:;;;;;;\r\n"
+    "ADR;LABEL=\"z\":;;street;;;;\r\nEND:VCARD\r\n",
+]
+
+
+def sample_blocks():
+    """All cards of the sample files as raw blocks."""
+    blocks = []
+    for name in ('contacts.vcf', 'contacts_ru_v3.0.vcf'):
+        data = (SAMPLE_DIR / name).read_bytes()
+        blocks.extend(data[start:end].decode('utf-8').replace('\r\n', '\n') for start, end in iter_card_spans(data))
+    return blocks
+
+
+def random_card(rnd):
+    """A random card mixing escapes, folding, QP and charsets over the extracted properties."""
+    alphabet = 'abcXYZ 019\\;,:="\tčšéИв@.-+'
+    lines = ['BEGIN:VCARD', 'VERSION:' + rnd.choice(['2.1', '3.0', '4.0'])]
+    for _ in range(rnd.randint(0, 8)):
+        name = rnd.choice(['FN', 'N', 'TEL', 'EMAIL', 'ADR', 'ORG', 'TITLE', 'BDAY', 'NOTE', 'item1.TEL', 'X-FOO'])
+        value = ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12)))
+        params = ''
+        if rnd.random() < 0.2:
+            charset = rnd.choice(['UTF-8', 'windows-1250', 'cp1251'])
+            try:
+                encoded = value.encode(charset)
+            except UnicodeEncodeError:
+                charset, encoded = 'UTF-8', value.encode('utf-8')
+            value = quopri.encodestring(encoded).decode('ascii').replace('\n', '\r\n')
+            params = f';CHARSET={charset};ENCODING=QUOTED-PRINTABLE'
+        elif rnd.random() < 0.1:
+            params = ';TYPE=CELL,VOICE'
+        line = f'{name}{params}:{value}'
+        if rnd.random() < 0.2 and len(line) > 5:
+            cut = rnd.randint(1, len(line) - 1)
+            line = line[:cut] + '\r\n' + rnd.choice(' \t') + line[cut:]
+        lines.append(line)
+    lines.append('END:VCARD')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def vobject_or_error(block):
+    """Reference result of the vobject path, None when vobject rejects the card."""
+    try:
+        return parse_vcard(vobject.readOne(block, allowQP=True))
+    except Exception:
+        return None
+
+
+class TestFastParser:
+    """Equivalence of the native fast path with the vobject path."""
+
+    @pytest.mark.parametrize('block', EQUIVALENCE_CARDS + sample_blocks())
+    def test_equivalent_to_vobject(self, block):
+        """Fast path should give exactly the vobject parse_vcard result."""
+        assert fast_parse_vcard(block) == parse_vcard(vobject.readOne(block, allowQP=True))
+
+    def test_random_cards_equivalent(self):
+        """Whenever the fast path accepts a card vobject also parses, results should match."""
+        rnd = random.Random(2024)
+        compared = 0
+        for _ in range(2000):
+            block = random_card(rnd)
+            expected = vobject_or_error(block)
+            try:
+                result = fast_parse_vcard(block)
+            except (ValueError, LookupError):
+                continue
+            if expected is not None:
+                assert result == expected, block
+                compared += 1
+        assert compared > 1000
+
+    @pytest.mark.parametrize('block', [
+        "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:x\r\nNOTE;ENCODING=b:aGVsbG8=\r\nEND:VCARD\r\n",
+        "BEGIN:VCARD\r\nVERSION:3.0\r\nFN;LANGUAGE=\"en:us\":x\r\nEND:VCARD\r\n",
+        "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:x\r\nAGENT:\r\nBEGIN:VCARD\r\nFN:y\r\nEND:VCARD\r\nEND:VCARD\r\n",
+        "BEGIN:VCARD\r\nVERSION:3.0\r\nFN:x\r\nNOTE:dangling\\\r\nEND:VCARD\r\n",
+    ])
+    def test_falls_back_to_vobject(self, block):
+        """Cards outside the fast path should still come out as vobject parses them."""
+        with pytest.raises(ValueError):
+            fast_parse_vcard(block)
+        assert parse_block(block, fast=True) == parse_vcard(vobject.readOne(block, allowQP=True))
+
+    def test_contact_list_fast_mode(self):
+        """ContactList(fast=True) should load the samples exactly like the default mode."""
+        for name in ('contacts.vcf', 'contacts_ru_v3.0.vcf'):
+            default = ContactList(str(SAMPLE_DIR / name), is_dir=False)
+            fast = ContactList(str(SAMPLE_DIR / name), is_dir=False, fast=True)
+            assert dict(fast.dic) == dict(default.dic)
+
+    @pytest.mark.benchmark
+    def test_throughput_gain(self):
+        """Fast path should parse sample-style cards at least 5x faster than vobject."""
+        blocks = sample_blocks() * 100
+
+        def best_of_three(fast):
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                for block in blocks:
+                    parse_block(block, fast)
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        assert best_of_three(fast=False) > 5 * best_of_three(fast=True)
+
+
+# --- Parallel directory loading ---
+
+@pytest.fixture
+def mixed_vcf_directory(tmp_path):
+    """Directory tree with good files, a broken card and a latin-1 file."""
+    (tmp_path / 'nested').mkdir()
+    for number in range(40):
+        folder = tmp_path / 'nested' if number % 3 else tmp_path
+        (folder / f'contact{number:02d}.vcf').write_text(
+            f"BEGIN:VCARD\nVERSION:3.0\nFN:Person {number}\nN:Person;{number};;;\nTEL:{number}\nEND:VCARD\n",
+            encoding='utf-8')
+    (tmp_path / 'broken.vcf').write_text(
+        "BEGIN:VCARD\nVERSION:3.0\nFN:Before\nEND:VCARD\nBEGIN:VCARD\nnot a property\nEND:VCARD\n", encoding='utf-8')
+    (tmp_path / 'latin.vcf').write_bytes(b"BEGIN:VCARD\nVERSION:3.0\nFN:Ren\xe9\nEND:VCARD\n")
+    return tmp_path
+
+
+class TestParallelLoading:
+    """Tests for ContactList.load_directory with worker processes."""
+
+    def test_same_result_as_serial(self, mixed_vcf_directory, capsys):
+        """Parallel load should give the same contacts, order and error report as the serial load."""
+        serial = ContactList(str(mixed_vcf_directory), is_dir=True)
+        serial_output = capsys.readouterr().out
+        parallel = ContactList(str(mixed_vcf_directory), is_dir=True, workers=2)
+        parallel_output = capsys.readouterr().out
+        assert list(parallel.dic.items()) == list(serial.dic.items())
+        assert parallel.counter == serial.counter == 42
+        assert parallel_output == serial_output
+        assert 'Error loading card 2 in' in parallel_output
+        assert 'René' in [contact['full_name'] for contact in serial.dic.values()]  # latin.vcf, no longer an error
+
+    def test_order_is_deterministic(self, mixed_vcf_directory):
+        """Indexes should follow the sorted file paths."""
+        contact_list = ContactList(str(mixed_vcf_directory), is_dir=True, workers=2, fast=True)
+        names = [c['full_name'] for c in contact_list.dic.values()]
+        assert names[0] == 'Before'
+        assert names[1] == 'Person 0'
+        assert names.index('Person 3') < names.index('Person 1')  # top level files sort before nested/
+
+    def test_workers_argument_overrides_default(self, mixed_vcf_directory):
+        """load_directory should accept a worker count per call."""
+        contact_list = ContactList('', is_dir=True)
+        contact_list.load_directory(str(mixed_vcf_directory), workers=3)
+        assert len(contact_list.dic) == 42
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_parse_files_then_store(self, mixed_vcf_directory, workers, capsys):
+        """Parsing on another thread and storing on this one should equal a direct load."""
+        direct = ContactList(str(mixed_vcf_directory), is_dir=True)
+        direct_output = capsys.readouterr().out
+        contact_list = ContactList('')
+        capsys.readouterr()
+        files = contact_list.directory_files(str(mixed_vcf_directory))
+        parsed = []
+        worker = threading.Thread(target=lambda: parsed.extend(contact_list.parse_files(files, workers)))
+        worker.start()
+        worker.join()
+        assert contact_list.counter == 0  # nothing stored by the worker
+        for item in parsed:
+            contact_list.store_file(*item)
+        assert list(contact_list.dic.items()) == list(direct.dic.items())
+        assert capsys.readouterr().out == direct_output
+        assert contact_list.manifest.keys() == direct.manifest.keys()
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_parse_files_cancel(self, mixed_vcf_directory, workers):
+        """Setting the cancel event should stop parsing early."""
+        contact_list = ContactList('')
+        files = contact_list.directory_files(str(mixed_vcf_directory)) * 10
+        cancel = threading.Event()
+        parsed = 0
+        for _ in contact_list.parse_files(files, workers, cancel=cancel):
+            parsed += 1
+            cancel.set()
+        assert 1 <= parsed < len(files)
+
+
+# --- Uploaded data ---
+
+def upload_cards(names, charset='utf-8', declared=False):
+    """VCF data with one card per name, optionally declaring its charset on the FN lines."""
+    parameter = f';CHARSET={charset}' if declared else ''
+    return ''.join(f"BEGIN:VCARD\r\nVERSION:2.1\r\nFN{parameter}:{name}\r\nEND:VCARD\r\n"
+                   for name in names).encode(charset)
+
+
+class NamedUpload(io.BytesIO):
+    """File object like the uploads Streamlit hands over."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+class TestUploads:
+    """Tests for ContactList.load_uploads and the charset detection behind it."""
+
+    def test_detect_charset(self):
+        """BOMs, valid utf-8 and declared charsets are recognized, other 8-bit text is read as cp1250."""
+        assert decode_card(upload_cards(['Žluťoučký']))[1] == 'utf-8'
+        data = b'\xef\xbb\xbf' + upload_cards(['Jan'])
+        assert [decode_card(data[start:end])[0] for start, end in iter_card_spans(data)] == [
+            'BEGIN:VCARD\r\nVERSION:2.1\r\nFN:Jan\r\nEND:VCARD\r\n']  # the BOM is not part of the card
+        assert utf16_charset(upload_cards(['Jan'], 'utf-16')) == 'utf-16'
+        assert utf16_charset(upload_cards(['Jan'])) is None
+        assert decode_card(upload_cards(['Алексеева'], 'cp1251', declared=True))[1] == 'cp1251'
+        assert decode_card(upload_cards(['Žluťoučký'], 'cp1250'))[1] == 'cp1250'
+
+    def test_chunks_keep_cards_whole(self):
+        """Cutting at any chunk size should give the data back with every card in one piece."""
+        data = upload_cards([f'Person {number} ' + 'x' * number for number in range(60)])
+        for chunk_size in (1, 50, 333, 10 ** 6):
+            chunks = list(iter_card_chunks(io.BytesIO(data), chunk_size))
+            assert b''.join(chunks) == data
+            assert all(chunk.startswith(b'BEGIN:VCARD') and chunk.endswith(b'END:VCARD\r\n') for chunk in chunks)
+        assert len(list(iter_card_chunks(data, 333))) > 5
+
+    def test_chunks_between_blank_lines(self):
+        """Blank lines between cards, common in exports, should still be cut at, giving the same contacts."""
+        names = [f'Person {number}' for number in range(60)]
+        data = upload_cards(names).replace(b'END:VCARD\r\n', b'END:VCARD\r\n\r\n \r\n')
+        for chunk_size in (1, 50, 333):
+            chunks = list(iter_card_chunks(io.BytesIO(data), chunk_size))
+            assert len(chunks) > 5 and b''.join(chunks) == data
+            assert [contact['full_name'] for chunk in chunks
+                    for contact in parse_vcf_bytes('upload', chunk)[0]] == names
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_load_uploads(self, workers):
+        """Bytes and file objects in different charsets should load in order, whatever the chunking."""
+        names = [f'Člověk {number}' for number in range(30)]
+        uploads = [NamedUpload(upload_cards(names[:20]), 'first.vcf'),
+                   upload_cards(names[20:25], 'cp1250'),
+                   b'\xef\xbb\xbf' + upload_cards(names[25:28]),
+                   NamedUpload(upload_cards(names[28:], 'utf-16'), 'utf16.vcf')]
+        calls = []
+        contact_list = ContactList('')
+        added = contact_list.load_uploads(uploads, workers=workers, chunk_size=100,
+                                          progress=lambda done, total: calls.append((done, total)))
+        assert added == 30
+        assert [contact['full_name'] for contact in contact_list.dic.values()] == names
+        assert calls[-1][0] == calls[-1][1] == sum(map(len, [upload.getvalue() if hasattr(upload, 'getvalue')
+                                                             else upload for upload in uploads]))
+        assert contact_list.query('clovek 7') == [8]
+
+    def test_broken_card_numbers(self, capsys):
+        """Messages should count cards across chunks."""
+        data = upload_cards(['A', 'B', 'C']) + b'BEGIN:VCARD\r\nnot a property\r\nEND:VCARD\r\n'
+        contact_list = ContactList('')
+        capsys.readouterr()
+        assert contact_list.load_uploads([NamedUpload(data, 'up.vcf')], chunk_size=10) == 3
+        assert 'Error loading card 4 in up.vcf' in capsys.readouterr().out
+
+
+# --- Legacy charsets ---
+
+class TestLegacyCharsets:
+    """Tests for the per-card charset detection of files and uploads."""
+
+    @pytest.mark.parametrize('charset, name', [
+        ('cp1250', 'Žluťoučký Kůň'),
+        ('cp1251', 'Вагда Алексеева'),
+        ('latin-1', 'João Gonçalves'),
+        ('utf-16', 'Žluťoučký Kůň'),
+        ('utf-16-le', 'Вагда Алексеева'),  # no BOM
+        ('utf-16-be', 'Jan Novák'),
+    ])
+    def test_undeclared_file(self, tmp_path, charset, name):
+        """Files without any CHARSET= parameter should load with their names intact."""
+        path = tmp_path / 'legacy.vcf'
+        path.write_bytes(upload_cards([name, 'Second'], charset))
+        contact_list = ContactList(str(path))
+        assert [contact['full_name'] for contact in contact_list.dic.values()] == [name, 'Second']
+
+    def test_mixed_file(self, tmp_path, capsys):
+        """Every card is decoded on its own, a broken card in between costs only itself."""
+        path = tmp_path / 'mixed.vcf'
+        path.write_bytes(upload_cards(['Jiří Dvořák']) + upload_cards(['Николай Иванов'], 'cp1251')
+                         + b'BEGIN:VCARD\r\nnot a property\r\nEND:VCARD\r\n'
+                         + upload_cards(['Zdeněk Šťastný'], 'cp1250') + upload_cards(['Алия'], 'cp1251', declared=True))
+        contact_list = ContactList(str(path))
+        assert [contact['full_name'] for contact in contact_list.dic.values()] == [
+            'Jiří Dvořák', 'Николай Иванов', 'Zdeněk Šťastný', 'Алия']
+        assert f'Error loading card 3 in {path}' in capsys.readouterr().out
+
+    def test_decode_card(self):
+        """utf-8 first, then a declared charset, then the legacy charset whose letters fit best."""
+        assert decode_card('Kůň'.encode('utf-8')) == ('Kůň', 'utf-8')
+        assert decode_card(upload_cards(['Šťastný'], 'iso-8859-2', declared=True))[1] == 'iso8859-2'
+        assert decode_card('Алия Ермакова'.encode('cp1251'))[1] == 'cp1251'
+        assert decode_card('Tomáš Růžička'.encode('cp1250'))[1] == 'cp1250'
+        assert decode_card('René'.encode('latin-1'), hint='latin-1') == ('René', 'latin-1')  # a tie, the hint wins
+        assert decode_card(b'FN;CHARSET=unknown:Ren\xe9') == ('FN;CHARSET=unknown:René', 'cp1250')
+
+    def test_card_spans(self):
+        """Cards are found in bytes with any line ending, a BOM, nested AGENT cards and text in between."""
+        data = (b'\xef\xbb\xbfBEGIN:VCARD\rVERSION:2.1\rFN:Old Mac\rEND:VCARD\r'
+                b'garbage\nBEGIN:VCARD\nVERSION:2.1\nFN:Boss\nAGENT:\nBEGIN:VCARD\nFN:Assistant\nEND:VCARD\nEND:VCARD\n'
+                b'begin:vcard\r\nVERSION:3.0\r\nFN:Lower\r\nend:vcard')
+        spans = list(iter_card_spans(data))
+        assert [data[start:end].split(b'FN:')[1][:4] for start, end in spans] == [b'Old ', b'Boss', b'Lowe']
+        assert data[spans[0][0]:spans[0][1]].endswith(b'END:VCARD\r')
+        assert data[spans[2][0]:spans[2][1]].endswith(b'end:vcard')
+        contacts, errors = parse_vcf_bytes('cards.vcf', data)
+        assert ([contact['full_name'] for contact in contacts], errors) == (['Old Mac', 'Boss', 'Lower'], [])
+
+    def test_explicit_encoding(self):
+        """A card that does not decode with a given encoding is an error of that card alone."""
+        data = upload_cards(['Jan', 'Kůň']) + upload_cards(['Kůň'], 'cp1250') + upload_cards(['Eva'])
+        contacts, errors = parse_vcf_bytes('strict.vcf', data, encoding='utf-8')
+        assert [contact['full_name'] for contact in contacts] == ['Jan', 'Kůň', 'Eva']
+        assert len(errors) == 1 and errors[0].startswith('Error loading card 3 in strict.vcf')
+
+    def test_empty_file(self, tmp_path):
+        (tmp_path / 'empty.vcf').write_bytes(b'')
+        assert len(ContactList(str(tmp_path / 'empty.vcf')).dic) == 0
+
+
+# --- Incremental reload ---
+
+def touch_later(path):
+    """Move the modification time forward, so a rewrite is seen even on coarse filesystem clocks."""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+class TestRefresh:
+    """Tests for ContactList.refresh and its file manifest."""
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_manifest(self, mixed_vcf_directory, workers):
+        """Every file should be recorded with its stat, content hash and contact indexes."""
+        contact_list = ContactList(str(mixed_vcf_directory), is_dir=True, workers=workers)
+        entry = contact_list.manifest[str(mixed_vcf_directory / 'contact00.vcf')]
+        assert entry['size'] == (mixed_vcf_directory / 'contact00.vcf').stat().st_size
+        assert len(entry['hash']) == 32
+        assert entry['ids'] == [2]
+        assert contact_list.manifest[str(mixed_vcf_directory / 'broken.vcf')]['ids'] == [1]
+        assert sum(len(entry['ids']) for entry in contact_list.manifest.values()) == 42
+
+    def test_nothing_changed(self, mixed_vcf_directory, monkeypatch):
+        """Unchanged files should not even be read."""
+        contact_list = ContactList(str(mixed_vcf_directory), is_dir=True)
+        before = list(contact_list.dic.items())
+        monkeypatch.setattr('Contact.read_vcf_bytes', lambda location: pytest.fail(f'{location} re-read'))
+        assert contact_list.refresh() == {'added': [], 'changed': [], 'removed': []}
+        assert list(contact_list.dic.items()) == before
+
+    def test_patch_in_place(self, mixed_vcf_directory):
+        """Changed, added and deleted files should be applied without touching the other contacts."""
+        contact_list = ContactList(str(mixed_vcf_directory), is_dir=True)
+        untouched = contact_list.dic[5]
+        changed = mixed_vcf_directory / 'contact00.vcf'
+        changed.write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Renamed\nTEL:777 123 456\nEND:VCARD\n"
+                           "BEGIN:VCARD\nVERSION:3.0\nFN:Second\nEND:VCARD\n", encoding='utf-8')
+        touch_later(changed)
+        (mixed_vcf_directory / 'nested' / 'contact01.vcf').unlink()
+        (mixed_vcf_directory / 'new.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Newcomer\nEND:VCARD\n",
+                                                     encoding='utf-8')
+        touched = mixed_vcf_directory / 'contact03.vcf'
+        touch_later(touched)
+
+        changes = contact_list.refresh()
+        assert changes == {'added': [str(mixed_vcf_directory / 'new.vcf')], 'changed': [str(changed)],
+                           'removed': [str(mixed_vcf_directory / 'nested' / 'contact01.vcf')]}
+        assert contact_list.dic[2]['full_name'] == 'Renamed'  # same index as before
+        names = {contact['full_name'] for contact in contact_list.dic.values()}
+        assert {'Second', 'Newcomer'} <= names
+        assert 'Person 1' not in names
+        assert len(contact_list.dic) == 43
+        assert contact_list.dic[5] == untouched
+        assert contact_list.owners('777123456') == [2]
+        assert contact_list.manifest[str(touched)]['mtime'] == touched.stat().st_mtime_ns
+
+    def test_same_as_full_reload(self, mixed_vcf_directory):
+        """After a refresh the library should hold the same contacts as a fresh load."""
+        contact_list = ContactList(str(mixed_vcf_directory), is_dir=True, fast=True)
+        for number in range(0, 40, 7):
+            path = next(mixed_vcf_directory.rglob(f'contact{number:02d}.vcf'))
+            path.write_text(f"BEGIN:VCARD\nVERSION:3.0\nFN:Edited {number}\nEND:VCARD\n", encoding='utf-8')
+            touch_later(path)
+        contact_list.refresh()
+        fresh = ContactList(str(mixed_vcf_directory), is_dir=True, fast=True)
+        key = lambda contact: contact['full_name']
+        assert sorted(contact_list.dic.values(), key=key) == sorted(fresh.dic.values(), key=key)
+
+    def test_single_file(self, temp_vcf_file):
+        """A library loaded from one file should follow that file."""
+        contact_list = ContactList(temp_vcf_file)
+        path = Path(temp_vcf_file)
+        card = path.read_text(encoding='utf-8').strip()
+        path.write_text(f'{card}\n{card}\n', encoding='utf-8')
+        touch_later(path)
+        assert contact_list.refresh()['changed'] == [temp_vcf_file]
+        assert len(contact_list.dic) == 2
+        path.unlink()
+        assert contact_list.refresh()['removed'] == [temp_vcf_file]
+        assert len(contact_list.dic) == 0
@@ -0,0 +1,223 @@
+"""Unit tests for contact_db.py - contact library kept in SQLite."""
+
+import sqlite3
+
+import pytest
+
+import contact_db
+from contact_db import DATABASE_VERSION, ContactDatabase
+from Contact import ContactList
+from main import EXIT_OK, main
+
+
+@pytest.fixture
+def vcf_directory(tmp_path):
+    """Directory with a few small files, one of them with a Czech name, notes and two emails."""
+    folder = tmp_path / 'contacts'
+    folder.mkdir()
+    for number in range(20):
+        (folder / f'contact{number:02d}.vcf').write_text(
+            f"BEGIN:VCARD\nVERSION:3.0\nFN:Person {number}\nN:Person;{number};;;\nTEL:+420 777 000 {number:03d}\n"
+            f"EMAIL:person{number}@example.com\nEND:VCARD\n", encoding='utf-8')
+    (folder / 'novak.vcf').write_text(
+        "BEGIN:VCARD\nVERSION:3.0\nFN:Jan Novák\nN:Novák;Jan;;;\nTEL:777 123 456\nEMAIL:Jan.Novak@Example.com\n"
+        "EMAIL:jan@example.org\nNOTE:met at the climbing wall\nORG:Kůň s.r.o.\nEND:VCARD\n", encoding='utf-8')
+    return folder
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Database in its own temporary file."""
+    database = ContactDatabase(tmp_path / 'library.sqlite')
+    yield database
+    database.connection.close()
+
+
+def committed(path) -> int:
+    """Contacts another connection sees in the database file."""
+    connection = sqlite3.connect(str(path))
+    try:
+        return connection.execute('SELECT COUNT(*) FROM contacts').fetchone()[0]
+    finally:
+        connection.close()
+
+
+class TestContactList:
+    """A ContactList kept in a database."""
+
+    def test_reopen(self, vcf_directory, tmp_path, capsys):
+        """Reopening gives the same contacts under the same ids, with the manifest and directories."""
+        memory = ContactList(str(vcf_directory), is_dir=True)
+        first = ContactList('', database=tmp_path / 'library.sqlite')
+        first.load_directory(str(vcf_directory))
+        assert list(first.dic.items()) == list(memory.dic.items())
+        first.database.close()
+        second = ContactList(str(tmp_path / 'library.sqlite'))  # opened by its suffix
+        assert 'please follow' not in capsys.readouterr().out
+        assert list(second.dic.items()) == list(memory.dic.items())
+        assert dict(second.manifest) == memory.manifest
+        assert second.directories == [str(vcf_directory)] and second.counter == 21
+        assert second.add({'full_name': 'Eva'}) == 22
+
+    def test_indexes(self, vcf_directory, tmp_path):
+        """Phones, emails and search tokens follow add, update and remove."""
+        contacts_lib = ContactList(str(vcf_directory), is_dir=True, database=tmp_path / 'library.sqlite')
+        novak = contacts_lib.owners('+420 777 123 456')
+        assert len(novak) == 1 and contacts_lib.dic[novak[0]]['full_name'] == 'Jan Novák'
+        assert contacts_lib.database.email_owners('JAN.NOVAK@example.com') == novak
+        assert contacts_lib.query('novak') == novak  # transliterated like SearchIndex
+        assert contacts_lib.query('kun') == novak and contacts_lib.query('climb') == novak
+        assert contacts_lib.query('123 456') == novak
+        assert len(contacts_lib.query('pers', limit=50)) == 20
+        contacts_lib.update(novak[0], dict(contacts_lib.dic[novak[0]], phone_numbers=['603 000 000'], notes=None))
+        assert contacts_lib.owners('777123456') == [] and contacts_lib.owners('603000000') == novak
+        assert contacts_lib.query('climb') == []
+        contacts_lib.remove(novak[0])
+        assert contacts_lib.owners('603000000') == [] and contacts_lib.query('novak') == []
+        assert contacts_lib.database.email_owners('jan@example.org') == []
+        assert len(contacts_lib.phones) == 20 and len(contacts_lib.phones.owners) == 20
+
+    def test_views(self, vcf_directory, tmp_path):
+        """Paging, sorting and duplicates as for a library in memory."""
+        memory = ContactList(str(vcf_directory), is_dir=True)
+        contacts_lib = ContactList(str(vcf_directory), is_dir=True, database=tmp_path / 'library.sqlite')
+        for arguments in ({'start': 5, 'size': 4}, {'sort': 'family_name', 'size': 30},
+                          {'sort': 'full_name', 'descending': True, 'start': 3, 'size': 5}):
+            assert contacts_lib.page(**arguments) == memory.page(**arguments)
+        assert contacts_lib.find_duplicates() == memory.find_duplicates()
+        assert contacts_lib.phones.numbers == memory.phones.numbers
+
+    def test_refresh(self, vcf_directory, tmp_path):
+        """A changed file is found after reopening and keeps its ids."""
+        ContactList(str(vcf_directory), is_dir=True, database=tmp_path / 'library.sqlite').database.close()
+        (vcf_directory / 'contact03.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Changed\nEND:VCARD\n",
+                                                     encoding='utf-8')
+        (vcf_directory / 'new.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:New\nEND:VCARD\n", encoding='utf-8')
+        contacts_lib = ContactList(str(tmp_path / 'library.sqlite'))
+        changes = contacts_lib.refresh()
+        assert changes['changed'] == [str(vcf_directory / 'contact03.vcf')]
+        assert changes['added'] == [str(vcf_directory / 'new.vcf')]
+        assert contacts_lib.dic[4]['full_name'] == 'Changed' and contacts_lib.dic[22]['full_name'] == 'New'
+        assert contacts_lib.refresh() == {'added': [], 'changed': [], 'removed': []}
+
+
+class TestContactTable:
+    """The lazy mapping facade and its transactions."""
+
+    def test_mapping(self, database):
+        table = database.contacts
+        table[1] = {'full_name': 'Jan', 'phone_numbers': '777 123 456', 'birthday': '1990-01-02'}
+        table[2] = {'full_name': 'Eva', 'emails': ['eva@example.com']}
+        assert table[1]['phone_numbers'] == ['777 123 456'] and table[1]['emails'] == []
+        assert (len(table), list(table), 1 in table, 3 in table, 'x' in table) == (2, [1, 2], True, False, False)
+        assert table.field(2, 'emails') == ['eva@example.com'] and table.field(1, 'birthday') == '1990-01-02'
+        with pytest.raises(KeyError):
+            table[3]
+        with pytest.raises(KeyError):
+            del table[3]
+        del table[1]
+        assert list(table.values()) == [table[2]] and table.size == 1
+
+    def test_key_sequence(self, database):
+        for key in range(1, 101):
+            database.contacts[key] = {'full_name': f'Person {key}'}
+        del database.contacts[50]
+        keys = database.contacts.key_sequence()
+        assert len(keys) == 99 and keys[0] == 1 and keys[-1] == 100 and keys[49] == 51
+        assert keys[10:13] == [11, 12, 13] and keys[97:200] == [99, 100] and keys[::40] == [1, 41, 82]
+        assert keys.index(51) == 49 and list(keys) == [key for key in range(1, 101) if key != 50]
+        with pytest.raises(ValueError):
+            keys.index(50)
+        with pytest.raises(IndexError):
+            keys[99]
+
+    def test_key_pages(self, database, monkeypatch):
+        """Pages after the first anchor and pages read in order find the same ids as a scan."""
+        monkeypatch.setattr(contact_db, 'ANCHOR_ROWS', 16)
+        for key in range(1, 201):
+            database.contacts[key] = {'full_name': f'Person {key}'}
+        for key in range(3, 201, 7):
+            del database.contacts[key]
+        expected = list(database.contacts)
+        keys = database.contacts.key_sequence()
+        assert [keys[position] for position in range(len(keys))] == expected  # each one after the one before
+        for start in (150, 17, 99, 0, len(expected) - 5):
+            assert keys[start:start + 10] == expected[start:start + 10]
+
+    def test_ids_not_reused(self, tmp_path):
+        """The id of the highest contact deleted is not given out again, also after reopening."""
+        contacts_lib = ContactList('', database=tmp_path / 'library.sqlite')
+        assert [contacts_lib.add({'full_name': name}) for name in ('Jan', 'Eva', 'Petr')] == [1, 2, 3]
+        contacts_lib.remove(3)
+        contacts_lib.commit()
+        contacts_lib.database.close()
+        reopened = ContactList(str(tmp_path / 'library.sqlite'))
+        assert reopened.add({'full_name': 'Ema'}) == 4
+
+    def test_batches(self, tmp_path):
+        """Contacts are committed batch_rows at a time, another reader sees whole batches (WAL)."""
+        database = ContactDatabase(tmp_path / 'library.sqlite', batch_rows=10)
+        assert database.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        for key in range(1, 26):
+            database.contacts[key] = {'full_name': f'Person {key}'}
+        assert committed(tmp_path / 'library.sqlite') == 20
+        assert len(database.contacts) == 25  # pending contacts are written before a read
+        database.commit()
+        assert committed(tmp_path / 'library.sqlite') == 25
+        database.close()
+
+
+class TestDatabase:
+    """Opening libraries."""
+
+    def test_country(self, tmp_path):
+        """Opening with another country normalizes the stored numbers again."""
+        contacts_lib = ContactList('', database=tmp_path / 'library.sqlite')
+        contacts_lib.add({'full_name': 'Jan', 'phone_numbers': ['0903 123 456']})
+        contacts_lib.database.close()
+        assert ContactList('', database=tmp_path / 'library.sqlite').owners('+420903123456') == [1]
+        assert ContactList('', country='SK', database=tmp_path / 'library.sqlite').owners('+421903123456') == [1]
+
+    def test_stored_country(self, tmp_path):
+        """Reopening without a country keeps the one the library was written for."""
+        contacts_lib = ContactList('', country='US', database=tmp_path / 'library.sqlite')
+        contacts_lib.add({'full_name': 'Jan', 'phone_numbers': ['(202) 555-0143']})
+        contacts_lib.database.close()
+        reopened = ContactList(str(tmp_path / 'library.sqlite'))
+        assert reopened.phones.country == 'US'
+        assert reopened.phones.owners == {'+12025550143': [1]}
+        assert reopened.database.get('country') == 'US'
+
+    def test_not_a_library(self, tmp_path):
+        (tmp_path / 'other.db').write_bytes(b'not a database' * 100)
+        with pytest.raises(ValueError):
+            ContactDatabase(tmp_path / 'other.db')
+        connection = sqlite3.connect(str(tmp_path / 'newer.sqlite'))
+        connection.execute(f'PRAGMA user_version={DATABASE_VERSION + 1}')
+        connection.close()
+        with pytest.raises(ValueError, match='version'):
+            ContactDatabase(tmp_path / 'newer.sqlite')
+
+
+class TestCommandLine:
+    """main.py --database."""
+
+    def test_load_and_stats(self, vcf_directory, tmp_path, capsys):
+        library = str(tmp_path / 'library.sqlite')
+        assert main(['load', str(vcf_directory), '--database', library]) == EXIT_OK
+        capsys.readouterr()
+        assert main(['stats', '--database', library, '--json']) == EXIT_OK
+        assert '"contacts": 21' in capsys.readouterr().out
+        assert main(['convert', '--database', library, '-o', str(tmp_path / 'out.jsonl')]) == EXIT_OK
+        assert len((tmp_path / 'out.jsonl').read_text(encoding='utf-8').splitlines()) == 21
+
+
+class TestDatabaseBenchmark:
+    """Reopening a database against parsing the vCards."""
+
+    @pytest.mark.benchmark
+    def test_reopen_faster_than_parsing(self):
+        from benchmarks.bench_database import measure
+
+        result = measure(2000, queries=10)
+        assert result['reopen_seconds'] < result['parse_seconds'] / 10
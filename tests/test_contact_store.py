@@ -0,0 +1,139 @@
+"""Unit tests for contact_store.py - columnar ContactList.dic storage."""
+
+import pytest
+
+from benchmarks.bench_store import measure, synthetic_contacts
+from Contact import ContactList
+from contact_store import ContactStore
+
+
+@pytest.fixture
+def contacts():
+    """A few synthetic contacts keyed like ContactList does."""
+    return dict(enumerate(synthetic_contacts(50), start=1))
+
+
+class TestContactStore:
+    """Tests for the ContactStore mapping."""
+
+    def test_roundtrip(self, contacts):
+        """Every contact should come back exactly as it was stored."""
+        store = ContactStore(contacts)
+        assert len(store) == 50
+        assert dict(store) == contacts
+        assert list(store.keys()) == list(contacts.keys())
+
+    def test_special_values(self):
+        """None, empty strings, non-ASCII and odd addresses should survive."""
+        contact = {
+            'full_name': 'Алексеева Вагда', 'given_name': '', 'family_name': None,
+            'phone_numbers': [], 'emails': ['', 'a@b.c'],
+            'addresses': ['', 'Street', 'Street, ', ', City', 'a, b, c, d, e'],
+            'organization': None, 'job_title': 'Šéf', 'birthday': None, 'notes': 'line\nline',
+        }
+        store = ContactStore()
+        store[1] = contact
+        assert store[1] == contact
+
+    def test_returned_dict_is_a_copy(self, contacts):
+        """Changing a returned contact should not change the store until it is written back."""
+        store = ContactStore(contacts)
+        contact = store[1]
+        contact['full_name'] = 'Changed'
+        contact['emails'].append('new@example.com')
+        assert store[1] == contacts[1]
+        store[1] = contact
+        assert store[1]['full_name'] == 'Changed'
+        assert store[1]['emails'][-1] == 'new@example.com'
+
+    def test_string_phone_is_wrapped(self):
+        """A single phone given as string should be stored as a one-item list."""
+        store = ContactStore({1: {'full_name': 'X', 'phone_numbers': '555'}})
+        assert store[1]['phone_numbers'] == ['555']
+
+    def test_delete_and_replace_keep_order(self, contacts):
+        """Deleting and replacing should behave like a dict."""
+        store = ContactStore(contacts)
+        del store[2]
+        store[1] = contacts[3]
+        store[99] = contacts[4]
+        assert 2 not in store
+        assert list(store.keys())[:2] == [1, 3]
+        assert list(store.keys())[-1] == 99
+        assert store[1] == contacts[3]
+        with pytest.raises(KeyError):
+            store[2]
+
+    def test_non_sequential_keys(self, contacts):
+        """Arbitrary hashable keys should work, not only the ContactList counter."""
+        store = ContactStore()
+        store['b'] = contacts[1]
+        store[5] = contacts[2]
+        assert list(store) == ['b', 5]
+        assert 1 not in store
+        assert 'b' in store
+
+    def test_key_sequence(self, contacts):
+        """Keys should be indexable in iteration order, without a copy while they are dense
+        and copied once per added or deleted key otherwise."""
+        store = ContactStore(contacts)
+        assert store.key_sequence() == range(1, 51)
+        del store[2]
+        store[99] = contacts[2]
+        keys = store.key_sequence()
+        assert list(keys) == list(store)
+        assert keys[1] == 3 and keys[-1] == 99
+        store[3] = contacts[4]
+        assert store.key_sequence() is keys
+        store[100] = contacts[5]
+        assert store.key_sequence()[-1] == 100 and len(keys) == 50
+        del store[100]
+        assert store.key_sequence() == keys
+
+    def test_field(self, contacts):
+        """A single field should read the same as from the whole contact."""
+        store = ContactStore(contacts)
+        store[7] = contacts[8]
+        for key in (1, 7, 50):
+            for field in ('full_name', 'family_name', 'phone_numbers', 'addresses', 'notes'):
+                assert store.field(key, field) == store[key][field]
+        with pytest.raises(KeyError):
+            store.field(99, 'full_name')
+
+    def test_compact_drops_garbage(self, contacts):
+        """compact() should keep live contacts only."""
+        store = ContactStore(contacts)
+        for key in range(1, 26):
+            del store[key]
+        store[30] = contacts[1]
+        before = dict(store)
+        store.compact()
+        assert store.size == 25
+        assert dict(store) == before
+
+    def test_repeated_strings_interned(self):
+        """Organizations and address tails should be stored once, streets are not interned."""
+        store = ContactStore()
+        for number in range(1, 101):
+            store[number] = {'organization': 'Acme', 'addresses': [f'Street {number}, Brno, 60200, Czechia']}
+        assert store.table.strings == [None, 'Acme', 'Brno, 60200, Czechia']
+        assert store[100]['addresses'] == ['Street 100, Brno, 60200, Czechia']
+
+    def test_contact_list_uses_store(self, tmp_path):
+        """ContactList.dic should be a ContactStore that still acts as the former dict."""
+        for number, name in enumerate(['Alice Johnson', 'Bob Williams']):
+            (tmp_path / f'contact{number}.vcf').write_text(
+                f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nEND:VCARD\n", encoding='utf-8')
+        contact_list = ContactList(str(tmp_path), is_dir=True)
+        assert isinstance(contact_list.dic, ContactStore)
+        assert contact_list.dic[1]['full_name'] == 'Alice Johnson'
+        assert [key for key, _ in contact_list.dic.items()] == [1, 2]
+
+
+class TestMemoryBenchmark:
+    """Memory of the store compared with the dict-of-dicts it replaces."""
+
+    def test_store_uses_less_than_a_third(self):
+        """ContactStore should need under a third of the dict-of-dicts memory."""
+        result = measure(20000)
+        assert result['ratio'] < 0.33
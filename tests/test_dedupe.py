@@ -0,0 +1,108 @@
+"""Unit tests for dedupe.py - blocking-based duplicate detection."""
+
+import pytest
+
+from benchmarks.bench_dedupe import measure
+from Contact import ContactList
+from dedupe import find_duplicates, is_duplicate, soundex
+
+
+def contact(name, phones=(), emails=()):
+    """Minimal parse_vcard-like dictionary."""
+    return {'full_name': name, 'phone_numbers': list(phones), 'emails': list(emails)}
+
+
+@pytest.fixture
+def library():
+    """Contacts with a few kinds of duplicates."""
+    return {
+        1: contact('Jan Novák', ['+420 777 123 456'], ['jan@example.com']),
+        2: contact('Novak Jan', ['777123456']),
+        3: contact('Alice Johnson', ['555-1111'], ['alice@example.com']),
+        4: contact('Alice Jonson', [], ['ALICE@example.com']),
+        5: contact('Bob Williams', ['555-2222']),
+        6: contact('Robert Miller', ['555-3333']),
+        7: contact('Alena Nováková', ['+420 602 000 111']),
+        8: contact('Bob Williams', ['555-9999']),
+    }
+
+
+class TestHelpers:
+    """Tests for the blocking key helpers."""
+
+    def test_soundex(self):
+        """Known Soundex codes."""
+        assert soundex('robert') == soundex('rupert') == 'r163'
+        assert soundex('ashcraft') == 'a261'
+        assert soundex('tymczak') == 't522'
+        assert soundex('42') == '42'
+
+
+class TestFindDuplicates:
+    """Tests for clustering whole libraries."""
+
+    def test_clusters(self, library):
+        """Reversed names, diacritics, phone formats and email case should be matched."""
+        clusters = find_duplicates(library)
+        assert [cluster['ids'] for cluster in clusters] == [[1, 2], [3, 4], [5, 8]]
+        assert clusters[0]['reasons'] == ['name', 'phone']
+        assert clusters[1]['reasons'] == ['email', 'name']
+        assert clusters[2]['reasons'] == ['name']
+        assert all(0.9 <= cluster['score'] <= 1.0 for cluster in clusters)
+
+    def test_threshold(self, library):
+        """A shared email alone should not be enough at threshold 1."""
+        assert [cluster['ids'] for cluster in find_duplicates(library, threshold=1.0)] == [[1, 2], [5, 8]]
+
+    def test_transitive_cluster(self):
+        """Contacts linked through a third one end up in one cluster."""
+        library = {
+            1: contact('Eva Malá', ['602111222']),
+            2: contact('Eva Mala', [], ['eva@example.com']),
+            3: contact('Eva M.', [], ['eva@example.com']),
+        }
+        assert [cluster['ids'] for cluster in find_duplicates(library, threshold=0.8)] == [[1, 2, 3]]
+
+    def test_big_block(self):
+        """Oversized blocks are compared with neighbours only and still find duplicates."""
+        library = {number: contact(f'Person {number:04d}', ['+1 555 000 0000']) for number in range(1, 201)}
+        library[201] = contact('Person 0100', ['+1 555 000 0000'])
+        clusters = find_duplicates(library, threshold=1.0)
+        assert [cluster['ids'] for cluster in clusters] == [[100, 201]]
+
+    def test_empty(self):
+        """Empty libraries and nameless contacts should not fail."""
+        assert find_duplicates({}) == []
+        assert find_duplicates({1: contact(None), 2: contact('')}) == []
+
+    def test_is_duplicate(self, library):
+        """Pairwise check used by ContactList.search."""
+        assert is_duplicate(library[1], library[2])
+        assert not is_duplicate(library[1], library[7])
+
+
+class TestContactListDuplicates:
+    """Tests for the ContactList entry points."""
+
+    def test_contact_list(self, tmp_path, library):
+        """find_duplicates returns clusters and search returns similar ids without the active contact."""
+        contact_list = ContactList(str(tmp_path), is_dir=True)
+        for key, value in library.items():
+            contact_list.dic[key] = value
+        assert [cluster['ids'] for cluster in contact_list.find_duplicates()] == [[1, 2], [3, 4], [5, 8]]
+        contact_list.ac_key = 5
+        assert contact_list.search(contact_list.dic[5]) == [8]
+        assert contact_list.search(contact('Nobody Here', ['999 888 777'])) == []
+
+
+class TestDedupeBenchmark:
+    """Throughput and recall on the synthetic library."""
+
+    def test_recall(self):
+        """Injected duplicates should be found."""
+        assert measure(20000)['recall'] > 0.98
+
+    @pytest.mark.benchmark
+    def test_speed(self):
+        """Injected duplicates should be found quickly."""
+        assert measure(20000)['contacts_per_second'] > 2000
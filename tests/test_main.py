@@ -0,0 +1,135 @@
+"""Unit tests for main.py - headless batch commands."""
+
+import gzip
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from Contact import ContactList
+from main import EXIT_ERRORS, EXIT_OK, EXIT_USAGE, main
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE = ROOT / 'sample'
+
+
+def run_main(*argv, stdin=b''):
+    """Run main.py in a fresh interpreter, returns the completed process."""
+    return subprocess.run([sys.executable, str(ROOT / 'main.py'), *map(str, argv)], input=stdin,
+                          capture_output=True, cwd=ROOT, timeout=120)
+
+
+@pytest.fixture
+def library(tmp_path):
+    """Directory with two files, one of them holding a broken card."""
+    folder = tmp_path / 'library'
+    folder.mkdir()
+    (folder / 'a.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Jan Novák\nN:Novák;Jan;;;\nTEL:777 123 456\nEND:VCARD\n"
+                                  "BEGIN:VCARD\nVERSION:3.0\nFN:Jan Novak\nN:Novak;Jan;;;\nTEL:+420777123456\nEND:VCARD\n",
+                                  encoding='utf-8')
+    (folder / 'b.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Eva Adámková\nEND:VCARD\n", encoding='utf-8')
+    return folder
+
+
+class TestCommands:
+    """Tests for the batch commands run in process."""
+
+    def test_load_json(self, library, capsys):
+        """load reports files, contacts and errors as one JSON line."""
+        assert main(['load', str(library), '--json']) == EXIT_OK
+        result = json.loads(capsys.readouterr().out)
+        assert (result['files'], result['contacts'], result['errors']) == (2, 3, 0)
+
+    def test_errors_set_exit_code(self, library, capsys):
+        """A broken card or missing input gives exit code 1, messages go to stderr."""
+        (library / 'broken.vcf').write_text("BEGIN:VCARD\nnot a property\nEND:VCARD\n", encoding='utf-8')
+        assert main(['stats', str(library), '--json']) == EXIT_ERRORS
+        captured = capsys.readouterr()
+        assert json.loads(captured.out)['errors'] == 1
+        assert 'Error loading card 1' in captured.err
+        assert main(['load', str(library / 'missing.vcf')]) == EXIT_ERRORS
+
+    def test_usage_errors(self, capsys):
+        """Missing inputs and bad options are usage errors."""
+        assert main(['load']) == EXIT_USAGE
+        assert main(['merge', 'x.vcf', '--order', 'phone']) == EXIT_USAGE
+        assert main(['load', 'x.vcf', '--workers', '0']) == EXIT_USAGE
+        assert main(['--nonsense']) == EXIT_USAGE
+
+    def test_stats(self, library, capsys):
+        """Both Novák cards share one normalized number."""
+        assert main(['stats', str(library), '--json']) == EXIT_OK
+        result = json.loads(capsys.readouterr().out)
+        assert result['with_phone_numbers'] == 2
+        assert (result['distinct_numbers'], result['shared_numbers']) == (1, 1)
+
+    def test_dedupe(self, library, capsys):
+        """Duplicate clusters are printed as JSON lines with names."""
+        assert main(['dedupe', str(library), '--json']) == EXIT_OK
+        clusters = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [cluster['ids'] for cluster in clusters] == [[1, 2]]
+        assert clusters[0]['names'] == ['Jan Novák', 'Jan Novak']
+
+    def test_convert_roundtrip(self, library, tmp_path):
+        """vCard -> JSON lines -> vCard keeps the contacts."""
+        assert main(['convert', str(library), '-o', str(tmp_path / 'all.jsonl')]) == EXIT_OK
+        lines = (tmp_path / 'all.jsonl').read_text(encoding='utf-8').splitlines()
+        assert json.loads(lines[0])['full_name'] == 'Jan Novák'
+        assert main(['convert', str(tmp_path / 'all.jsonl'), '-o', str(tmp_path / 'all.vcf')]) == EXIT_OK
+        converted = ContactList(str(tmp_path / 'all.vcf'))
+        assert list(converted.dic.values()) == list(ContactList(str(library), is_dir=True).dic.values())
+
+    def test_normalize(self, library, tmp_path):
+        """Phone numbers are written in E.164 form."""
+        assert main(['normalize', str(library), '-o', str(tmp_path / 'out.jsonl')]) == EXIT_OK
+        numbers = [json.loads(line)['phone_numbers'] for line in (tmp_path / 'out.jsonl').open(encoding='utf-8')]
+        assert numbers == [['+420777123456'], ['+420777123456'], []]
+
+    def test_export_and_merge(self, library, tmp_path):
+        """export writes a file per contact, merge one sorted compressed file."""
+        assert main(['export', str(library), '-o', str(tmp_path / 'out'), '-w', '2']) == EXIT_OK
+        assert len(list((tmp_path / 'out').glob('*.vcf'))) == 3
+        assert main(['export', str(library), '-o', str(tmp_path / 'out'), '--overwrite']) == EXIT_OK
+        assert main(['merge', str(library), '-o', str(tmp_path / 'all.vcf.gz'), '--order', 'family_name']) == EXIT_OK
+        text = gzip.decompress((tmp_path / 'all.vcf.gz').read_bytes()).decode('utf-8')
+        assert text.index('Adámková') < text.index('Novák')
+
+    def test_export_existing_files(self, library, tmp_path, capsys):
+        """Files already in the output directory are kept, reported on stderr and give exit code 1."""
+        assert main(['export', str(library), '-o', str(tmp_path / 'out')]) == EXIT_OK
+        assert main(['export', str(library), '-o', str(tmp_path / 'out')]) == EXIT_ERRORS
+        errors = [line for line in capsys.readouterr().err.splitlines() if line.startswith('Error writing')]
+        assert len(errors) == 3 and all(line.endswith('file exists, not overwritten') for line in errors)
+
+    def test_files_in_parallel(self, library, capsys):
+        """Files given one by one are parsed together, also on worker processes."""
+        files = [str(path) for path in sorted(library.glob('*.vcf'))]
+        assert main(['load', *files, '--workers', '2', '--json']) == EXIT_OK
+        assert json.loads(capsys.readouterr().out)['contacts'] == 3
+
+
+class TestHeadless:
+    """Tests of the command line in a fresh interpreter."""
+
+    def test_stdin_to_stdout(self):
+        """vCards on stdin come out as JSON lines on stdout."""
+        result = run_main('convert', '-', '--to', 'jsonl', stdin=(SAMPLE / 'contacts.vcf').read_bytes())
+        assert result.returncode == EXIT_OK
+        contacts = [json.loads(line) for line in result.stdout.decode('utf-8').splitlines()]
+        assert contacts[0]['full_name'] == 'Alice Johnson'
+        assert len(contacts) == len(ContactList(str(SAMPLE / 'contacts.vcf')).dic)
+
+    def test_merge_to_stdout(self):
+        """merge without -o writes the cards to stdout."""
+        result = run_main('merge', SAMPLE)
+        assert result.returncode == EXIT_OK
+        assert result.stdout.count(b'BEGIN:VCARD') == 11
+
+    def test_no_gui_imports(self):
+        """Batch commands must not import tkinter or streamlit."""
+        code = ("import sys, main; main.main(['stats', 'sample']); "
+                "print('tkinter' in sys.modules, 'streamlit' in sys.modules, file=sys.stderr)")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, cwd=ROOT, timeout=120)
+        assert result.stderr.decode().strip().endswith('False False')
@@ -0,0 +1,115 @@
+"""Unit tests for parse_cache.py - persistent cache of parsed VCF files."""
+
+import os
+import shutil
+
+import pytest
+
+from Contact import ContactList
+from parse_cache import CACHE_VERSION, ParseCache
+
+
+@pytest.fixture
+def vcf_directory(tmp_path):
+    """Directory with a few small files, one of them with a broken card."""
+    folder = tmp_path / 'contacts'
+    folder.mkdir()
+    for number in range(20):
+        (folder / f'contact{number:02d}.vcf').write_text(
+            f"BEGIN:VCARD\nVERSION:3.0\nFN:Person {number}\nN:Person;{number};;;\nTEL:+420 777 000 {number:03d}\n"
+            f"EMAIL:person{number}@example.com\nEND:VCARD\n", encoding='utf-8')
+    (folder / 'broken.vcf').write_text(
+        "BEGIN:VCARD\nVERSION:3.0\nFN:Before\nEND:VCARD\nBEGIN:VCARD\nnot a property\nEND:VCARD\n", encoding='utf-8')
+    return folder
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Cache in its own temporary file."""
+    cache = ParseCache(tmp_path / 'cache.sqlite')
+    yield cache
+    cache.close()
+
+
+class TestParseCache:
+    """Tests for loading through the cache."""
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_second_load_hits(self, vcf_directory, cache, workers, capsys):
+        """Reopening a directory should parse nothing and give the same contacts and messages."""
+        first = ContactList(str(vcf_directory), is_dir=True, workers=workers, cache=cache)
+        first_output = capsys.readouterr().out
+        assert (cache.hits, cache.misses) == (0, 21)
+        second = ContactList(str(vcf_directory), is_dir=True, workers=workers, cache=cache)
+        assert (cache.hits, cache.misses) == (21, 21)
+        assert list(second.dic.items()) == list(first.dic.items())
+        assert capsys.readouterr().out == first_output
+        assert second.owners('777000005') == [first.owners('777000005')[0]]
+        assert second.manifest == first.manifest
+
+    def test_no_parsing_on_hit(self, vcf_directory, cache, monkeypatch):
+        """Cached files should not reach the parser."""
+        ContactList(str(vcf_directory), is_dir=True, cache=cache)
+        monkeypatch.setattr('Contact.parse_vcf_bytes', lambda *args: pytest.fail('parsed again'))
+        monkeypatch.setattr('Contact.parse_vcf_cards', lambda *args: pytest.fail('parsed again'))
+        assert len(ContactList(str(vcf_directory), is_dir=True, cache=cache).dic) == 21
+
+    def test_changed_and_copied_files(self, vcf_directory, cache):
+        """Changed content is a miss, the same content under another path or mtime is a hit."""
+        ContactList(str(vcf_directory), is_dir=True, cache=cache)
+        changed = vcf_directory / 'contact00.vcf'
+        changed.write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Changed\nEND:VCARD\n", encoding='utf-8')
+        stat = changed.stat()
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        copy = vcf_directory.parent / 'copy'
+        shutil.copytree(vcf_directory, copy)
+        hits, misses = cache.hits, cache.misses
+        contact_list = ContactList(str(vcf_directory), is_dir=True, cache=cache)
+        assert (cache.hits - hits, cache.misses - misses) == (20, 1)
+        assert contact_list.dic[2]['full_name'] == 'Changed'
+        ContactList(str(copy), is_dir=True, cache=cache)
+        assert (cache.hits - hits, cache.misses - misses) == (41, 1)
+
+    def test_refresh_uses_cache(self, vcf_directory, cache):
+        """refresh() should go through the cache too."""
+        contact_list = ContactList(str(vcf_directory), is_dir=True, cache=cache)
+        (vcf_directory / 'new.vcf').write_text((vcf_directory / 'contact01.vcf').read_text(encoding='utf-8'),
+                                               encoding='utf-8')
+        hits = cache.hits
+        assert contact_list.refresh()['added'] == [str(vcf_directory / 'new.vcf')]
+        assert cache.hits == hits + 1
+
+    def test_eviction(self, vcf_directory, tmp_path):
+        """The stored size should stay under the limit, least recently used results go first."""
+        cache = ParseCache(tmp_path / 'small.sqlite', max_bytes=2000)
+        ContactList(str(vcf_directory), is_dir=True, cache=cache)
+        assert cache.evictions > 0
+        assert cache.bytes <= 2000
+        stats = cache.stats()
+        assert 0 < stats['entries'] < 21
+        assert stats['bytes'] == cache.bytes
+        cache.close()
+        reopened = ParseCache(tmp_path / 'small.sqlite', max_bytes=2000)
+        assert reopened.bytes == stats['bytes']
+        contact_list = ContactList(str(vcf_directory), is_dir=True, cache=reopened)
+        assert contact_list.dic[21]['full_name'] == 'Person 19'  # newest entries survived
+        assert reopened.hits == stats['entries']
+        reopened.close()
+
+    def test_version_change_drops_entries(self, vcf_directory, tmp_path):
+        """Entries written by another cache version should not be used."""
+        cache = ParseCache(tmp_path / 'cache.sqlite')
+        ContactList(str(vcf_directory), is_dir=True, cache=cache)
+        cache.connection.execute(f'PRAGMA user_version={CACHE_VERSION + 1}')
+        cache.close()
+        reopened = ParseCache(tmp_path / 'cache.sqlite')
+        assert reopened.stats()['entries'] == 0
+        reopened.close()
+
+    def test_large_file_is_streamed(self, vcf_directory, tmp_path):
+        """Files over the entry limit should load through the streaming reader and not be stored."""
+        cache = ParseCache(tmp_path / 'tiny.sqlite', max_bytes=200)
+        contact_list = ContactList(str(vcf_directory / 'contact00.vcf'), cache=cache)
+        assert contact_list.dic[1]['full_name'] == 'Person 0'
+        assert cache.stats()['entries'] == 0
+        cache.close()
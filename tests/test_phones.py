@@ -0,0 +1,77 @@
+"""Unit tests for phones.py - phone normalization and the ContactList phone index."""
+
+import pytest
+
+from Contact import ContactList
+from phones import PhoneIndex, calling_code, normalize
+
+
+class TestNormalize:
+    """Tests for the E.164-style normalization."""
+
+    @pytest.mark.parametrize('number', [
+        '+420 777 123 456', '777123456', '777-123-456', '00420777123456', '+420 (777) 123-456',
+        'tel:+420777123456', '+420 777 123 456 ext. 12', '+420777123456;ext=3',
+    ])
+    def test_same_number(self, number):
+        """Written forms of one Czech number should collapse into one key."""
+        assert normalize(number) == '+420777123456'
+
+    def test_default_country(self):
+        """National numbers take the calling code of the given country."""
+        assert normalize('0171 234 5678', 'DE') == '+491712345678'
+        assert normalize('(202) 555-0143', 'US') == '+12025550143'
+        assert normalize('1 202 555 0143', 'US') == '+12025550143'
+        assert normalize('011 420 777 123 456', 'US') == '+420777123456'
+        assert normalize('06 1234 5678', 'IT') == '+390612345678'
+        assert normalize('777123456', '421') == '+421777123456'
+
+    def test_unusable(self):
+        """Empty, short and overlong values are no numbers."""
+        assert normalize('') is None
+        assert normalize(None) is None
+        assert normalize('112') is None
+        assert normalize('+1234567890123456') is None
+
+    def test_unknown_country(self):
+        """Unknown regions are rejected, calling codes work for any country."""
+        assert calling_code('+386') == '386'
+        with pytest.raises(ValueError):
+            calling_code('XX')
+
+
+class TestPhoneIndex:
+    """Tests for the number -> ids index."""
+
+    def test_add_lookup_remove(self):
+        """Lookup works with any format and removal forgets only the removed contact."""
+        index = PhoneIndex()
+        index.add(1, ['+420 777 123 456', '777123456', '602 000 111'])
+        index.add(2, '777-123-456')
+        index.add(3, [])
+        assert index.lookup('00420777123456') == [1, 2]
+        assert index.numbers[1] == ('+420777123456', '+420602000111')
+        index.remove(1)
+        index.remove(3)
+        assert index.lookup('777123456') == [2]
+        assert index.lookup('602000111') == []
+        assert len(index) == 1
+
+    def test_contact_list(self, tmp_path):
+        """ContactList keeps the index in step with dic on load, update and remove."""
+        (tmp_path / 'a.vcf').write_text(
+            "BEGIN:VCARD\nVERSION:3.0\nFN:Jan Novák\nTEL:+420 777 123 456\nEND:VCARD\n"
+            "BEGIN:VCARD\nVERSION:3.0\nFN:Jana Nováková\nTEL:777 123 456\nTEL:602000111\nEND:VCARD\n",
+            encoding='utf-8')
+        contact_list = ContactList(str(tmp_path / 'a.vcf'))
+        assert contact_list.owners('777123456') == [1, 2]
+        contact = contact_list.dic[2]
+        contact['phone_numbers'] = ['602000111']
+        contact_list.update(2, contact)
+        assert contact_list.owners('777123456') == [1]
+        assert contact_list.owners('+420602000111') == [2]
+        contact_list.remove(1)
+        assert 1 not in contact_list.dic
+        assert contact_list.owners('777123456') == []
+        assert contact_list.add({'full_name': 'New', 'phone_numbers': ['777123456']}) == 3
+        assert contact_list.owners('777123456') == [3]
@@ -0,0 +1,105 @@
+"""Unit tests for profiling.py - opt-in timing of ContactList operations."""
+
+import io
+import json
+import pstats
+
+import pytest
+
+from Contact import NO_PHASE, ContactList
+from main import main
+from profiling import Profiler
+
+
+@pytest.fixture
+def library(tmp_path):
+    """Directory with a good file and one with a broken card."""
+    folder = tmp_path / 'library'
+    folder.mkdir()
+    (folder / 'a.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Jan Novák\nN:Novák;Jan;;;\nEND:VCARD\n"
+                                  "BEGIN:VCARD\nVERSION:3.0\nFN:Eva Malá\nTEL:777 123 456\nEND:VCARD\n", encoding='utf-8')
+    (folder / 'b.vcf').write_text("BEGIN:VCARD\nVERSION:3.0\nFN:Petr\nEND:VCARD\n"
+                                  "BEGIN:VCARD\nnot a property\nEND:VCARD\n", encoding='utf-8')
+    return folder
+
+
+class TestDisabled:
+    """Without a profiler nothing is recorded."""
+
+    def test_no_profiler(self, library):
+        contacts_lib = ContactList(str(library), is_dir=True)
+        assert contacts_lib.profiler is None
+        assert contacts_lib.stats() == {}
+        assert contacts_lib.phase('load') is NO_PHASE
+
+
+class TestContactList:
+    """Phases and file records of ContactList operations."""
+
+    def test_serial_load(self, library):
+        """A load records its phases, the cards and errors of every file and the slowest files."""
+        contacts_lib = ContactList(str(library), is_dir=True, profile=True)
+        stats = contacts_lib.stats()
+        assert {'load', 'file', 'read', 'vobject', 'extract'} <= stats['phases'].keys()
+        assert stats['phases']['vobject']['calls'] == 4
+        assert stats['phases']['extract']['calls'] == 3  # the broken card fails in vobject
+        assert (stats['files'], stats['cards'], stats['errors']) == (2, 3, 1)
+        assert stats['errors_by_file'] == {str(library / 'b.vcf'): 1}
+        assert stats['bytes'] == sum(path.stat().st_size for path in library.iterdir())
+        seconds = [entry['seconds'] for entry in stats['slowest_files']]
+        assert seconds == sorted(seconds, reverse=True) and all(seconds)
+
+    def test_fast_parser(self, library):
+        """The fast path is timed on its own, vobject only for the card it cannot handle."""
+        stats = ContactList(str(library), is_dir=True, fast=True, profile=True).stats()
+        assert stats['phases']['fast_parse']['calls'] == 4
+        assert stats['phases']['vobject']['calls'] == 1
+
+    def test_parallel_load(self, library):
+        """Phases timed in worker processes are merged."""
+        stats = ContactList(str(library), is_dir=True, workers=2, profile=True).stats()
+        assert {'load', 'read', 'parse', 'vobject', 'extract', 'store'} <= stats['phases'].keys()
+        assert (stats['files'], stats['cards'], stats['errors']) == (2, 3, 1)
+
+    def test_uploads(self, library):
+        """Upload chunks are recorded under the upload name."""
+        contacts_lib = ContactList('', profile=True)
+        upload = io.BytesIO((library / 'a.vcf').read_bytes())
+        upload.name = 'a.vcf'
+        contacts_lib.load_uploads([upload])
+        stats = contacts_lib.stats()
+        assert stats['slowest_files'][0]['location'] == 'a.vcf'
+        assert stats['cards'] == 2
+
+    def test_views(self, library):
+        """Search, sorting, dedupe and export are timed as well."""
+        contacts_lib = ContactList(str(library), is_dir=True, profile=Profiler())
+        contacts_lib.query('jan')
+        contacts_lib.page(sort='full_name')
+        contacts_lib.find_duplicates()
+        contacts_lib.export_stream(io.BytesIO())
+        assert {'index', 'query', 'sort', 'dedupe', 'export'} <= contacts_lib.stats()['phases'].keys()
+
+
+class TestDump:
+    """Tests for the JSON and cProfile outputs."""
+
+    def test_json(self, library, tmp_path):
+        contacts_lib = ContactList(str(library), is_dir=True, profile=True)
+        contacts_lib.profiler.dump(tmp_path / 'profile.json')
+        assert json.loads((tmp_path / 'profile.json').read_text(encoding='utf-8'))['cards'] == 3
+
+    def test_pstats(self, library, tmp_path):
+        """With cprofile=True the phases run under cProfile."""
+        contacts_lib = ContactList(str(library), is_dir=True, profile=Profiler(cprofile=True))
+        contacts_lib.profiler.dump(tmp_path / 'profile.prof')
+        functions = {name for _, _, name in pstats.Stats(str(tmp_path / 'profile.prof')).stats}
+        assert 'parse_vcard' in functions
+        with pytest.raises(ValueError):
+            ContactList(str(library), is_dir=True, profile=True).profiler.dump(tmp_path / 'other.prof')
+
+    def test_command_line(self, library, tmp_path, capsys):
+        """main.py --profile writes the timings of a batch command."""
+        assert main(['dedupe', str(library), '--profile', str(tmp_path / 'profile.json')]) == 1  # the broken card
+        stats = json.loads((tmp_path / 'profile.json').read_text(encoding='utf-8'))
+        assert {'load', 'dedupe'} <= stats['phases'].keys()
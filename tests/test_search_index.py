@@ -0,0 +1,149 @@
+"""Unit tests for search_index.py - full-text and prefix search."""
+
+import time
+
+import pytest
+
+from benchmarks.bench_store import synthetic_contacts
+from Contact import ContactList
+from search_index import RECENT_LIMIT, SearchIndex, contact_tokens, query_terms
+
+
+@pytest.fixture
+def library():
+    """ContactList with a few hand-made contacts."""
+    contact_list = ContactList('')
+    for contact in [
+        {'full_name': 'Jan Novák', 'given_name': 'Jan', 'family_name': 'Novák', 'organization': 'Acme s.r.o.',
+         'emails': ['jan.novak@acme.cz'], 'phone_numbers': ['+420 777 123 456']},
+        {'full_name': 'Jana Nováková', 'given_name': 'Jana', 'family_name': 'Nováková',
+         'emails': ['jana@example.com'], 'phone_numbers': ['602 000 111']},
+        {'full_name': 'Janek Dvořák', 'organization': 'Novamedia', 'phone_numbers': '(202) 555-0143'},
+        {'full_name': 'Алексеева Вагда', 'emails': ['vagda@example.ru']},
+    ]:
+        contact_list.add(contact)
+    return contact_list
+
+
+class TestTokens:
+    """Tests for tokenizing contacts and queries."""
+
+    def test_contact_tokens(self):
+        """Names are transliterated, emails split, phones indexed with and without the country code."""
+        tokens = contact_tokens({'full_name': 'Jiří Dvořák', 'emails': ['J.Dvorak@Firma.CZ'],
+                                 'phone_numbers': ['+420 777 123 456']})
+        assert {'jiri', 'dvorak', 'j', 'firma', 'cz'} <= tokens
+        assert {'420777123456', '777123456', '123456', '456'} <= tokens
+
+    def test_query_terms(self):
+        """Phone-like queries stay one digit term, text is split into words."""
+        assert query_terms('+420 777-12') == ['42077712']
+        assert query_terms('00420 777') == ['420777']
+        assert query_terms(' Jiří  DVOŘÁK ') == ['jiri', 'dvorak']
+        assert query_terms('  ') == []
+
+
+class TestQuery:
+    """Tests for ContactList.query."""
+
+    def test_whole_word_ranks_first(self, library):
+        """An exact word should beat longer words with the same prefix."""
+        assert library.query('jan') == [1, 2, 3]
+        assert library.query('novak') == [1, 2]
+
+    def test_every_term_must_match(self, library):
+        """Terms are combined with AND, each one as a word prefix."""
+        assert library.query('jan nov') == [1, 2, 3]  # Janek works for Novamedia
+        assert library.query('jan novak') == [1, 2]
+        assert library.query('nova jane') == [3]
+        assert library.query('jan acme') == [1]
+        assert library.query('jan dvorak novak') == []
+
+    def test_fields(self, library):
+        """Organization, email parts, phone digits and non-latin names are searchable."""
+        assert library.query('acme') == [1]
+        assert library.query('example') == [2, 4]
+        assert library.query('алексеева') == [4]
+        assert library.query('alekseeva') == [4]
+        assert library.query('777 123') == [1]
+        assert library.query('+420 777 12') == [1]
+        assert library.query('00420777123456') == [1]
+        assert library.query('555-01') == [3]
+
+    def test_limit(self, library):
+        """No more ids than asked for."""
+        assert library.query('jan', limit=2) == [1, 2]
+        assert library.query('jan', limit=0) == []
+        assert library.query('') == []
+
+    def test_follows_add_update_remove(self, library):
+        """The index should follow changes made through ContactList."""
+        assert library.query('jan') == [1, 2, 3]
+        key = library.add({'full_name': 'Jan Zeman'})
+        assert library.query('zeman') == [key]
+        contact = library.dic[1]
+        contact['full_name'] = 'Petr Novák'
+        library.update(1, contact)
+        assert library.query('petr') == [1]
+        assert 1 in library.query('jan')  # given name is still Jan
+        library.remove(2)
+        assert library.query('jana') == []
+        assert library.query('jan') == [key, 1, 3]
+
+    def test_built_on_first_query(self, library):
+        """Loading does not pay for the index until it is used."""
+        assert library.search_index is None
+        library.query('jan')
+        assert len(library.search_index.tokens) == 4
+
+    def test_built_ahead(self, library):
+        """An index built apart (as by the Tkinter folder load) serves the queries once it is set."""
+        search_index = library.build_search_index()
+        assert library.search_index is None
+        library.search_index = search_index
+        assert library.query('jan') == [1, 2, 3]
+        assert library.search_index is search_index
+
+
+class TestSearchIndex:
+    """Tests for the index internals."""
+
+    def test_shared_and_single_postings(self):
+        """Tokens go from one id to a list and back as contacts come and go."""
+        index = SearchIndex()
+        index.add(1, {'full_name': 'Jan'})
+        assert index.postings['jan'] == 1
+        index.add(2, {'full_name': 'Jan'})
+        assert index.postings['jan'] == [1, 2]
+        index.remove(1)
+        assert index.postings['jan'] == 2
+        index.remove(2)
+        assert 'jan' not in index.postings
+        assert index.query('jan') == []
+
+    def test_bulk_and_incremental_tokens(self):
+        """A bulk load is sorted at once, later tokens go into the small sorted list."""
+        index = SearchIndex()
+        for key, contact in enumerate(synthetic_contacts(RECENT_LIMIT), start=1):
+            index.add(key, contact)
+        index.query('given1')
+        assert index.sorted and not index.recent
+        index.add(0, {'full_name': 'Xaver Unique'})
+        assert index.query('xav') == [0]
+        assert index.recent == ['unique', 'xaver']
+
+
+class TestQueryBenchmark:
+    """Query latency on a bigger library."""
+
+    @pytest.mark.benchmark
+    def test_queries_take_milliseconds(self):
+        """Typical queries on 50000 contacts should each take well under 50 ms."""
+        index = SearchIndex()
+        for key, contact in enumerate(synthetic_contacts(50000), start=1):
+            index.add(key, contact)
+        index.query('warm up')
+        for text in ['given12 family3', 'family1999', 'g', '+420 7', 'organization 5', 'example.com given5']:
+            start = time.perf_counter()
+            assert index.query(text, 10)
+            assert time.perf_counter() - start < 0.05, text
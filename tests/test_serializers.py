@@ -0,0 +1,173 @@
+"""Unit tests for serializers.py - vCard 3.0/4.0, jCard and xCard output."""
+
+import io
+import json
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+import vobject
+
+from benchmarks.bench_store import synthetic_contacts
+from Contact import ContactList, fast_parse_vcard, parse_vcard
+from main import main
+from serializers import SERIALIZERS, XML_NAMESPACE, Serializer, date_value, format_of, register, serializer_for
+from vcf_writer import serialize_vcard
+
+FIELDS = ('full_name', 'given_name', 'family_name', 'phone_numbers', 'emails', 'addresses', 'organization',
+          'job_title', 'birthday', 'notes')
+
+
+@pytest.fixture
+def contacts():
+    """Synthetic contacts with every field and some values that need escaping."""
+    contacts = list(synthetic_contacts(50))
+    contacts[0].update(notes='Line one\nline two; with <xml> & "quotes"', addresses=['Dlouhá 5, Praha'])
+    contacts[1].update(full_name='Вагда Алексеева', birthday='--0412', organization='Kůň, s.r.o.')
+    contacts[2].update(birthday='spring 1990')
+    return contacts
+
+
+def written(name: str, contacts, types: dict = None) -> str:
+    output = io.BytesIO()
+    assert serializer_for(name, types).write(contacts, output) == len(contacts)
+    return output.getvalue().decode('utf-8')
+
+
+class TestVCard:
+    """Tests for the vCard 3.0 and 4.0 serializers."""
+
+    def test_vcard3_roundtrip(self, contacts):
+        """Every field should be read back by vobject and the fast parser."""
+        assert written('vcard3', contacts) == ''.join(map(serialize_vcard, contacts))
+        for contact in contacts:
+            card = serialize_vcard(contact)
+            for parsed in (parse_vcard(vobject.readOne(card)), fast_parse_vcard(card)):
+                assert {field: parsed[field] for field in FIELDS} == {field: contact[field] for field in FIELDS}
+
+    def test_vcard4(self, contacts):
+        """vCard 4.0 lower-case types, basic format dates and VALUE=text for a birthday that is no date."""
+        cards = written('vcard4', contacts[:3]).split('END:VCARD\r\n')
+        assert all(card.startswith('BEGIN:VCARD\r\nVERSION:4.0\r\n') for card in cards[:3])
+        assert 'TEL;TYPE=cell:' in cards[0] and 'ADR;TYPE=home;LABEL="Dlouhá 5, Praha":;;;;;;\r\n' in cards[0]
+        assert 'NOTE:Line one\\nline two\\; with <xml> & "quotes"\r\n' in cards[0]
+        assert 'BDAY:--0412\r\n' in cards[1] and 'ORG:Kůň\\, s.r.o.\r\n' in cards[1]
+        assert 'BDAY;VALUE=text:spring 1990\r\n' in cards[2]
+        parsed = fast_parse_vcard(cards[1] + 'END:VCARD\r\n')
+        assert (parsed['full_name'], parsed['organization']) == ('Вагда Алексеева', 'Kůň, s.r.o.')
+
+    def test_vcard4_addresses(self):
+        """The address comes back from LABEL, with quotes, line breaks and carets escaped as in RFC 6868."""
+        contact = {'full_name': 'Jan', 'addresses': ['Dlouhá 5, Praha', 'U "Zvonu" 1\nBrno ^2']}
+        card = written('vcard4', [contact])
+        assert 'LABEL="U ^\'Zvonu^\' 1^nBrno ^^2":;;;;;;' in card
+        for parsed in (parse_vcard(vobject.readOne(card)), fast_parse_vcard(card)):
+            assert parsed['addresses'] == contact['addresses']
+
+    def test_types(self, contacts):
+        """Types can be changed or left out, parse_vcard does not keep them."""
+        card = written('vcard3', contacts[:1], {'TEL': 'work', 'EMAIL': None})
+        assert 'TEL;TYPE=WORK:' in card and 'EMAIL:' in card and 'ADR;TYPE=HOME:' in card
+
+
+class TestJCard:
+    """Tests for the jCard JSON lines serializer."""
+
+    def test_json_lines(self, contacts):
+        lines = written('jcard', contacts).splitlines()
+        assert len(lines) == len(contacts)
+        documents = [json.loads(line) for line in lines]
+        assert all(document[0] == 'vcard' and document[1][0] == ['version', {}, 'text', '4.0']
+                   for document in documents)
+        first = {name: (parameters, kind, value) for name, parameters, kind, value in documents[0][1]}
+        assert first['note'] == ({}, 'text', contacts[0]['notes'])
+        assert first['adr'] == ({'type': 'home', 'label': 'Dlouhá 5, Praha'}, 'text', ['', '', '', '', '', '', ''])
+        assert first['n'] == ({}, 'text', [contacts[0]['family_name'], contacts[0]['given_name'], '', '', ''])
+        second = {name: (kind, value) for name, _, kind, value in documents[1][1]}
+        assert second['bday'] == ('date', '--04-12') and second['fn'] == ('text', 'Вагда Алексеева')
+        assert ['bday', {}, 'text', 'spring 1990'] in documents[2][1]
+
+    def test_control_characters(self):
+        line = written('jcard', [{'full_name': 'Tab\there\x01 "quoted" \\'}])
+        assert ['fn', {}, 'text', 'Tab\there\x01 "quoted" \\'] in json.loads(line)[1]
+
+
+class TestXCard:
+    """Tests for the xCard serializer."""
+
+    def test_document(self, contacts):
+        """One well-formed document, escaped text, structured N and ADR, typed dates."""
+        root = ElementTree.fromstring(written('xcard', contacts).encode('utf-8'))
+        ns = {'v': XML_NAMESPACE}
+        cards = root.findall('v:vcard', ns)
+        assert len(cards) == len(contacts)
+        assert cards[0].find('v:note/v:text', ns).text == contacts[0]['notes']
+        assert cards[0].find('v:adr/v:parameters/v:label/v:text', ns).text == 'Dlouhá 5, Praha'
+        assert [part.text for part in cards[0].find('v:adr', ns)[1:]] == [None] * 7
+        assert cards[0].find('v:adr/v:parameters/v:type/v:text', ns).text == 'home'
+        assert cards[0].find('v:n/v:surname', ns).text == contacts[0]['family_name']
+        assert cards[1].find('v:bday/v:date', ns).text == '--0412'
+        assert cards[2].find('v:bday/v:text', ns).text == 'spring 1990'
+
+    def test_invalid_characters(self):
+        """Characters XML 1.0 does not allow are replaced."""
+        root = ElementTree.fromstring(written('xcard', [{'full_name': 'A\x00B\x1fC'}]).encode('utf-8'))
+        assert root.find(f'{{{XML_NAMESPACE}}}vcard/{{{XML_NAMESPACE}}}fn/{{{XML_NAMESPACE}}}text').text == 'A�B�C'
+
+
+class TestRegistry:
+    """Tests for looking formats up and plugging new ones in."""
+
+    def test_lookup(self):
+        assert set(SERIALIZERS) >= {'vcard3', 'vcard4', 'jcard', 'xcard'}
+        assert (format_of('out.xml'), format_of('OUT.VCF'), format_of('out.txt', 'jcard')) == ('xcard', 'vcard3', 'jcard')
+        with pytest.raises(ValueError):
+            serializer_for('csv')
+
+    def test_register(self, monkeypatch):
+        """A Serializer subclass registered under a new name is used by ContactList.export_stream."""
+        monkeypatch.setattr('serializers.SERIALIZERS', dict(SERIALIZERS))
+
+        @register
+        class Names(Serializer):
+            name = 'names'
+            suffixes = ('.names',)
+            __slots__ = ()
+
+            def card(self, contact):
+                return f"{contact['full_name']}\n"
+
+        contacts_lib = ContactList('')
+        contacts_lib.add({'full_name': 'Jan'})
+        output = io.BytesIO()
+        assert contacts_lib.export_stream(output, 'names') == 1
+        assert output.getvalue() == b'Jan\n' and format_of('x.names') == 'names'
+
+    def test_card_required(self):
+        """A format without card() can not be instantiated."""
+        class Empty(Serializer):
+            name = 'empty'
+            __slots__ = ()
+
+        with pytest.raises(TypeError):
+            Empty()
+
+    def test_date_value(self):
+        assert date_value('1990-01-02') == ('date', '19900102')
+        assert date_value('19900102', extended=True) == ('date', '1990-01-02')
+        assert date_value('--0412', extended=True) == ('date', '--04-12')
+        assert date_value('1990-01-02T10:00:00Z') == ('date-time', '19900102T10:00:00Z')
+        assert date_value('unknown') == ('text', 'unknown')
+
+
+class TestCommandLine:
+    """main.py convert into the new formats."""
+
+    def test_convert(self, tmp_path, capsys):
+        source = tmp_path / 'in.vcf'
+        source.write_text(''.join(map(serialize_vcard, synthetic_contacts(20))), encoding='utf-8')
+        assert main(['convert', str(source), '-o', str(tmp_path / 'out.xml')]) == 0
+        assert len(ElementTree.parse(tmp_path / 'out.xml').getroot()) == 20
+        assert main(['convert', str(source), '--to', 'jcard', '-o', str(tmp_path / 'out.jcard')]) == 0
+        assert len((tmp_path / 'out.jcard').read_text(encoding='utf-8').splitlines()) == 20
+        assert main(['convert', str(source), '--to', 'vcard4', '-o', str(tmp_path / 'out4.vcf')]) == 0
+        assert (tmp_path / 'out4.vcf').read_text(encoding='utf-8').count('VERSION:4.0') == 20
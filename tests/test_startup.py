@@ -0,0 +1,33 @@
+"""Start-up tests - heavy modules stay unimported until a feature needs them."""
+
+import pytest
+
+from benchmarks.bench_startup import HEAVY_MODULES, STATEMENTS, import_times, measure
+
+BUDGET_MS = {'import_contact': 100, 'main_help': 75}  # about 2.5x the measured time, vobject alone adds 20+ ms
+
+
+class TestLazyImports:
+    """Tests of what a fresh interpreter imports."""
+
+    @pytest.mark.parametrize('name', list(STATEMENTS))
+    def test_no_heavy_modules(self, name):
+        """Neither import Contact nor main.py --help pulls in vobject, process pools, GUI toolkits and the like."""
+        times, _ = import_times(STATEMENTS[name])
+        assert [module for module in HEAVY_MODULES if module in times] == []
+
+    def test_loaded_on_use(self):
+        """The deferred modules are still there when a feature asks for them."""
+        times, _ = import_times("import Contact; Contact.create_vcard({'full_name': 'Jan'}); "
+                                "Contact.ContactList('').find_duplicates()")
+        assert {'vobject', 'dedupe', 'unidecode'} <= times.keys()
+
+
+class TestStartupBenchmark:
+    """Start-up time against the regression budget."""
+
+    @pytest.mark.benchmark
+    def test_within_budget(self):
+        """Best of three runs should stay within the budget."""
+        for name, timing in measure(runs=3).items():
+            assert timing['milliseconds'] < BUDGET_MS[name], (name, timing)
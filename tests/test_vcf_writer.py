@@ -0,0 +1,260 @@
+"""Unit tests for vcf_writer.py - bulk vCard export without vobject."""
+
+import gzip
+import io
+import random
+
+import pytest
+import vobject
+
+from benchmarks.bench_export import measure
+from benchmarks.bench_qp import measure as measure_qp
+from benchmarks.bench_store import synthetic_contacts
+from Contact import ContactList, create_vcard, fast_parse_vcard, parse_vcard, quoted_printable
+from vcf_writer import (
+    external_sort,
+    file_names,
+    fold,
+    serialize_qp_vcard,
+    serialize_vcard,
+    write_qp_vcards,
+    write_vcard_files,
+    write_vcards,
+)
+
+TRICKY = ['a,b;c\\d', 'line\nbreak', 'Žluťoučký kůň ' * 8, 'x' * 74, 'x' * 75, 'é' * 40, 'Алексеева', '']
+
+
+def random_contact(rnd):
+    """Contact with values create_vcard serializes (no addresses)."""
+    pick = lambda: rnd.choice(TRICKY + ['Jan', 'Novák', '+420 777 123 456', 'a@b.c'])
+    contact = {
+        'full_name': pick() or 'Name', 'given_name': rnd.choice([pick(), None]), 'family_name': pick(),
+        'phone_numbers': [pick() for _ in range(rnd.randint(0, 2))],
+        'emails': [pick() for _ in range(rnd.randint(0, 2))], 'addresses': [],
+    }
+    if contact['given_name'] is None:
+        del contact['given_name']  # create_vcard fails on None parts
+    return contact
+
+
+class TestSerialize:
+    """Tests for serialize_vcard."""
+
+    def test_same_as_vobject(self):
+        """Output should match create_vcard(...).serialize() byte for byte."""
+        rnd = random.Random(7)
+        for _ in range(500):
+            contact = random_contact(rnd)
+            assert serialize_vcard(contact) == create_vcard(contact).serialize()
+
+    def test_fold(self):
+        """Lines are folded at 75 octets and never inside a utf-8 sequence."""
+        folded = fold('FN:' + 'é' * 80)
+        pieces = folded[:-2].split('\r\n ')
+        assert len(pieces) == 3
+        assert all(len(piece.encode('utf-8')) <= 75 - (number > 0) for number, piece in enumerate(pieces))
+        assert ''.join(pieces) == 'FN:' + 'é' * 80
+
+    def test_roundtrip(self):
+        """Parsing the written cards should give the contacts back, addresses included."""
+        for contact in synthetic_contacts(200):
+            contact['addresses'].append('Dlouhá 5\\, zadní trakt, Praha; 1')
+            parsed = parse_vcard(vobject.readOne(serialize_vcard(contact)))
+            for field in ('full_name', 'given_name', 'family_name', 'phone_numbers', 'emails', 'addresses'):
+                assert parsed[field] == contact[field]
+
+    def test_missing_fn(self):
+        """A contact without FN gets one from its name parts instead of failing the export."""
+        card = serialize_vcard({'given_name': 'Jan', 'family_name': None, 'phone_numbers': '555'})
+        assert 'FN:Jan\r\n' in card
+        assert 'N:;Jan;;;\r\n' in card
+        assert 'TEL;TYPE=CELL:555\r\n' in card
+
+
+class TestBulkWriters:
+    """Tests for the stream and the file-per-contact writers."""
+
+    def test_stream_in_chunks(self):
+        """The stream should receive the concatenated cards in few writes."""
+        contacts = list(synthetic_contacts(300))
+        writes = []
+
+        class Recorder(io.BytesIO):
+            def write(self, data):
+                writes.append(len(data))
+                return super().write(data)
+
+        stream = Recorder()
+        assert write_vcards(contacts, stream, buffer_size=4096) == 300
+        assert stream.getvalue() == ''.join(map(serialize_vcard, contacts)).encode('utf-8')
+        assert len(writes) < 300 / 5
+        assert all(size >= 4096 for size in writes[:-1])
+
+    def test_file_names(self):
+        """Equal names are numbered, path separators are replaced."""
+        contacts = [{'full_name': 'Jan'}, {'full_name': 'jan'}, {'full_name': 'A/B'}, {'full_name': None}]
+        assert [name for name, _ in file_names(contacts)] == ['Jan.vcf', 'jan (2).vcf', 'A_B.vcf', 'contact.vcf']
+
+    @pytest.mark.parametrize('workers', [1, 4])
+    def test_files(self, tmp_path, workers):
+        """Every contact should land in its own file with its card."""
+        contacts = list(synthetic_contacts(600))
+        assert write_vcard_files(contacts, tmp_path, workers) == (600, [])
+        files = {path.name: path.read_bytes() for path in tmp_path.iterdir()}
+        assert len(files) == 600
+        for name, contact in file_names(contacts):
+            assert files[name] == serialize_vcard(contact).encode('utf-8')
+
+    def test_existing_files(self, tmp_path, capsys):
+        """Files already in the directory are kept and reported, replaced only with overwrite, nothing is printed."""
+        (tmp_path / 'Jan.vcf').write_bytes(b'mine')
+        contacts = [{'full_name': 'Jan'}, {'full_name': 'Eva'}]
+        assert write_vcard_files(contacts, tmp_path, 1) == (
+            1, [f'Error writing {tmp_path / "Jan.vcf"}: file exists, not overwritten'])
+        assert (tmp_path / 'Jan.vcf').read_bytes() == b'mine' and (tmp_path / 'Eva.vcf').exists()
+        assert write_vcard_files(contacts, tmp_path, 1, overwrite=True) == (
+            2, [f' overwrite {tmp_path / "Jan.vcf"}', f' overwrite {tmp_path / "Eva.vcf"}'])
+        assert (tmp_path / 'Jan.vcf').read_bytes() == serialize_vcard(contacts[0]).encode('utf-8')
+        assert capsys.readouterr().out == ''
+
+    def test_contact_list(self, tmp_path):
+        """ContactList.export writes files, export_stream one concatenated file that loads back."""
+        source = tmp_path / 'source.vcf'
+        write_vcards(synthetic_contacts(50), source)
+        contact_list = ContactList(str(source))
+        (tmp_path / 'out').mkdir()
+        assert contact_list.export(str(tmp_path / 'out')) == (50, [])
+        assert len(list((tmp_path / 'out').glob('*.vcf'))) == 50
+        assert contact_list.export_stream(tmp_path / 'all.vcf') == 50
+        assert list(ContactList(str(tmp_path / 'all.vcf')).dic.values()) == list(contact_list.dic.values())
+
+
+@pytest.fixture
+def library(tmp_path):
+    """ContactList loaded from three files with unsorted family names."""
+    folder = tmp_path / 'library'
+    folder.mkdir()
+    names = [('b.vcf', ['Žák Adam', 'Novák Jan']), ('a.vcf', ['Adámek Petr', 'Zeman Eva']), ('c.vcf', ['Černý Ivo'])]
+    for file_name, people in names:
+        write_vcards([{'full_name': f'{given} {family}', 'given_name': given, 'family_name': family}
+                      for family, given in map(str.split, people)], folder / file_name)
+    return ContactList(str(folder), is_dir=True)
+
+
+class TestQuotedPrintable:
+    """Tests for the vCard 2.1 quoted-printable writer."""
+
+    def test_same_contact_as_vcard_30(self):
+        """vobject and the fast parser should read the same contact as from the vCard 3.0 card."""
+        rnd = random.Random(11)
+        for _ in range(500):
+            contact = random_contact(rnd)
+            contact['addresses'] = [rnd.choice(TRICKY)] if rnd.random() < 0.5 else []
+            card = serialize_qp_vcard(contact)
+            expected = parse_vcard(vobject.readOne(serialize_vcard(contact)))
+            assert parse_vcard(vobject.readOne(card, allowQP=True)) == expected
+            assert fast_parse_vcard(card) == expected
+
+    def test_lines(self):
+        """Only values that need it are encoded, every line is ASCII and at most 76 columns long."""
+        card = serialize_qp_vcard({'full_name': 'Žluťoučký kůň ' * 8, 'given_name': 'Jan', 'family_name': 'Novák',
+                                   'phone_numbers': ['+420 777 123 456'], 'emails': ['jan@example.com']})
+        lines = card.split('\r\n')
+        assert card.isascii() and max(map(len, lines)) <= 76
+        assert lines[:2] == ['BEGIN:VCARD', 'VERSION:2.1'] and lines[-2:] == ['END:VCARD', '']
+        assert 'N;ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8:Nov=C3=A1k;Jan;;;' in lines
+        assert 'TEL;TYPE=CELL:+420 777 123 456' in lines
+        assert 'EMAIL;TYPE=HOME:jan@example.com' in lines
+        assert sum(line.endswith('=') for line in lines) > 1  # soft line breaks of FN
+
+    def test_quoted_printable(self):
+        """quoted_printable takes a vobject card or a dictionary."""
+        contact = {'full_name': 'Jiří Dvořák', 'given_name': 'Jiří', 'family_name': 'Dvořák', 'emails': ['a@b.c']}
+        assert quoted_printable(create_vcard(contact)) == quoted_printable(contact)
+        assert quoted_printable(contact) == serialize_qp_vcard(contact).encode('ascii')
+
+    def test_reused_buffer(self):
+        """Cards are written whenever the buffer is full, a card bigger than the buffer on its own."""
+        contacts = list(synthetic_contacts(50)) + [{'full_name': 'Žluťoučký kůň ' * 40}]
+        expected = b''.join(serialize_qp_vcard(contact).encode('ascii') for contact in contacts)
+        buffer = bytearray(300)
+        for _ in range(2):
+            output = io.BytesIO()
+            assert write_qp_vcards(contacts, output, buffer) == 51
+            assert output.getvalue() == expected
+        assert len(buffer) == 300
+
+
+class TestMerge:
+    """Tests for ContactList.merge and the external sort behind it."""
+
+    def test_external_sort(self):
+        """Spilled runs should merge into the same order as an in-memory sort."""
+        rnd = random.Random(3)
+        records = [(f'{rnd.random():.6f}', bytes([rnd.randrange(256)]) * rnd.randint(0, 5)) for _ in range(1000)]
+        assert list(external_sort(iter(records), run_size=37)) == sorted(records)
+        assert list(external_sort(iter(records), run_size=5000)) == sorted(records)
+        assert list(external_sort([], run_size=2)) == []
+
+    def test_merge_library_order(self, library, tmp_path):
+        """Without an order the file should equal the single stream export."""
+        assert library.merge(tmp_path / 'merged.vcf') == 5
+        stream = io.BytesIO()
+        library.export_stream(stream)
+        assert (tmp_path / 'merged.vcf').read_bytes() == stream.getvalue()
+
+    @pytest.mark.parametrize('run_size', [2, 100])
+    def test_merge_by_family_name(self, library, tmp_path, run_size):
+        """Family names are sorted transliterated and case-insensitively, also across spilled runs."""
+        library.merge(tmp_path / 'merged.vcf', order='family_name', run_size=run_size)
+        merged = ContactList(str(tmp_path / 'merged.vcf'))
+        assert [c['family_name'] for c in merged.dic.values()] == ['Adámek', 'Černý', 'Novák', 'Žák', 'Zeman']
+
+    def test_merge_by_source(self, library, tmp_path):
+        """Contacts come grouped by source file in path order, added contacts last."""
+        library.add({'full_name': 'Added Later'})
+        library.merge(tmp_path / 'merged.vcf', order='source')
+        merged = ContactList(str(tmp_path / 'merged.vcf'))
+        assert [c['full_name'] for c in merged.dic.values()] == [
+            'Petr Adámek', 'Eva Zeman', 'Adam Žák', 'Jan Novák', 'Ivo Černý', 'Added Later']
+
+    def test_merge_gzip(self, library, tmp_path):
+        """A .gz target is written gzip compressed."""
+        library.merge(tmp_path / 'merged.vcf.gz')
+        plain = tmp_path / 'plain.vcf'
+        library.merge(plain)
+        assert gzip.decompress((tmp_path / 'merged.vcf.gz').read_bytes()) == plain.read_bytes()
+
+    def test_merge_zstd(self, library, tmp_path):
+        """A .zst target is written zstd compressed when zstandard is installed."""
+        zstandard = pytest.importorskip('zstandard')
+        library.merge(tmp_path / 'merged.vcf.zst')
+        plain = tmp_path / 'plain.vcf'
+        library.merge(plain)
+        with zstandard.ZstdDecompressor().stream_reader(open(tmp_path / 'merged.vcf.zst', 'rb')) as reader:
+            assert reader.read() == plain.read_bytes()
+
+    def test_merge_errors(self, library, tmp_path):
+        """Unknown orders and compressions are refused."""
+        with pytest.raises(ValueError):
+            library.merge(tmp_path / 'merged.vcf', order='phone')
+        with pytest.raises(ValueError):
+            library.merge(tmp_path / 'merged.vcf', compression='rar')
+
+
+class TestExportBenchmark:
+    """Speed of the writer compared with vobject."""
+
+    @pytest.mark.benchmark
+    def test_faster_than_vobject(self):
+        """Serializing from dictionaries should be at least 10x faster than through vobject."""
+        result = measure(5000, vobject_sample=1000)
+        assert result['serialize_per_second'] > 10 * result['vobject_per_second']
+
+    @pytest.mark.benchmark
+    def test_qp_faster_than_legacy(self):
+        """Encoding property by property should beat encoding and patching the whole serialized card."""
+        result = measure_qp(1000, rounds=1)
+        assert result['quoted_printable_per_second'] > 2 * result['legacy_per_second']
+        assert result['bulk_per_second'] > result['quoted_printable_per_second']
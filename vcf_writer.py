@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""Bulk vCard export straight from parse_vcard dictionaries, without building vobject objects.
+
+serialize_vcard() writes the same vCard 3.0 text as create_vcard(contact).serialize()
+(properties sorted by name, backslash escaping, lines folded at 75 octets) and adds
+the addresses, organization, title, birthday and notes create_vcard leaves out. serialize_qp_vcard() writes the same
+properties as a vCard 2.1 card for phones, values that are not printable ASCII
+quoted-printable encoded.
+"""
+
+import gzip
+import heapq
+import os
+import struct
+from binascii import b2a_qp
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryFile
+
+LINE_LENGTH = 75  # folding limit in octets, as vobject
+BUFFER_SIZE = 1024 * 1024  # bytes collected before a write to the output stream
+FILES_PER_TASK = 256  # files written by one thread pool task
+UNSAFE_FILE_CHARS = str.maketrans({'/': '_', '\\': '_', '\0': '_'})
+RUN_SIZE = 100000  # cards sorted in memory at once by external_sort
+RECORD = struct.Struct('>II')  # key and card length of a record in a sorted run
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+QP_PARAMS = ';ENCODING=QUOTED-PRINTABLE;CHARSET=UTF-8'  # b2a_qp breaks lines at 76 columns
+
+
+def escape(value) -> str:
+    """Backslash escape a text value (vobject backslashEscape)."""
+    value = str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+    return value.replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+
+
+def fold(line: str) -> str:
+    """Fold a content line into 75 octet pieces without splitting a utf-8 sequence (vobject foldOneLine)."""
+    if len(line) < LINE_LENGTH:
+        return line + '\r\n'
+    pieces, start, counter = [], 0, 0
+    for position, char in enumerate(line):
+        size = 1 if char < '\x80' else len(char.encode('utf-8', 'surrogatepass'))
+        if counter + size > LINE_LENGTH:
+            pieces.append(line[start:position])
+            start, counter = position, 1  # one for the leading space
+        counter += size
+    pieces.append(line[start:])
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def as_list(values) -> list:
+    """Multi-valued field as a list (a single value may be stored as a plain string)."""
+    if not values:
+        return []
+    return [values] if isinstance(values, str) else list(values)
+
+
+def display_name(contact: dict) -> str:
+    """FN of a contact, built from the name parts when it has none."""
+    if contact.get('full_name'):
+        return str(contact['full_name'])
+    return ' '.join(filter(None, [contact.get('given_name'), contact.get('family_name')]))
+
+
+def fields(contact: dict):
+    """Yield (name, type, value) of the properties of a contact, sorted by name as vobject does.
+    Values are not escaped, the structured ADR and N values are lists of their parts.
+    """
+    for address in as_list(contact.get('addresses')):
+        yield 'ADR', 'HOME', ['', '', str(address), '', '', '', '']  # parse_vcard keeps the joined form only
+    if contact.get('birthday'):
+        yield 'BDAY', None, str(contact['birthday'])
+    for email in as_list(contact.get('emails')):
+        yield 'EMAIL', 'HOME', str(email)
+    yield 'FN', None, display_name(contact)
+    if contact.get('given_name') or contact.get('family_name'):
+        yield 'N', None, [str(contact.get('family_name') or ''), str(contact.get('given_name') or ''), '', '', '']
+    if contact.get('notes'):
+        yield 'NOTE', None, str(contact['notes'])
+    if contact.get('organization'):
+        yield 'ORG', None, str(contact['organization'])
+    for phone in as_list(contact.get('phone_numbers')):
+        yield 'TEL', 'CELL', str(phone)
+    if contact.get('job_title'):
+        yield 'TITLE', None, str(contact['job_title'])
+
+
+def text_value(value) -> str:
+    """Escaped text of a field value, the parts of a structured one joined by ';'."""
+    return escape(value) if isinstance(value, str) else ';'.join(map(escape, value))
+
+
+def properties(contact: dict):
+    """Yield (name with parameters, escaped value) of the properties of a contact."""
+    for name, kind, value in fields(contact):
+        yield f'{name};TYPE={kind}' if kind else name, text_value(value)
+
+
+def serialize_vcard(contact: dict) -> str:
+    """vCard 3.0 text of a parse_vcard dictionary, the properties of fields() written out inline for speed."""
+    lines = ['BEGIN:VCARD\r\n', 'VERSION:3.0\r\n']
+    for address in as_list(contact.get('addresses')):
+        lines.append(fold(f'ADR;TYPE=HOME:;;{escape(address)};;;;'))
+    if contact.get('birthday'):
+        lines.append(fold(f"BDAY:{escape(contact['birthday'])}"))
+    for email in as_list(contact.get('emails')):
+        lines.append(fold(f'EMAIL;TYPE=HOME:{escape(email)}'))
+    lines.append(fold(f'FN:{escape(display_name(contact))}'))
+    if contact.get('given_name') or contact.get('family_name'):
+        family, given = escape(contact.get('family_name') or ''), escape(contact.get('given_name') or '')
+        lines.append(fold(f'N:{family};{given};;;'))
+    if contact.get('notes'):
+        lines.append(fold(f"NOTE:{escape(contact['notes'])}"))
+    if contact.get('organization'):
+        lines.append(fold(f"ORG:{escape(contact['organization'])}"))
+    for phone in as_list(contact.get('phone_numbers')):
+        lines.append(fold(f'TEL;TYPE=CELL:{escape(phone)}'))
+    if contact.get('job_title'):
+        lines.append(fold(f"TITLE:{escape(contact['job_title'])}"))
+    lines.append('END:VCARD\r\n')
+    return ''.join(lines)
+
+
+def qp_line(name: str, value: str) -> str:
+    """Content line of an escaped value, quoted-printable encoded with soft line breaks when not printable ASCII.
+    b2a_qp counts columns from the start of its input, so the name is stood in for by as many 'x'.
+    """
+    if value.isascii() and value.isprintable():
+        return fold(f'{name}:{value}')
+    prefix = f'{name}{QP_PARAMS}:'
+    encoded = b2a_qp(b'x' * len(prefix) + value.encode('utf-8', 'surrogatepass')).decode('ascii')
+    return prefix + encoded[len(prefix):].replace('=\n', '=\r\n') + '\r\n'
+
+
+def serialize_qp_vcard(contact: dict) -> str:
+    """vCard 2.1 text of a parse_vcard dictionary, plain ASCII whatever the values."""
+    lines = ['BEGIN:VCARD\r\n', 'VERSION:2.1\r\n']
+    lines += [qp_line(name, value) for name, value in properties(contact)]
+    lines.append('END:VCARD\r\n')
+    return ''.join(lines)
+
+
+def write_vcards(contacts, output, buffer_size: int = BUFFER_SIZE) -> int:
+    """Write contacts one after another into a single stream (binary file object or path).
+    Cards are collected into buffer_size chunks, so the stream sees few large writes. Returns the card count.
+    """
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, mode='wb') as stream:
+            return write_vcards(contacts, stream, buffer_size)
+    return write_chunked((serialize_vcard(contact).encode('utf-8', 'surrogatepass') for contact in contacts),
+                         output, buffer_size)
+
+
+def write_chunked(cards, output, buffer_size: int = BUFFER_SIZE) -> int:
+    """Write encoded cards into output joined into buffer_size chunks, returns the card count."""
+    count, chunk, size = 0, [], 0
+    for data in cards:
+        chunk.append(data)
+        size += len(data)
+        count += 1
+        if size >= buffer_size:
+            output.write(b''.join(chunk))
+            chunk, size = [], 0
+    if chunk:
+        output.write(b''.join(chunk))
+    return count
+
+
+def write_qp_vcards(contacts, output, buffer: bytearray = None) -> int:
+    """Write contacts as quoted-printable vCard 2.1 cards into a single stream (binary file object or path).
+    Cards are copied into buffer (a new one of BUFFER_SIZE bytes when not given, pass one to reuse it across
+    calls) and written whenever it is full. Returns the card count.
+    """
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, mode='wb') as stream:
+            return write_qp_vcards(contacts, stream, buffer)
+    if buffer is None:
+        buffer = bytearray(BUFFER_SIZE)
+    count, used = 0, 0
+    with memoryview(buffer) as view:
+        for contact in contacts:
+            card = serialize_qp_vcard(contact).encode('ascii')
+            count += 1
+            if used + len(card) > len(view):
+                if used:
+                    output.write(view[:used])
+                    used = 0
+                if len(card) > len(view):
+                    output.write(card)
+                    continue
+            view[used:used + len(card)] = card
+            used += len(card)
+        if used:
+            output.write(view[:used])
+    return count
+
+
+def file_names(contacts):
+    """Yield (file name, contact), names taken from FN and numbered when already used in this export."""
+    used = set()
+    for contact in contacts:
+        name = display_name(contact).translate(UNSAFE_FILE_CHARS) or 'contact'
+        file_name, number = f'{name}.vcf', 1
+        while file_name.casefold() in used:  # case-insensitive filesystems would overwrite too
+            number += 1
+            file_name = f'{name} ({number}).vcf'
+        used.add(file_name.casefold())
+        yield file_name, contact
+
+
+def write_files(files: list, overwrite: bool = False) -> tuple:
+    """Write [(path, data)], returns (files written, messages). An existing file is replaced (and reported)
+    only with overwrite, else it is left alone and reported as an error.
+    """
+    written, messages = 0, []
+    for path, data in files:
+        try:
+            if overwrite and path.exists():
+                messages.append(f' overwrite {path}')
+            with open(path, mode='wb' if overwrite else 'xb') as vcf_file:
+                vcf_file.write(data)
+            written += 1
+        except FileExistsError:
+            messages.append(f'Error writing {path}: file exists, not overwritten')
+        except OSError as e:
+            messages.append(f'Error writing {path}: {e}')
+    return written, messages
+
+
+def write_vcard_files(contacts, directory, workers: int = 8, overwrite: bool = False) -> tuple:
+    """Write every contact into its own file in directory, filesystem calls run on a thread pool.
+    Cards are serialized here and handed to the pool in groups of FILES_PER_TASK. Files already in directory
+    are kept unless overwrite is set, either way they are reported. Returns (files written, messages) as write_files.
+    """
+    directory = Path(directory)
+    count, messages, group, pending = 0, [], [], []
+
+    def collect(future):
+        nonlocal count
+        written, group_messages = future.result()
+        count += written
+        messages.extend(group_messages)
+
+    with ThreadPoolExecutor(workers) as pool:
+        for file_name, contact in file_names(contacts):
+            group.append((directory / file_name, serialize_vcard(contact).encode('utf-8', 'surrogatepass')))
+            if len(group) == FILES_PER_TASK:
+                pending.append(pool.submit(write_files, group, overwrite))
+                group = []
+                if len(pending) > workers * 2:  # bounds the serialized data waiting for the disk
+                    collect(pending.pop(0))
+        if group:
+            pending.append(pool.submit(write_files, group, overwrite))
+        for future in pending:
+            collect(future)
+    return count, messages
+
+
+def open_output(path, compression: str = None):
+    """Binary file for writing, compressed by gzip or zstd (zstandard package) when asked or by its suffix."""
+    compression = compression or COMPRESSIONS.get(Path(path).suffix.lower())
+    if compression == 'gzip':
+        return gzip.open(path, mode='wb', compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('... zstd output needs the zstandard package (pip install zstandard)') from None
+        return zstandard.ZstdCompressor().stream_writer(open(path, mode='wb'), closefd=True)
+    if compression:
+        raise ValueError(f'unknown compression {compression!r}, use gzip or zstd')
+    return open(path, mode='wb')
+
+
+def spill(run: list):
+    """Write a sorted run of (key, data) into a temporary file, returned rewound."""
+    run_file = TemporaryFile()
+    for key, data in run:
+        key = key.encode('utf-8', 'surrogatepass')
+        run_file.write(RECORD.pack(len(key), len(data)))
+        run_file.write(key)
+        run_file.write(data)
+    run_file.seek(0)
+    return run_file
+
+
+def read_run(run_file):
+    """Yield the (key, data) records of a spilled run."""
+    while header := run_file.read(RECORD.size):
+        key_size, data_size = RECORD.unpack(header)
+        yield run_file.read(key_size).decode('utf-8', 'surrogatepass'), run_file.read(data_size)
+
+
+def external_sort(records, run_size: int = RUN_SIZE):
+    """Yield (key, data) records ordered by key with at most run_size of them in memory.
+    Sorted runs are spilled into temporary files and merged lazily.
+    """
+    runs, run = [], []
+    try:
+        for record in records:
+            run.append(record)
+            if len(run) >= run_size:
+                run.sort()
+                runs.append(spill(run))
+                run = []
+        run.sort()
+        if not runs:
+            yield from run
+            return
+        runs.append(spill(run))
+        del run
+        yield from heapq.merge(*map(read_run, runs))
+    finally:
+        for run_file in runs:
+            run_file.close()
+
+
+def write_sorted_vcards(keyed_contacts, output, run_size: int = RUN_SIZE, buffer_size: int = BUFFER_SIZE) -> int:
+    """Write (sort key, contact) pairs into one stream ordered by the key, see external_sort. Returns the card count."""
+    cards = ((key, serialize_vcard(contact).encode('utf-8', 'surrogatepass')) for key, contact in keyed_contacts)
+    return write_chunked((data for _, data in external_sort(cards, run_size)), output, buffer_size)